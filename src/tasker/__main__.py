@@ -1,19 +1,57 @@
 # %%
-import click
+import sys
+import time
+from functools import cache
 
-from tasker.commands.task_cli import TaskCLI, clean_name
-from tasker.countdown import countdown_cli
+from tasker.daemon import forward
 
+# when the process started importing tasker, reported by the first --profile
+_started = time.perf_counter()
 
-@click.group()
-def main():
-    """A simple CLI for countdowns."""
-    pass
 
+@cache
+def cli():
+    """The click command tree, only built when a command runs in this process."""
+    import click
 
-main.add_command(countdown_cli, name="countdown")
-for command in TaskCLI().commands:
-    main.add_command(getattr(TaskCLI, command), name=clean_name(command))
+    from tasker.commands.daemon_cli import serve_cli
+    from tasker.commands.task_cli import TaskCLI, clean_name
+    from tasker.countdown import countdown_cli
+    from tasker.utils.profiling import Profiler
+
+    @click.group()
+    @click.option("--profile", is_flag=True, help="Print the time taken by each phase on exit.")
+    # options taking a value are listed in tasker.daemon.ROOT_VALUE_OPTIONS
+    @click.option(
+        "--profile-output",
+        type=click.Path(dir_okay=False),
+        default=None,
+        help="Also write cProfile stats to this file, implies --profile.",
+    )
+    @click.pass_context
+    def tasker(ctx, profile, profile_output):
+        """A simple CLI for countdowns."""
+        global _started
+        if profile or profile_output:
+            # the start up is only part of the first command run by a process
+            since, _started = _started, None
+            profiler = Profiler(profile_output, since=since).start()
+            ctx.call_on_close(profiler.stop)
+
+    tasker.add_command(countdown_cli, name="countdown")
+    tasker.add_command(serve_cli, name="serve")
+    for command in TaskCLI().commands:
+        tasker.add_command(getattr(TaskCLI, command), name=clean_name(command))
+    return tasker
+
+
+def main(args=None):
+    """Run tasker, on the daemon when one is serving the store, see `tasker serve`."""
+    args = sys.argv[1:] if args is None else list(args)
+    code = forward(args)
+    if code is None:
+        return cli().main(args)
+    sys.exit(code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,984 @@
+# %%
+"""Storage backends behind `Data`.
+
+A backend keeps the tasks and commits mutations given as ops, see `apply_ops`.
+`ParquetBackend` keeps them in parquet or Arrow IPC files and rewrites a file, or
+writes a delta segment, for every commit. `SqliteBackend` keeps them in an
+indexed SQLite table and changes single rows in place.
+"""
+
+import pickle
+import shutil
+import sqlite3
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import polars as pl
+from polars import col, lit
+
+from tasker.search import SearchIndex
+from tasker.storage import (
+    CommitQueue,
+    FileLock,
+    IdIndex,
+    IpcFile,
+    ParquetFile,
+    PartitionedParquet,
+    Rollup,
+    SegmentLog,
+    apply_ops,
+    atomic_write_pickle,
+    check_ops,
+    migrate_to_partitions,
+)
+from tasker.utils.profiling import span
+
+# file suffix of each store format, beside the path of the parquet store
+FORMAT_SUFFIXES = {"parquet": ".parquet", "ipc": ".arrow", "sqlite": ".sqlite"}
+
+
+def detect_format(fp):
+    """The format of the store at `fp`, parquet for a new store.
+
+    When several exist, after an interrupted `Data.convert`, the newest is used.
+    """
+    fp = Path(fp).with_suffix(".parquet")
+    existing = [
+        (fp.with_suffix(suffix).stat().st_mtime_ns, format)
+        for format, suffix in FORMAT_SUFFIXES.items()
+        if fp.with_suffix(suffix).exists()
+    ]
+    return max(existing)[1] if existing else "parquet"
+
+
+def open_backend(fp, schema, format=None, segments=None, partitioned=None):
+    """Open the store at `fp` in the given format, by default the one found on disk.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the store, the suffix is replaced by the one of the format.
+    schema : dict
+        The polars schema of the tasks.
+    format : str, optional
+        One of "parquet", "ipc" or "sqlite".
+    segments, partitioned : bool, optional
+        Options of the parquet and ipc formats, see `ParquetBackend`.
+    """
+    fp = Path(fp).with_suffix(".parquet")
+    format = format or detect_format(fp)
+    assert format in FORMAT_SUFFIXES, f"Unknown store format {format}."
+    if format == "sqlite":
+        return SqliteBackend(fp.with_suffix(".sqlite"), schema)
+    return ParquetBackend(fp, schema, format, segments=segments, partitioned=partitioned)
+
+
+class StorageBackend(ABC):
+    """Interface of a task store.
+
+    Reads return polars frames in the store's schema. Mutations are committed in
+    batches of ops, which the default `commit` maps onto `append`, `update` and
+    `delete`, and ids are never reused.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the store.
+    schema : dict
+        The polars schema of the tasks.
+    """
+
+    format = None
+
+    def __init__(self, fp, schema) -> None:
+        self.fp = Path(fp)
+        self.schema = schema
+        # serialises writers across processes
+        self.lock = FileLock(self.fp.with_name(self.fp.name + ".lock"))
+        # full-text index over the task names, see `search`
+        self.search_index = SearchIndex(self.fp)
+
+    @abstractmethod
+    def read(self):
+        """The whole store, newest first."""
+
+    @abstractmethod
+    def scan(self, since=None, completed=None):
+        """Lazy query over the store.
+
+        Parameters
+        ----------
+        since : datetime, optional
+            Only tasks created at or after this time.
+        completed : bool, optional
+            Only completed or only open tasks.
+        """
+
+    @abstractmethod
+    def append(self, row):
+        """Add a task, `row` is a dict without an id. Returns the new id."""
+
+    @abstractmethod
+    def update(self, id, column, value, relative=False):
+        """Set one value of a task, or add to it when `relative`."""
+
+    @abstractmethod
+    def delete(self, id):
+        """Remove a task."""
+
+    @abstractmethod
+    def max_id(self):
+        """The largest id allocated so far, -1 for a new store."""
+
+    @abstractmethod
+    def write(self, df, max_id=None):
+        """Replace the whole store with `df`.
+
+        Ids up to `max_id`, by default the largest in `df`, are not reused.
+        """
+
+    @abstractmethod
+    def extend(self, chunks, progress=None):
+        """Append frames of tasks in one commit, under a contiguous block of new ids.
+
+        The ids of the frames are replaced. `progress` is called with the number of
+        tasks added so far after each frame. Returns the range of new ids.
+        """
+
+    @abstractmethod
+    def remove(self, sidecars=True):
+        """Delete the stored tasks and their files.
+
+        With `sidecars` the files kept beside the store, such as its lock, go
+        too. A store replaced by one sharing them, as parquet and ipc do, keeps them.
+        """
+
+    @abstractmethod
+    def rollup(self):
+        """The `Rollup` of the committed tasks, kept up to date by every commit."""
+
+    @abstractmethod
+    def version(self):
+        """Identify the committed state of the store, across processes and restarts."""
+
+    def search(self, query, limit=20):
+        """Ids of the tasks whose names match `query`, best first, see `SearchIndex`.
+
+        The index is built on the first search, and rebuilt once commits it
+        did not record have changed the store.
+        """
+        with self.lock.hold(shared=True):
+            if not self.search_index.stale(self.version()):
+                return self.search_index.search(query, limit)
+        with self.lock:
+            if self.search_index.stale(self.version()):
+                tasks = self.scan().select("id", "task").collect()
+                self.search_index.build(tasks, self.version())
+            return self.search_index.search(query, limit)
+
+    def _latest_created(self):
+        return self.scan().select(col("created").max()).collect().item()
+
+    def _rolled_up(self, rollup, removed=None, added=None, tasks=None):
+        """A copy of `rollup` with the changed rows applied.
+
+        When the latest task was removed it is looked up in `tasks`, the store
+        after the change, by default with a query.
+        """
+        rollup = rollup.copy()
+        rollup.apply(removed, added)
+        if rollup.stale_latest:
+            latest = tasks["created"].max() if tasks is not None else self._latest_created()
+            rollup.latest_created = latest
+        return rollup
+
+    def lookup(self, id, *columns):
+        """Collect the task with the given id, only reading the given columns."""
+        lf = self.scan().filter(col("id") == id)
+        if columns:
+            lf = lf.select(columns)
+        return lf.collect()
+
+    @contextmanager
+    def stream(self, since=None):
+        """Like `scan`, in a plan the streaming engine can sink, valid within the block."""
+        yield self.scan(since)
+
+    def invalidate(self):
+        """Drop anything cached, so the next read goes to disk."""
+
+    def compact(self):
+        """Reclaim the space left by changes, when the backend needs to."""
+
+    def submit(self, ops):
+        """Commit a batch of ops, returning the result of each op."""
+        check_ops(ops, self.schema)
+        with self.lock:
+            return self.commit([ops])[0]
+
+    def commit(self, batches):
+        """Apply batches of ops one by one, see `apply_ops` for the ops."""
+        all_results = []
+        for ops in batches:
+            results, appended = [], []
+            for op in ops:
+                result = None
+                if op[0] != "append" and op[1] < 0:
+                    op = (op[0], appended[-op[1] - 1], *op[2:])
+                match op:
+                    case ("append", row):
+                        result = self.append(row)
+                        appended.append(result)
+                    case ("set" | "add" as kind, id, column, value):
+                        self.update(id, column, value, relative=kind == "add")
+                    case ("delete", id):
+                        self.delete(id)
+                    case _:
+                        raise ValueError(f"Unknown operation {op!r}.")
+                results.append(result)
+            all_results.append(results)
+        return all_results
+
+    def check(self, df):
+        assert df.schema == self.schema, f"Schema mismatch: \nOld: {self.schema}\nNew: {df.schema}"
+        assert df["id"].is_unique().all(), "Index column is not unique."
+
+
+class ParquetBackend(StorageBackend):
+    """Tasks kept in a parquet or Arrow IPC file, or a partitioned parquet dataset.
+
+    Every commit rewrites the file, or only the partitions it touches, unless
+    `segments` is set, in which case the changed rows are written to a delta
+    segment and folded back in by `compact`. Commits from several processes are
+    grouped, see `CommitQueue`. Reads are cached until the files change.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the parquet file, sidecar files (lock, id index, segments) are
+        named after it whatever the format.
+    schema : dict
+        The polars schema of the tasks.
+    format : str
+        "parquet" or "ipc", a partitioned store is always parquet.
+    segments : bool, optional
+        Write mutations to delta segments instead of rewriting the base file. By
+        default only when a segment log is found on disk. Whatever it is set to,
+        reads replay the segments written by other writers, and a commit without
+        segments folds them into the base file.
+    partitioned : bool, optional
+        Keep the store as a dataset partitioned by month, migrating a single file.
+        By default the layout found on disk.
+    """
+
+    # rows are written sorted by id, so smaller row groups let id lookups skip more
+    row_group_size = 64 * 1024
+
+    def __init__(self, fp, schema, format="parquet", segments=None, partitioned=None) -> None:
+        super().__init__(fp, schema)
+        self.format = format
+        # a partitioned store is a directory, migrated from a single file on request
+        if partitioned:
+            assert format == "parquet", "A partitioned store is always parquet."
+            with self.lock:
+                migrate_to_partitions(self.fp)
+        elif partitioned is None:
+            partitioned = self.fp.is_dir() and format == "parquet"
+        if partitioned:
+            self.base = PartitionedParquet(self.fp)
+        elif format == "ipc":
+            self.base = IpcFile(self.fp.with_suffix(".arrow"))
+        else:
+            self.base = ParquetFile(self.fp)
+        # segments are always replayed, whichever writer left them
+        self.segments = SegmentLog(self.fp)
+        # write mutations to delta segments instead of rewriting the base file
+        self.segmented = bool(self.segments.paths()) if segments is None else segments
+        self.queue = CommitQueue(self.fp, self.lock, schema, version=self.version)
+        self.index = IdIndex(self.fp)
+        # aggregates of the store, see `rollup`
+        self.rollup_path = self.fp.with_name(self.fp.name + ".rollup")
+        self._rollup = None
+        # in-process copy of the store, invalidated when the file changes on disk
+        self._cache = None
+        self._cache_key = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _base_key(self):
+        """Identify the current version of the base file or dataset."""
+        return self.base.key()
+
+    def _stat_key(self):
+        """Identify the current version of the store."""
+        return self._base_key(), self.segments.state()
+
+    def version(self):
+        return self._stat_key()
+
+    def _cached(self):
+        return self._cache is not None and self._stat_key() == self._cache_key
+
+    def invalidate(self):
+        """Drop the cached dataframe so the next access re-reads the file."""
+        self._cache = None
+        self._cache_key = None
+
+    def read(self):
+        """The committed state of the store, from the cache when it is up to date."""
+        key = self._stat_key()
+        if self._cache is not None and key == self._cache_key:
+            self.cache_hits += 1
+            return self._cache
+        self.cache_misses += 1
+        # a shared lock keeps compaction from removing segments mid-read
+        with self.lock.hold(shared=True), span("read"):
+            df = self._scan_files().collect()
+        # ids are checked for uniqueness when written, not on every read
+        with span("sort"):
+            df = df.sort("created", descending=True)
+        self._cache, self._cache_key = df, key
+        return df
+
+    def _scan_base(self, since=None):
+        """Lazily scan the base file, without any segments."""
+        if (lf := self.base.scan(since)) is None:
+            lf = pl.LazyFrame(schema=self.schema)
+
+        # NOTE: temporary for update
+        if "worked" not in lf.collect_schema():
+            lf = lf.with_columns(worked=lit(None).cast(pl.Duration))
+        return lf
+
+    def _scan_files(self, since=None):
+        """Lazily scan the files of the store, bypassing the cache."""
+        return self.segments.merge(self._scan_base(since))
+
+    def scan(self, since=None, completed=None):
+        """Lazy query over the store.
+
+        Filters and column selections on the returned frame are pushed down into
+        the parquet reader, so row groups that cannot match are skipped using the
+        file statistics. When the cached frame is up to date it is used instead.
+        In a partitioned store partitions older than `since` are not read at all.
+        """
+        if self._cached():
+            self.cache_hits += 1
+            lf = self._cache.lazy()
+        else:
+            lf = self._scan_files(since)
+        if since is not None:
+            lf = lf.filter(col("created") >= since)
+        if completed is not None:
+            lf = lf.filter(col("completed") == completed)
+        return lf
+
+    @contextmanager
+    def stream(self, since=None):
+        """Scan the files, replaying segments in a form the streaming engine can sink."""
+        yield self.segments.stream(self._scan_base(since))
+
+    def lookup(self, id, *columns):
+        """Collect the row with the given id, only reading the given columns.
+
+        When the cache is cold the row is read by position through the id index,
+        unless a delta segment has changed it since the base file was written.
+        """
+        if self._cached():
+            return super().lookup(id, *columns)
+        with self.lock.hold(shared=True):
+            if id in self.segments.ids():
+                return super().lookup(id, *columns)
+            if self.base.partitioned or (key := self._base_key()) is None:
+                return super().lookup(id, *columns)
+            if (position := self.index.position(id, key)) is None:
+                # index missing or written for another version of the file
+                self.index.build(self._scan_base().select("id").collect()["id"], key)
+                position = self.index.position(id, key)
+            lf = self._scan_base()
+            if columns:
+                lf = lf.select(columns)
+            if position < 0:
+                return lf.clear().collect()
+            return lf.slice(position, 1).collect()
+
+    def _next_id(self, df):
+        """The next id of the persisted sequence, ids are never reused."""
+        if self._base_key() is None and not self.segments.paths():
+            # a new store starts the sequence again
+            return 0
+        return max(self.index.next_id(), (df["id"].max() + 1) if len(df) else 0)
+
+    def max_id(self):
+        return self._next_id(self.scan().select("id").collect()) - 1
+
+    def append(self, row):
+        return self.submit([("append", row)])[0]
+
+    def update(self, id, column, value, relative=False):
+        self.submit([("add" if relative else "set", id, column, value)])
+
+    def delete(self, id):
+        self.submit([("delete", id)])
+
+    def write(self, df, max_id=None, *, partitions=None, rollup=None):
+        """Write the whole store, see `StorageBackend.write`.
+
+        In a partitioned store only the given (year, month) partitions are
+        rewritten, by default all of them. `rollup` is the `Rollup` of `df` when
+        the caller has it, otherwise it is built from `df`.
+        """
+        self.check(df)
+        df = df.sort("id")
+        with self.lock:
+            self.base.write(df, partitions, row_group_size=self.row_group_size)
+            if not self.base.partitioned:
+                self.index.build(df["id"], self._base_key())
+            if len(df):
+                max_id = max(df["id"].max(), -1 if max_id is None else max_id)
+            if max_id is not None and max_id >= self.index.next_id():
+                self.index.advance(max_id + 1)
+            # the base file now holds every change
+            self.segments.clear()
+            # the written frame is the new state, so keep it rather than re-reading it
+            self._cache = df.sort("created", descending=True)
+            self._cache_key = self._stat_key()
+            self._save_rollup(rollup or Rollup.build(df))
+
+    def rollup(self):
+        """The `Rollup` of the store, from its sidecar file.
+
+        The sidecar records the version of the store it describes, and is rebuilt
+        from the whole store when it is missing or was left behind by a write
+        that did not update it.
+        """
+        key = self._stat_key()
+        if self._rollup is not None and self._rollup.key == key:
+            return self._rollup
+        try:
+            rollup = pickle.loads(self.rollup_path.read_bytes())
+        except Exception:
+            # missing, truncated, or pickled by a version of tasker that named things otherwise
+            rollup = None
+        if not isinstance(rollup, Rollup) or rollup.key != key:
+            with self.lock.hold(shared=True):
+                rollup = Rollup.build(self._scan_files().collect(), self._stat_key())
+            atomic_write_pickle(rollup, self.rollup_path)
+        self._rollup = rollup
+        return rollup
+
+    def _save_rollup(self, rollup):
+        """Save `rollup` as describing the store as it is now, the lock must be held."""
+        self._rollup = rollup.copy(key=self._stat_key())
+        atomic_write_pickle(self._rollup, self.rollup_path)
+
+    def submit(self, ops):
+        """Queue a batch of ops and commit it with those of other processes."""
+        return self.queue.submit(ops, self.commit)
+
+    def commit(self, batches):
+        """Apply queued batches to the current store in one write.
+
+        A batch that cannot be applied is left out, its exception is returned in
+        place of its results.
+        """
+        old = df = self.read()
+        previous, version = self.rollup(), self.version()
+        touched, all_results = set(), []
+        next_id = start_id = self._next_id(df)
+        for ops in batches:
+            try:
+                applied = apply_ops(df, ops, next_id)
+            except Exception as e:
+                all_results.append(e)
+                continue
+            df, results, changed, next_id = applied
+            touched |= changed
+            all_results.append(results)
+        if next_id != start_id:
+            self.index.advance(next_id)
+        # only the changed rows are aggregated and indexed
+        upserts, removed = df.filter(col("id").is_in(touched)), old.filter(col("id").is_in(touched))
+        rollup = self._rolled_up(previous, removed, upserts, df)
+
+        if not self.segmented:
+            partitions = self._changed_partitions(old, df, touched)
+            if self.segments.paths():
+                # segments left by another writer are folded into the whole base file
+                partitions = None
+            self.write(df, partitions=partitions, rollup=rollup)
+            self.search_index.record(version, self.version(), removed, upserts)
+            return all_results
+
+        # only the changed rows are written, as a segment
+        deleted = touched - set(upserts["id"])
+        self.segments.write(upserts, deleted)
+        self._save_rollup(rollup)
+        self.search_index.record(version, self.version(), removed, upserts)
+        if self.segments.needs_compaction():
+            self.compact(df)
+        else:
+            self._cache = df.sort("created", descending=True)
+            self._cache_key = self._stat_key()
+        return all_results
+
+    def _changed_partitions(self, old, new, ids):
+        """Partitions holding the given ids before or after a change.
+
+        None, meaning every partition, when the store is a single file.
+        """
+        if not self.base.partitioned:
+            return None
+        ids = list(ids)
+        return self.base.partitions(old.filter(col("id").is_in(ids))) | self.base.partitions(
+            new.filter(col("id").is_in(ids))
+        )
+
+    def compact(self, df=None):
+        """Fold any delta segments back into the base file."""
+        with self.lock:
+            if df is None:
+                df = self.read()
+            partitions = None
+            if self.base.partitioned and self.segments.paths():
+                # only the partitions of rows changed by the segments need rewriting
+                ids = list(self.segments.ids())
+                old = self._scan_base().filter(col("id").is_in(ids)).collect()
+                partitions = self._changed_partitions(old, df, ids)
+            # compaction does not change the tasks, so neither their aggregates nor index
+            version = self.version()
+            self.write(df, partitions=partitions, rollup=self.rollup())
+            self.search_index.record(version, self.version())
+
+    def extend(self, chunks, progress=None):
+        """Stage each frame to disk and commit them together at the end.
+
+        The staged frames are streamed into the base file or the partitions they
+        fall in along with the old rows, so neither the input nor the store has
+        to fit in memory, only a frame and the ids of the store. The new ids are
+        in no segment, so the segments are left as they are.
+        """
+        self.fp.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock, tempfile.TemporaryDirectory(dir=self.fp.parent) as staging:
+            rollup = self.rollup().copy()
+            first_id = next_id = self.max_id() + 1
+            parts, partitions = [], set()
+            for chunk in chunks:
+                ids = pl.int_range(next_id, next_id + len(chunk), dtype=pl.Int64)
+                chunk = chunk.with_columns(ids.alias("id"))
+                rollup.apply(added=chunk)
+                next_id += len(chunk)
+                if self.base.partitioned:
+                    partitions |= self.base.partitions(chunk)
+                parts.append(Path(staging) / f"{len(parts):08d}.parquet")
+                chunk.write_parquet(parts[-1])
+                if progress is not None:
+                    progress(next_id - first_id)
+
+            if next_id == first_id:
+                return range(first_id, first_id)
+            self.index.advance(next_id)
+            added = pl.scan_parquet(parts)
+            self.base.extend(added, partitions, row_group_size=self.row_group_size)
+            if not self.base.partitioned:
+                ids = self._scan_base().select("id").collect()["id"]
+                self.index.build(ids, self._base_key())
+            self.invalidate()
+            self._save_rollup(rollup)
+        return range(first_id, next_id)
+
+    def remove(self, sidecars=True):
+        with self.lock:
+            if self.base.partitioned:
+                shutil.rmtree(self.fp, ignore_errors=True)
+            else:
+                self.base.fp.unlink(missing_ok=True)
+            self.segments.clear()
+            self._rollup = None
+            self.search_index.remove()
+            if sidecars:
+                self.rollup_path.unlink(missing_ok=True)
+                self.index.remove()
+                self.queue.remove()
+            self.invalidate()
+        if sidecars:
+            self.lock.path.unlink(missing_ok=True)
+
+
+# microseconds in a day, the rollup of a SQLite store is kept by day created
+DAY_US = 86_400_000_000
+
+
+def sql_day(created):
+    """SQL for the days since the epoch of `created`, SQL for a time in microseconds."""
+    return f"(({created}) - ((({created}) % {DAY_US}) + {DAY_US}) % {DAY_US}) / {DAY_US}"
+
+
+def to_sql(value):
+    """A python value as stored in SQLite, times as integer microseconds."""
+    match value:
+        case datetime():
+            return (value - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+        case timedelta():
+            return value // timedelta(microseconds=1)
+        case bool():
+            return int(value)
+        case _:
+            return value
+
+
+class SqliteBackend(StorageBackend):
+    """Tasks kept in a SQLite table with an index on ``completed`` and ``created``.
+
+    Each op changes a single row in place and the ops of a commit run in one SQL
+    transaction, so a change no longer rewrites the store. Times are stored as
+    integer microseconds and converted back to polars types on read. The
+    aggregates of the `Rollup` are kept in ``rollup_counts`` and ``rollup_days``
+    tables, which triggers update in the transaction of every change.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the database.
+    schema : dict
+        The polars schema of the tasks.
+    """
+
+    format = "sqlite"
+    table = "tasks"
+    # rows fetched at a time by `stream`
+    batch_size = 64 * 1024
+
+    def __init__(self, fp, schema) -> None:
+        super().__init__(fp, schema)
+        self._conn = None
+        self._cache = None
+        self._cache_key = None
+        self._rollup = None
+
+    @property
+    def conn(self):
+        """The connection, opened and set up on first use."""
+        if self._conn is None:
+            self.fp.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.fp, timeout=30)
+            # readers do not block the writer, nor the writer readers
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            with self._conn:
+                self._conn.executescript(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {self.table} (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        task TEXT NOT NULL,
+                        completed INTEGER NOT NULL DEFAULT 0,
+                        created INTEGER,
+                        worked INTEGER
+                    );
+                    CREATE INDEX IF NOT EXISTS {self.table}_completed
+                        ON {self.table} (completed);
+                    CREATE INDEX IF NOT EXISTS {self.table}_created ON {self.table} (created);
+                    CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value BLOB);
+                    INSERT OR IGNORE INTO meta (name, value) VALUES ('id', randomblob(16));
+                    """
+                )
+                if not self._has_table("rollup_days"):
+                    # a new database, or one written before the rollup tables
+                    self._conn.execute("BEGIN")
+                    self._create_rollup()
+        return self._conn
+
+    def _has_table(self, name):
+        query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+        return self._conn.execute(query, (name,)).fetchone() is not None
+
+    def _rollup_sql(self, row, sign):
+        """Statements taking the `row` ("OLD" or "NEW") out of, or putting it in, the rollup."""
+        day, op = sql_day(f"{row}.created"), "+" if sign > 0 else "-"
+        statements = [
+            f"UPDATE rollup_days SET created = created {op} 1, "
+            f"worked = worked {op} COALESCE({row}.worked, 0) WHERE day IS {day};",
+            f"INSERT INTO rollup_counts (completed, n) VALUES ({row}.completed, {sign}) "
+            "ON CONFLICT (completed) DO UPDATE SET n = n + excluded.n;",
+        ]
+        if sign > 0:
+            statements.insert(
+                0,
+                f"INSERT INTO rollup_days (day, created, worked) SELECT {day}, 0, 0 "
+                f"WHERE NOT EXISTS (SELECT 1 FROM rollup_days WHERE day IS {day});",
+            )
+        else:
+            statements.append(f"DELETE FROM rollup_days WHERE day IS {day} AND created = 0;")
+        return "\n".join(statements)
+
+    def _create_rollup(self):
+        """Create the rollup tables and the triggers keeping them, and fill them."""
+        triggers = {
+            "insert": f"AFTER INSERT ON {self.table} BEGIN {self._rollup_sql('NEW', 1)} END",
+            "delete": f"AFTER DELETE ON {self.table} BEGIN {self._rollup_sql('OLD', -1)} END",
+            "update": f"AFTER UPDATE OF completed, created, worked ON {self.table} "
+            f"BEGIN {self._rollup_sql('OLD', -1)} {self._rollup_sql('NEW', 1)} END",
+        }
+        statements = [
+            "CREATE TABLE IF NOT EXISTS rollup_counts (completed INTEGER PRIMARY KEY, n INTEGER)",
+            "CREATE TABLE IF NOT EXISTS rollup_days (day INTEGER UNIQUE, created, worked)",
+            *(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_rollup_{name} {trigger}"
+                for name, trigger in triggers.items()
+            ),
+            "DELETE FROM meta WHERE name = 'rollup'",
+            "DELETE FROM rollup_counts",
+            "DELETE FROM rollup_days",
+            f"INSERT INTO rollup_counts (completed, n) "
+            f"SELECT completed, COUNT(*) FROM {self.table} GROUP BY completed",
+            f"INSERT INTO rollup_days (day, created, worked) "
+            f"SELECT {sql_day('created')} AS day, COUNT(*), COALESCE(SUM(worked), 0) "
+            f"FROM {self.table} GROUP BY day",
+        ]
+        # one by one, executescript would commit the transaction under way
+        for statement in statements:
+            self._conn.execute(statement)
+
+    @contextmanager
+    def _bulk(self):
+        """Change many rows in one transaction without the rollup triggers.
+
+        The triggers cost several statements a row, so they are dropped and the
+        rollup is built again from the table once the rows are changed.
+        """
+        if not self.conn.in_transaction:
+            # dropping the triggers would otherwise commit straight away
+            self.conn.execute("BEGIN")
+        for name in ("insert", "delete", "update"):
+            self.conn.execute(f"DROP TRIGGER IF EXISTS {self.table}_rollup_{name}")
+        yield
+        self._create_rollup()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _key(self):
+        """Identify the current version of the database, changed by any commit."""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0], self.conn.total_changes
+
+    def invalidate(self):
+        self._cache = None
+        self._cache_key = None
+
+    def _select(self, where="", params=(), columns=()):
+        """Run a query on the table and return the rows as a frame in the schema."""
+        columns = list(columns or self.schema)
+        rows = self.conn.execute(
+            f"SELECT {', '.join(columns)} FROM {self.table} {where}", params
+        ).fetchall()
+        return self._frame(rows, columns)
+
+    def _frame(self, rows, columns):
+        # times and booleans are stored as integers
+        dtypes = {c: pl.String if self.schema[c] == pl.String else pl.Int64 for c in columns}
+        df = pl.DataFrame(rows, schema=dtypes, orient="row")
+        return df.cast({c: self.schema[c] for c in columns})
+
+    def read(self):
+        key = self._key()
+        if self._cache is None or key != self._cache_key:
+            self._cache = self._select().sort("created", descending=True)
+            self._cache_key = key
+        return self._cache
+
+    def scan(self, since=None, completed=None):
+        """Lazy query over the rows matching the filters, which use the table indexes.
+
+        Without filters the whole table is served from `read`, cached until the
+        database changes.
+        """
+        if since is None and completed is None:
+            return self.read().lazy()
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("created >= ?")
+            params.append(to_sql(since))
+        if completed is not None:
+            conditions.append("completed = ?")
+            params.append(to_sql(completed))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._select(where, params).lazy()
+
+    @contextmanager
+    def stream(self, since=None):
+        """Stage the rows to parquet `batch_size` at a time and scan them within the block.
+
+        The table is read with ``fetchmany``, so only a batch is held in memory.
+        """
+        where, params = ("WHERE created >= ?", [to_sql(since)]) if since is not None else ("", [])
+        columns = list(self.schema)
+        with tempfile.TemporaryDirectory(dir=self.fp.parent) as staging:
+            cursor = self.conn.execute(
+                f"SELECT {', '.join(columns)} FROM {self.table} {where}", params
+            )
+            parts = []
+            while rows := cursor.fetchmany(self.batch_size):
+                parts.append(Path(staging) / f"{len(parts):08d}.parquet")
+                self._frame(rows, columns).write_parquet(parts[-1])
+            yield pl.scan_parquet(parts) if parts else pl.LazyFrame(schema=self.schema)
+
+    def lookup(self, id, *columns):
+        return self._select("WHERE id = ?", (id,), columns)
+
+    def max_id(self):
+        row = self.conn.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = ?", (self.table,)
+        ).fetchone()
+        return -1 if row is None else row[0]
+
+    def _reserve(self, max_id):
+        """Make sure ids up to `max_id` are not allocated again."""
+        if max_id <= self.max_id():
+            return
+        updated = self.conn.execute(
+            "UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (max_id, self.table)
+        )
+        if updated.rowcount == 0:
+            self.conn.execute(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (self.table, max_id)
+            )
+
+    def _insert(self, df):
+        columns = list(self.schema)
+        rows = df.select(columns).with_columns(
+            col("completed").cast(pl.Int64),
+            col("created").cast(pl.Int64),
+            col("worked").cast(pl.Int64),
+        )
+        self.conn.executemany(
+            f"INSERT INTO {self.table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            rows.iter_rows(),
+        )
+
+    def append(self, row):
+        # ids start at 0 like the other backends, AUTOINCREMENT only keeps the maximum
+        new_id = self.max_id() + 1
+        columns = list(self.schema)
+        self.conn.execute(
+            f"INSERT INTO {self.table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            [new_id, *(to_sql(row.get(c)) for c in columns[1:])],
+        )
+        return new_id
+
+    def update(self, id, column, value, relative=False):
+        assert column in self.schema and column != "id", f"Unknown column {column}."
+        new = f"COALESCE({column}, 0) + ?" if relative else "?"
+        self.conn.execute(
+            f"UPDATE {self.table} SET {column} = {new} WHERE id = ?", (to_sql(value), id)
+        )
+
+    def delete(self, id):
+        self.conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (id,))
+
+    def commit(self, batches):
+        """Apply the batches in one SQL transaction, nothing is written if one fails.
+
+        When the search index is up to date, the rows the ops touch are read
+        before and after, to record the change in it once the transaction is
+        committed.
+        """
+        with self.conn:
+            version = self.version()
+            indexed = self.search_index.version() == repr(version)
+            ids = {op[1] for ops in batches for op in ops if op[0] != "append" and op[1] >= 0}
+            removed = self._select_ids(ids) if indexed else None
+            all_results = super().commit(batches)
+            appended = {r for results in all_results for r in results if r is not None}
+            added = self._select_ids(ids | appended) if indexed else None
+            self._count_change()
+        if indexed:
+            self.search_index.record(version, self.version(), removed, added)
+        return all_results
+
+    def _select_ids(self, ids):
+        """The id and task of the rows with the given ids."""
+        ids = list(ids)
+        return self._select(f"WHERE id IN ({', '.join('?' * len(ids))})", ids, ("id", "task"))
+
+    def _latest_created(self):
+        return self._select("ORDER BY created DESC LIMIT 1", columns=["created"])["created"].max()
+
+    def rollup(self):
+        """The `Rollup` of the store, read from the tables the triggers keep up to date."""
+        key = self._key()
+        if self._rollup is not None and self._rollup.key == key:
+            return self._rollup
+        rollup = Rollup(key)
+        for completed, n in self.conn.execute("SELECT completed, n FROM rollup_counts"):
+            rollup.counts[bool(completed)] += n
+        days = self.conn.execute("SELECT day, created, worked FROM rollup_days WHERE created")
+        rollup.days = {day: (created, worked) for day, created, worked in days}
+        if rollup.tasks:
+            rollup.latest_created = self._latest_created()
+        self._rollup = rollup
+        return rollup
+
+    def version(self):
+        """The id of the database and the number of changes committed to it.
+
+        Changes are counted by `_count_change`, the id tells apart a database
+        removed and created again.
+        """
+        return self.conn.execute(
+            "SELECT (SELECT hex(value) FROM meta WHERE name = 'id'), "
+            "COALESCE((SELECT value FROM meta WHERE name = 'version'), 0)"
+        ).fetchone()
+
+    def _count_change(self):
+        """Count a change in `version`, inside the transaction of the change."""
+        self.conn.execute(
+            "INSERT INTO meta (name, value) VALUES ('version', 1) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + 1"
+        )
+
+    def write(self, df, max_id=None):
+        self.check(df)
+        with self.lock, self.conn, self._bulk():
+            self.conn.execute(f"DELETE FROM {self.table}")
+            self._insert(df)
+            if max_id is not None:
+                self._reserve(max_id)
+            self._count_change()
+
+    def extend(self, chunks, progress=None):
+        with self.lock, self.conn, self._bulk():
+            first_id = next_id = self.max_id() + 1
+            for chunk in chunks:
+                ids = pl.int_range(next_id, next_id + len(chunk), dtype=pl.Int64)
+                chunk = chunk.with_columns(ids.alias("id"))
+                self._insert(chunk)
+                next_id += len(chunk)
+                if progress is not None:
+                    progress(next_id - first_id)
+            self._count_change()
+        return range(first_id, next_id)
+
+    def compact(self):
+        """Rebuild the database file without the space freed by deleted rows."""
+        with self.lock:
+            self.conn.execute("VACUUM")
+
+    def remove(self, sidecars=True):
+        with self.lock:
+            self.close()
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{self.fp}{suffix}").unlink(missing_ok=True)
+            self._rollup = None
+            self.search_index.remove()
+            self.invalidate()
+        if sidecars:
+            self.lock.path.unlink(missing_ok=True)
+
+
+# %%
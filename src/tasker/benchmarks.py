@@ -0,0 +1,263 @@
+# %%
+"""Benchmarks for the CLI start up and the Data operations on large stores.
+
+Run with ``python -m tasker.benchmarks --output bench.json`` and compare the
+JSON files written by two versions to catch regressions.
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+import click
+import polars as pl
+from polars import col, lit
+
+from tasker.countdown import Renderer, get_number_lines, print_full_screen
+from tasker.task import Data, df_schema, pl_print
+
+VERBS = ["Write", "Review", "Refactor", "Fix", "Plan", "Read", "Email", "Draft", "Test", "Deploy"]
+OBJECTS = [
+    "the quarterly report",
+    "parser edge cases",
+    "budget spreadsheet",
+    "release notes",
+    "unit tests",
+    "conference slides",
+    "the public API",
+    "onboarding doc",
+    "database migration",
+    "notes from the team sync",
+]
+
+
+def generate_tasks(n, seed=0, end=None, span=timedelta(days=3 * 365)):
+    """Generate a synthetic task store.
+
+    Parameters
+    ----------
+    n : int
+        Number of tasks.
+    seed : int
+        Seed for the random sampling, the same seed gives the same store.
+    end : datetime, optional
+        Creation time of the newest task, defaults to now.
+    span : timedelta
+        Time between the oldest and the newest task.
+
+    Returns
+    -------
+    pl.DataFrame
+        Tasks in `df_schema`, with ids in creation order, about 90% of them
+        completed and up to three hours of work recorded on each.
+    """
+    end = end or datetime.now()
+    span_us = span // timedelta(microseconds=1)
+
+    def random(k, high):
+        """Pseudo-random integers in [0, high), seeded by the seed and `k`."""
+        return pl.int_range(n, eager=True).hash(seed * 10 + k) % high
+
+    df = pl.DataFrame(
+        {
+            "id": pl.int_range(n, eager=True),
+            "verb": pl.Series(VERBS).gather(random(1, len(VERBS))),
+            "object": pl.Series(OBJECTS).gather(random(2, len(OBJECTS))),
+            "done": random(3, 10),
+            # sorted, so ids follow creation order
+            "offset": random(4, span_us).sort().cast(pl.Int64),
+            "minutes": random(5, 181).cast(pl.Int64),
+        }
+    )
+    return df.select(
+        col("id"),
+        pl.concat_str(col("verb"), lit(" "), col("object"), lit(" #"), col("id")).alias("task"),
+        (col("done") > 0).alias("completed"),
+        (lit(end - span) + pl.duration(microseconds=col("offset"))).alias("created"),
+        pl.duration(minutes=col("minutes")).alias("worked"),
+    ).cast(df_schema)
+
+
+def timeit(func, repeat=5, setup=None):
+    """Time `func`, calling `setup` untimed before every run.
+
+    Returns a dict of the min, median and mean run time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        # the Data methods print progress, keep it out of the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+    }
+
+
+def cli_env(store=None, socket=None):
+    env = dict(os.environ)
+    if store is not None:
+        env["TASKER_STORE"] = str(store)
+    # without a socket, point at one that does not exist so a running daemon is not used
+    env["TASKER_SOCKET"] = str(socket or Path(tempfile.gettempdir()) / "tasker-bench-none.sock")
+    return env
+
+
+def run_cli(*args, store=None, socket=None):
+    """Run the tasker CLI in a fresh interpreter, as a user would."""
+    cmd = [sys.executable, "-c", "from tasker.__main__ import main; main()", *args]
+    subprocess.run(cmd, env=cli_env(store, socket), check=True, capture_output=True)
+
+
+@contextlib.contextmanager
+def serving(store, socket, timeout=60):
+    """Run ``tasker serve`` on the store in the background while in the block."""
+    cmd = [sys.executable, "-c", "from tasker.__main__ import main; main()", "serve"]
+    proc = subprocess.Popen(
+        [*cmd, "--socket", str(socket)], env=cli_env(store, socket), stdout=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while not Path(socket).exists():
+            assert proc.poll() is None, "tasker serve exited."
+            assert time.monotonic() < deadline, "tasker serve did not start."
+            time.sleep(0.05)
+        yield proc
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def bench_data(n, tmp_dir, repeat=5, seed=0):
+    """Benchmark the Data operations and `tasker list` on a store of `n` tasks."""
+    fp = Path(tmp_dir) / f"tasks_{n}.csv"
+    data = Data(fp=fp, segments=True)
+    data.write(generate_tasks(n, seed=seed))
+    last_id = n - 1
+    ipc = Data(fp=Path(tmp_dir) / f"tasks_{n}_ipc.csv", format="ipc")
+    ipc.write(data.df)
+    sqlite = Data(fp=Path(tmp_dir) / f"tasks_{n}_sqlite.csv", format="sqlite")
+    sqlite.write(data.df)
+
+    def log_session():
+        end = datetime.now()
+        data.log_session(last_id, end - timedelta(minutes=25), end)
+
+    def delete_newest():
+        data.delete(data.append("benchmark task"))
+
+    def pl_print_all():
+        pl_print(data.formatted(data.df).sort("created", descending=True), string=True, drop=None)
+
+    results = {
+        "df_cold": timeit(lambda: data.df, repeat, setup=data.invalidate),
+        "df_cached": timeit(lambda: data.df, repeat),
+        "df_cold_ipc": timeit(lambda: ipc.df, repeat, setup=ipc.invalidate),
+        "append": timeit(lambda: data.append("benchmark task"), repeat),
+        "set": timeit(lambda: data._set(last_id, "completed", True), repeat),
+        "set_sqlite": timeit(lambda: sqlite._set(last_id, "completed", True), repeat),
+        "log_session": timeit(log_session, repeat),
+        "df_after_session": timeit(lambda: data.df, repeat, setup=log_session),
+        "delete": timeit(delete_newest, repeat),
+        "todo_cold": timeit(lambda: data.todo, repeat, setup=data.invalidate),
+        "summary": timeit(data.summary, repeat),
+        "get_cold": timeit(lambda: data.get(last_id // 2, "task"), repeat, setup=data.invalidate),
+        "formatted_pl_print": timeit(pl_print_all, repeat),
+        "stats_week_cold": timeit(lambda: data.stats("week"), repeat, setup=data.invalidate),
+        "search_build": timeit(
+            lambda: data.search("report"), repeat, setup=data.backend.search_index.remove
+        ),
+        "search": timeit(lambda: data.search("quarterly rep"), repeat),
+        "compact": timeit(data.compact, repeat),
+        "cli_list": timeit(lambda: run_cli("list", store=fp), repeat),
+    }
+    socket = Path(tmp_dir) / "tasker.sock"
+    with serving(fp, socket):
+        results["cli_list_daemon"] = timeit(
+            lambda: run_cli("list", store=fp, socket=socket), repeat
+        )
+    return [{"name": name, "size": n, **result} for name, result in results.items()]
+
+
+def bench_static(repeat=5):
+    """Benchmarks that do not depend on the size of the store."""
+
+    def render_frame():
+        print_full_screen(get_number_lines(59 * 60 + 59), title="benchmark task")
+
+    renderer = Renderer("benchmark task", tenths=True, stream=io.StringIO())
+    ticks = iter(range(10**9))
+
+    def render_diff():
+        renderer.draw(3600 - next(ticks) / 10)
+
+    results = {
+        "cli_help": timeit(lambda: run_cli("--help"), repeat),
+        "cli_countdown_help": timeit(lambda: run_cli("countdown", "--help"), repeat),
+        "countdown_frame": timeit(render_frame, max(repeat, 100)),
+        "countdown_frame_diff": timeit(render_diff, max(repeat, 100)),
+    }
+    return [{"name": name, "size": None, **result} for name, result in results.items()]
+
+
+def run(sizes=(10_000, 100_000, 1_000_000), repeat=5, seed=0):
+    """Run every benchmark, returning the results as a JSON serialisable dict."""
+    try:
+        package_version = version("joolz")
+    except PackageNotFoundError:
+        package_version = None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = bench_static(repeat)
+        for n in sizes:
+            results += bench_data(n, tmp_dir, repeat, seed)
+
+    return {
+        "version": package_version,
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "platform": platform.platform(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+    }
+
+
+@click.command()
+@click.option(
+    "--size", "sizes", type=int, multiple=True, help="Store size, repeat for several sizes."
+)
+@click.option("--repeat", default=5, help="Runs of each benchmark.")
+@click.option("--seed", default=0, help="Seed for the synthetic stores.")
+@click.option("--output", type=click.Path(dir_okay=False), help="Write the JSON results here.")
+def main(sizes, repeat, seed, output):
+    """Benchmark tasker and print or save the results as JSON."""
+    report = run(sizes or (10_000, 100_000, 1_000_000), repeat, seed)
+    text = json.dumps(report, indent=2)
+    if output:
+        Path(output).write_text(text + "\n")
+        for result in report["results"]:
+            print(f"{result['name']:>20} {result['size'] or '':>9} {result['median']:10.4f}s")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
+
+# %%
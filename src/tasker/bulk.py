@@ -0,0 +1,134 @@
+# %%
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+
+import polars as pl
+from polars import col, lit
+
+IMPORT_FORMATS = {".csv": "csv", ".jsonl": "ndjson", ".ndjson": "ndjson", ".parquet": "parquet"}
+EXPORT_FORMATS = {**IMPORT_FORMATS, ".arrow": "ipc", ".ipc": "ipc", ".feather": "ipc"}
+
+
+def read_chunks(source, chunk_size=100_000):
+    """Stream a csv, ndjson or parquet file as dataframes of about `chunk_size` rows.
+
+    Only one chunk is held in memory at a time, so the file can be larger than RAM.
+
+    Parameters
+    ----------
+    source : str or Path
+        The file to read, its format is taken from the suffix.
+    chunk_size : int
+        Number of rows per chunk.
+
+    Yields
+    ------
+    pl.DataFrame
+        The next chunk of rows, with the columns of the file.
+    """
+    source = Path(source)
+    match IMPORT_FORMATS.get(source.suffix.lower()):
+        case "csv":
+            reader = pl.read_csv_batched(source, batch_size=chunk_size, try_parse_dates=True)
+            while batches := reader.next_batches(1):
+                yield batches[0]
+        case "ndjson":
+            with open(source) as f:
+                while lines := list(islice(f, chunk_size)):
+                    yield pl.read_ndjson("".join(lines).encode())
+        case "parquet":
+            lf = pl.scan_parquet(source)
+            n_rows = lf.select(pl.len()).collect().item()
+            for offset in range(0, n_rows, chunk_size):
+                yield lf.slice(offset, chunk_size).collect()
+        case _:
+            formats = ", ".join(IMPORT_FORMATS)
+            raise ValueError(f"Cannot import {source.name}, expected one of {formats}.")
+
+
+def normalize(chunk, first_id, schema, now=None):
+    """Cast imported rows to the store's `schema`, numbering them from `first_id`.
+
+    Only ``task`` is required. A missing ``completed`` is False, a missing
+    ``created`` is `now`, and ``worked`` may be a duration or a number of seconds
+    and defaults to zero.
+
+    Raises
+    ------
+    ValueError
+        If the chunk has no ``task`` column or a task is empty.
+    """
+    if "task" not in chunk.columns:
+        raise ValueError("Imported tasks need a 'task' column.")
+    now = now or datetime.now()
+    dtypes = chunk.schema
+
+    def column(name):
+        return col(name) if name in dtypes else lit(None).alias(name)
+
+    created = column("created")
+    if dtypes.get("created") == pl.String:
+        created = created.str.to_datetime(time_unit="us")
+    worked = column("worked")
+    if "worked" in dtypes and dtypes["worked"].is_numeric():
+        worked = pl.duration(microseconds=(worked * 1_000_000).cast(pl.Int64))
+
+    df = chunk.select(
+        pl.int_range(first_id, first_id + len(chunk), dtype=pl.Int64).alias("id"),
+        col("task").cast(pl.String),
+        column("completed").cast(pl.Boolean).fill_null(False),
+        created.cast(schema["created"]).fill_null(lit(now).cast(schema["created"])),
+        worked.cast(schema["worked"])
+        .fill_null(lit(timedelta(0)).cast(schema["worked"]))
+        .alias("worked"),
+    )
+    if (empty := df.filter(col("task").is_null() | (col("task") == ""))).height:
+        raise ValueError(f"Task cannot be empty, {empty.height} imported rows have no task.")
+    return df
+
+
+def export_format(dest, format=None):
+    """The export format, given explicitly or taken from the suffix of `dest`."""
+    if format is None and isinstance(dest, (str, Path)):
+        format = EXPORT_FORMATS.get(Path(dest).suffix.lower())
+    if format not in set(EXPORT_FORMATS.values()):
+        formats = ", ".join(sorted(set(EXPORT_FORMATS.values())))
+        raise ValueError(f"Cannot export as {format}, expected one of {formats}.")
+    return format
+
+
+def sink(lf, dest, format=None):
+    """Stream a LazyFrame to a file or binary stream without collecting it.
+
+    The text formats cannot hold durations, so there ``worked`` is written as a
+    number of seconds, which `normalize` reads back.
+
+    Parameters
+    ----------
+    lf : pl.LazyFrame
+        The rows to write, the plan must be supported by the streaming engine.
+    dest : str, Path or binary file object
+        Where to write, a stream such as stdout is written through a temporary file.
+    format : str, optional
+        One of csv, ndjson, ipc or parquet, taken from the suffix of `dest` when
+        not given.
+    """
+    format = export_format(dest, format)
+    if format in ("csv", "ndjson") and "worked" in lf.collect_schema():
+        lf = lf.with_columns(col("worked").dt.total_microseconds() / 1_000_000)
+
+    if isinstance(dest, (str, Path)):
+        getattr(lf, f"sink_{format}")(dest)
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / f"export.{format}"
+        getattr(lf, f"sink_{format}")(path)
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, dest)
+    dest.flush()
+
+
+# %%
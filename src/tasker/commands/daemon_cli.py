@@ -0,0 +1,18 @@
+import click
+
+
+@click.command()
+@click.option(
+    "--socket",
+    "path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Socket to listen on, by default one per TASKER_STORE.",
+)
+def serve_cli(path):
+    """
+    Keep tasker loaded and serve commands over a Unix socket.
+    """
+    from tasker.daemon import serve
+
+    serve(path)
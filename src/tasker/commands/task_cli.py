@@ -2,36 +2,92 @@ import re
 
 import click
 
-from tasker.task import data, pl_print
 from tasker.utils.cli_class import CLI, add_params
 
 
+def get_data():
+    """The task store. polars is only imported once a command needs the data."""
+    from tasker.utils.profiling import span
+
+    with span("imports"):
+        from tasker.task import get_data
+    with span("open store"):
+        return get_data()
+
+
 def clean_name(name):
     return re.sub("_task[s]?", "", name)
 
 
+# rows per page when --page or --pager is given without --limit
+PAGE_SIZE = 20
+
+# options selecting a window of the task list, shared by list and the task pickers
+WINDOW_OPTIONS = (
+    click.option(
+        "--limit", type=click.IntRange(min=0), default=None, help="Show at most this many tasks."
+    ),
+    click.option("--offset", type=click.IntRange(min=0), default=0, help="Skip this many tasks."),
+    click.option(
+        "--page", type=click.IntRange(min=1), default=None, help="Show this page of tasks, from 1."
+    ),
+)
+
+
+def window(limit, offset, page):
+    """Turn the window options into a (limit, offset) pair."""
+    if page is not None:
+        limit = PAGE_SIZE if limit is None else limit
+        offset += (page - 1) * limit
+    return limit, offset
+
+
+def parse_time(ctx, param, value):
+    """A datetime from an ISO date or from a duration before now, e.g. 30d.
+
+    The callback of the time options, so a bad value is a usage error.
+    """
+    from datetime import datetime
+
+    from tasker.utils.helpers import parse_timedelta_string
+
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.now() - parse_timedelta_string(value)
+    except ValueError:
+        raise click.BadParameter(
+            f"{value!r} is neither an ISO date nor a duration such as 30d."
+        ) from None
+
+
 class TaskCLI(CLI):
     @staticmethod
     def clean_name(name):
         return re.sub("_task[s]?", "", name)
 
-    def todo():
+    @add_params(*WINDOW_OPTIONS)
+    def todo(limit, offset, page):
         """
         Choose from the incomplete tasks.
         """
-        todo = data.todo
+        limit, offset = window(limit, offset, page)
+        data = get_data()
+        # the chosen or new task is committed before the hour of work starts
+        todo = data.window(limit=limit, offset=offset, completed=False)
         if len(todo) > 0:
             print("There are tasks outstanding.")
             id = data.choice(
-                data.todo,
+                todo,
                 "Input a number to continue the task, or press enter to make new task: ",
+                limit,
             )
-            if id:
-                task = data.get(id, "task")
-            else:
+            if id is None:
                 id = data.append()
-
-            print("Task:", task)
         else:
             choice = input("No outstanding tasks found. Would you like to make a new task? (y/n): ")
             match choice:
@@ -39,36 +95,172 @@ class TaskCLI(CLI):
                     id = data.append()
                 case "n":
                     print("Exiting.")
+                    return
                 case _:
                     print("Invalid input.")
+                    return
 
+        print("Task:", data.get(id, "task"))
         data.start_work(id)
-        data.finish_work(id)
+        with data.transaction():
+            data.finish_work(id)
 
-    def delete():
+    @add_params(*WINDOW_OPTIONS)
+    def delete(limit, offset, page):
         """
         Delete an item from the task list.
         """
-        data.delete()
+        limit, offset = window(limit, offset, page)
+        data = get_data()
+        with data.transaction():
+            data.delete(limit=limit, offset=offset)
 
     def new_tasks():
         """
         Add an item to the task list.
         """
-        data.append()
+        data = get_data()
+        with data.transaction():
+            data.append()
+
+    @add_params(
+        click.argument("file", type=click.Path(exists=True, dir_okay=False)),
+        click.option("--chunk-size", default=100_000, help="Rows read at a time."),
+    )
+    def import_tasks(file, chunk_size):
+        """
+        Import tasks from a csv, jsonl or parquet file.
+        """
+        data = get_data()
+        ids = data.import_tasks(
+            file, chunk_size, progress=lambda n: click.echo(f"Read {n} tasks", err=True)
+        )
+        click.echo(f"Imported {len(ids)} tasks" + (f" as ids {ids[0]}-{ids[-1]}" if ids else ""))
+
+    @add_params(
+        click.argument("dest", default="-", type=click.Path(dir_okay=False, allow_dash=True)),
+        click.option(
+            "--format",
+            type=click.Choice(["csv", "ndjson", "ipc", "parquet"]),
+            default=None,
+            help="Output format, by default taken from the file suffix or csv for stdout.",
+        ),
+        click.option(
+            "--column",
+            "columns",
+            multiple=True,
+            type=click.Choice(["id", "task", "completed", "created", "worked"]),
+            help="Column to export, repeat for several. All by default.",
+        ),
+        click.option("--completed/--todo", default=None, help="Only completed or open tasks."),
+        click.option(
+            "--since",
+            default=None,
+            callback=parse_time,
+            help="Created at or after a date or e.g. 30d ago.",
+        ),
+        click.option(
+            "--until",
+            default=None,
+            callback=parse_time,
+            help="Created before a date or e.g. 7d ago.",
+        ),
+    )
+    def export_tasks(dest, format, columns, completed, since, until):
+        """
+        Export tasks to a file or stdout.
+        """
+        if dest == "-":
+            dest = click.open_file("-", "wb")
+            format = format or "csv"
+        get_data().export(dest, format, list(columns), completed, since, until)
+
+    @add_params(
+        click.argument("format", type=click.Choice(["parquet", "ipc", "sqlite"])),
+        click.option(
+            "--partitioned", is_flag=True, help="Keep a parquet store as one file per month."
+        ),
+    )
+    def convert(format, partitioned):
+        """
+        Convert the store to parquet, a memory-mapped Arrow IPC file or SQLite.
+        """
+        get_data().convert(format, partitioned)
+        click.echo(f"Converted the store to {format}" + (", partitioned" if partitioned else ""))
+
+    @add_params(
+        click.option(
+            "--period",
+            type=click.Choice(["day", "week", "month"]),
+            default="day",
+            help="Length of each row of the report.",
+        ),
+        click.option("--window", default=None, help="Rolling window, e.g. 14d, 8w or 6mo."),
+        click.option(
+            "--since",
+            default=None,
+            callback=parse_time,
+            help="Created at or after a date or e.g. 90d ago.",
+        ),
+    )
+    def stats(period, window, since):
+        """
+        Show tasks created, completed and time worked per day, week or month.
+        """
+        from tasker.task import pl_print
+
+        pl_print(get_data().stats(period, window, since), drop=None)
+
+    @add_params(
+        click.argument("query", nargs=-1, required=True),
+        click.option("--limit", type=int, default=20, help="Show at most this many tasks."),
+    )
+    def search(query, limit):
+        """
+        Find tasks by the words in their names, best matches first.
+        """
+        from tasker.task import pl_print
+
+        df = get_data().search(" ".join(query), limit)
+        if not len(df):
+            click.echo("No matching tasks.")
+            return
+        pl_print(df, drop=None)
 
     @add_params(
         click.option("--sort", default="created", help="Sort by column."),
         click.option("--reverse", default=True, help="Reverse sort order."),
+        click.option(
+            "--since",
+            default=None,
+            callback=parse_time,
+            help="Created at or after a date or e.g. 30d ago.",
+        ),
+        *WINDOW_OPTIONS,
+        click.option("--pager/--no-pager", default=False, help="Page the whole list."),
     )
-    def list_tasks(sort, reverse):
+    def list_tasks(sort, reverse, since, limit, offset, page, pager):
         """
         Show the task list.
         """
-        pl_print(data.formatted(data.df).sort(sort, descending=reverse), drop=None)
+        from tasker.task import TBL_ROWS, pl_print
+
+        limit, offset = window(limit, offset, page)
+        data = get_data()
+        order = dict(sort=sort, descending=reverse, since=since)
+        if pager:
+            pages = data.pages(limit or PAGE_SIZE, limit=limit, offset=offset, **order)
+            click.echo_via_pager(pages)
+            return
+        df = data.window(limit=limit, offset=offset, **order)
+        pl_print(df, drop=None, tbl_rows=TBL_ROWS if limit is None else max(limit, 1))
 
-    def complete():
+    @add_params(*WINDOW_OPTIONS)
+    def complete(limit, offset, page):
         """
         Mark a task as done.
         """
-        data.complete()
+        limit, offset = window(limit, offset, page)
+        data = get_data()
+        with data.transaction():
+            data.complete(limit=limit, offset=offset)
@@ -1,10 +1,12 @@
 """Command-line interface."""
 
 # %%
+import asyncio
 import re
 import shutil
+import signal
 import sys
-import time
+from contextlib import contextmanager
 
 import click
 
@@ -41,8 +43,12 @@ CHARS = {
     "8": " ████ \n██  ██\n ████ \n██  ██\n ████ ",
     "9": "██████\n██  ██\n██████\n    ██\n █████",
     ":": "  \n██\n  \n██\n  ",
+    ".": "  \n  \n  \n  \n██",
 }
+# split once, rendering only joins them
+GLYPHS = {char: glyph.splitlines() for char, glyph in CHARS.items()}
 CLEAR = "\033[H\033[J"
+TITLE_HSPACE = 2
 
 
 def str_to_duration(string):
@@ -54,29 +60,75 @@ def str_to_duration(string):
     return int(minutes or 0) * 60 + int(seconds or 0)
 
 
-def countdown(duration: int, title: str = None):
-    """Core countdown logic, separated from CLI interface."""
+def countdown(
+    duration: int,
+    title: str = None,
+    task_id=None,
+    tenths=False,
+    interval=None,
+    on_start=None,
+    notify=False,
+):
+    """Core countdown logic, separated from CLI interface.
+
+    The display is a consumer of a `tasker.timers.Timer`, redrawn by a `Renderer`
+    on each tick. Returns the timer, whose `elapsed` is the time counted down
+    before it expired or was interrupted.
+
+    Parameters
+    ----------
+    tenths : bool
+        Show and tick tenths of a second.
+    interval : float, optional
+        Seconds between ticks, by default a tenth with `tenths` and a second otherwise.
+    on_start : callable, optional
+        Called with the timer before it starts, to subscribe to its ticks.
+    notify : bool
+        Notify when the timer expires, through `tasker.notify.get_dispatcher`,
+        which queues the notification so the countdown never waits for it.
+    """
+    from tasker.timers import TimerEngine
+
     if isinstance(duration, str):
         duration = str_to_duration(duration)
 
+    engine = TimerEngine(interval or (0.1 if tenths else 1.0))
+    timer = engine.add(task_id, duration)
+    renderer = Renderer(title, tenths)
+    timer.on_tick(lambda timer, remaining: renderer.draw(remaining))
+    if on_start is not None:
+        on_start(timer)
+    if notify:
+        from tasker.notify import get_dispatcher
+
+        dispatcher = get_dispatcher()
+        timer.on_expire(
+            lambda timer: timer.expired and dispatcher.notify(title or "Countdown", "Time's up!")
+        )
+
     enable_ansi_escape_codes()
     print(ENABLE_ALT_BUFFER + HIDE_CURSOR, end="")
     try:
-        for n in range(duration, -1, -1):
-            lines = get_number_lines(n)
-            print_full_screen(lines, title)
-            time.sleep(1)
+        with renderer.watch_resize():
+            asyncio.run(engine.run())
     except KeyboardInterrupt:
         pass
     finally:
         print(SHOW_CURSOR + DISABLE_ALT_BUFFER, end="")
+    return timer
 
 
 @click.command()
 @click.version_option(package_name="countdown-cli")
 @click.argument("duration", type=str_to_duration)
 @click.option("--title", type=str, default=None, help="Title for the countdown clock.")
-def countdown_cli(duration, title):
+@click.option("--tenths", is_flag=True, help="Show tenths of a second.")
+@click.option(
+    "--notify/--no-notify",
+    default=True,
+    help="Notify when the time is up, through the sinks in TASKER_NOTIFY.",
+)
+def countdown_cli(duration, title, tenths, notify):
     """Countdown from the given duration to 0.
 
     DURATION should be a number followed by m or s for minutes or seconds.
@@ -88,7 +140,7 @@ def countdown_cli(duration, title):
     - 45s (45 seconds)
     - 2m30s (2 minutes and 30 seconds)
     """  # noqa: D301
-    countdown(duration, title)
+    countdown(duration, title, tenths=tenths, notify=notify)
 
 
 def enable_ansi_escape_codes():
@@ -109,19 +161,28 @@ def enable_ansi_escape_codes():
         )
 
 
+def layout(lines, title, size):
+    """Place the title and the lines in the middle of a terminal of `size`.
+
+    Returns
+    -------
+    tuple of (list of str, int, int)
+        The lines with the title above them, and the zero based row and column
+        of the first line.
+    """
+    width, height = size
+    max_length = max(len(line) for line in lines)
+    lines = add_title_lines(lines, title or "", hspace=TITLE_HSPACE)
+    # subtract the hspace from the vertical pad to center the countdown clock
+    top = (height - len(lines) - 2 - TITLE_HSPACE) // 2
+    return lines, max(top, 0), max((width - max_length) // 2, 0)
+
+
 def print_full_screen(lines, title=None):
     """Print the given lines centered in the middle of the terminal window."""
-    width, height = shutil.get_terminal_size()
-    max_length = max(len(line) for line in lines)
-    width -= max_length
-    # insert title above the countdown
-    title_hspace = 2
-    lines = add_title_lines(lines, title or "", hspace=title_hspace)
-    height -= len(lines) + 2
-    # subtract the hspace from the vertical_pad to center the countdown clock
-    vertical_pad = "\n" * ((height - title_hspace) // 2)
-    padded_text = "\n".join(" " * (width // 2) + line for line in lines)
-    print(CLEAR + vertical_pad + padded_text, flush=True)
+    lines, top, left = layout(lines, title, shutil.get_terminal_size())
+    padded_text = "\n".join(" " * left + line for line in lines)
+    print(CLEAR + "\n" * top + padded_text, flush=True)
 
 
 def add_title_lines(lines, title, hspace):
@@ -131,17 +192,92 @@ def add_title_lines(lines, title, hspace):
     return [title_line] + [""] * hspace + lines
 
 
-def get_number_lines(seconds):
+def time_string(seconds, tenths=False):
+    """Format seconds as MM:SS, or MM:SS.t with `tenths`."""
+    if tenths:
+        whole, tenth = divmod(round(seconds * 10), 10)
+        return f"{time_string(whole)}.{tenth}"
+    minutes, seconds = divmod(round(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def get_number_lines(seconds, tenths=False):
     """Return list of lines which make large MM:SS glyphs for given seconds."""
-    lines = [""] * 5
-    minutes, seconds = divmod(seconds, 60)
-    time = f"{minutes:02d}:{seconds:02d}"
-    for char in time:
-        char_lines = CHARS[char].splitlines()
-        for i, line in enumerate(char_lines):
-            lines[i] += line + " "
-    # lines = ["Task title"] + [""] * 3 + lines
-    return lines
+    return get_lines(time_string(seconds, tenths))
+
+
+def get_lines(text):
+    """Lines of the large glyphs for `text`, one space after each."""
+    return [" ".join(rows) + " " for rows in zip(*(GLYPHS[char] for char in text))]
+
+
+class Renderer:
+    """Draws the countdown, rewriting only the characters that changed since the last frame.
+
+    The terminal size is read once and again only after a SIGWINCH, which also
+    triggers a full redraw. Each frame is a single write to `stream`.
+
+    Parameters
+    ----------
+    title : str, optional
+        Title shown above the clock.
+    tenths : bool
+        Show tenths of a second.
+    stream : file object, optional
+        Where to draw, by default stdout.
+    """
+
+    def __init__(self, title=None, tenths=False, stream=None) -> None:
+        self.title = title
+        self.tenths = tenths
+        self.stream = stream or sys.stdout
+        self.size = None
+        self.shown = None
+        self.origin = None
+
+    def resize(self, *_):
+        """Read the terminal size and redraw everything on the next frame."""
+        self.size = shutil.get_terminal_size()
+        self.shown = None
+
+    @contextmanager
+    def watch_resize(self):
+        """Call `resize` on SIGWINCH while in the block."""
+        if not hasattr(signal, "SIGWINCH"):  # pragma: no cover
+            yield
+            return
+        previous = signal.signal(signal.SIGWINCH, self.resize)
+        try:
+            yield
+        finally:
+            signal.signal(signal.SIGWINCH, previous)
+
+    def frame(self, text):
+        """Escape codes drawing `text`, relative to the `shown` frame."""
+        if self.size is None:
+            self.resize()
+        if self.shown is None or len(self.shown) != len(text):
+            lines, top, left = layout(get_lines(text), self.title, self.size)
+            # the clock starts below the title and its spacing, escape codes count from 1
+            self.origin = top + TITLE_HSPACE + 2, left + 1
+            return CLEAR + "\n" * top + "\n".join(" " * left + line for line in lines)
+
+        row, column = self.origin
+        codes = []
+        for old, new in zip(self.shown, text):
+            if old != new:
+                for i, line in enumerate(GLYPHS[new]):
+                    codes.append(f"\033[{row + i};{column}H{line}")
+            column += len(GLYPHS[new][0]) + 1
+        return "".join(codes)
+
+    def draw(self, remaining):
+        text = time_string(remaining, self.tenths)
+        if text == self.shown:
+            return
+        self.stream.write(self.frame(text))
+        self.stream.flush()
+        self.shown = text
 
 
 if __name__ == "__main__":
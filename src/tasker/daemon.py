@@ -0,0 +1,265 @@
+# %%
+"""Resident tasker process serving CLI commands over a Unix socket.
+
+``tasker serve`` keeps the store and the click command tree loaded and runs each
+command a client sends in process, one at a time, with the client's stdin and
+output streamed over the socket. Commands waiting on the user, which would hold
+up every other client, run in the client instead. `forward` is the client side, used by the
+``tasker`` entry point, so it only imports the standard library.
+
+Every message is a frame: one kind byte, the payload length and the payload.
+The client sends a request (``r``, the working directory and the arguments
+separated by NUL) followed by its stdin (``i``, empty at EOF). The daemon answers
+with stdout (``o``) and stderr (``e``) and ends with the exit code (``x``).
+"""
+
+import io
+import os
+import select
+import socket
+import struct
+import sys
+import zlib
+
+FRAME = struct.Struct("!cI")
+
+# commands that drive the terminal or prompt the user, so always run in the client
+LOCAL_COMMANDS = {"countdown", "todo", "serve", "new", "delete", "complete"}
+
+# options making any command wait on the user
+LOCAL_OPTIONS = {"--pager"}
+
+# options of the tasker group taking a value, which is not the command name
+ROOT_VALUE_OPTIONS = {"--profile-output"}
+
+
+def socket_path():
+    """Path of the daemon socket for the current store.
+
+    There is one socket per ``TASKER_STORE``, ``TASKER_SOCKET`` overrides it.
+    """
+    if path := os.environ.get("TASKER_SOCKET"):
+        return path
+    store = os.environ.get("TASKER_STORE")
+    name = f"{zlib.crc32(os.path.abspath(store).encode()):08x}" if store else "default"
+    runtime = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime, f"tasker-{os.getuid()}-{name}.sock")
+
+
+def send_frame(sock, kind, payload=b""):
+    sock.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+
+def recv_exact(sock, n):
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("tasker daemon closed the connection.")
+        data += chunk
+    return data
+
+
+def recv_frame(sock):
+    kind, length = FRAME.unpack(recv_exact(sock, FRAME.size))
+    return kind, recv_exact(sock, length)
+
+
+def command_name(argv):
+    """The name of the command run by a tasker command line, None for none."""
+    args = iter(argv)
+    for arg in args:
+        if arg == "--":
+            return next(args, None)
+        if arg in ROOT_VALUE_OPTIONS:
+            next(args, None)
+        elif not arg.startswith("-"):
+            return arg
+    return None
+
+
+def runs_locally(argv):
+    """Whether a tasker command line has to run in the client rather than the daemon."""
+    options = set(argv[: argv.index("--")] if "--" in argv else argv)
+    return command_name(argv) in LOCAL_COMMANDS or bool(options & LOCAL_OPTIONS)
+
+
+def forward(argv, stdin=None, stdout=None, stderr=None):
+    """Run a command on the daemon, streaming stdin to it and its output back.
+
+    Parameters
+    ----------
+    argv : list of str
+        The command line, without the program name.
+    stdin : int, optional
+        File descriptor to read stdin from, by default the process's stdin.
+    stdout, stderr : binary file object, optional
+        Where to write the output, by default the process's stdout and stderr.
+
+    Returns
+    -------
+    int or None
+        The exit code of the command, None when no daemon is serving or the
+        command has to run in the client.
+    """
+    if runs_locally(argv):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path())
+    except OSError:
+        sock.close()
+        return None
+
+    stdout = stdout or sys.stdout.buffer
+    stderr = stderr or sys.stderr.buffer
+    if stdin is None:
+        try:
+            stdin = sys.stdin.fileno()
+        except (AttributeError, ValueError, OSError):
+            stdin = None
+    outputs = {b"o": stdout, b"e": stderr}
+    with sock:
+        send_frame(sock, b"r", "\0".join([os.getcwd(), *argv]).encode())
+        if stdin is None:
+            send_frame(sock, b"i")
+        while True:
+            readable, _, _ = select.select([sock] if stdin is None else [sock, stdin], [], [])
+            if stdin in readable:
+                data = os.read(stdin, 64 * 1024)
+                send_frame(sock, b"i", data)
+                if not data:
+                    stdin = None
+            if sock in readable:
+                kind, payload = recv_frame(sock)
+                if kind == b"x":
+                    return int(payload)
+                outputs[kind].write(payload)
+                outputs[kind].flush()
+
+
+class FrameWriter(io.RawIOBase):
+    """Stream sending everything written to it to the client as frames of one kind."""
+
+    def __init__(self, sock, kind) -> None:
+        self.sock = sock
+        self.kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        send_frame(self.sock, self.kind, bytes(b))
+        return len(b)
+
+
+class FrameReader(io.RawIOBase):
+    """Stream reading the stdin frames sent by the client."""
+
+    def __init__(self, sock) -> None:
+        self.sock = sock
+        self.pending = b""
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending and not self.eof:
+            _, self.pending = recv_frame(self.sock)
+            self.eof = not self.pending
+        n = min(len(b), len(self.pending))
+        b[:n], self.pending = self.pending[:n], self.pending[n:]
+        return n
+
+
+def text_stream(raw, write):
+    buffered = io.BufferedWriter(raw) if write else io.BufferedReader(raw)
+    return io.TextIOWrapper(buffered, encoding="utf-8", line_buffering=write, write_through=write)
+
+
+def handle(conn, cli):
+    """Run the command sent on `conn` with `cli`, its stdin and output on the socket."""
+    kind, payload = recv_frame(conn)
+    assert kind == b"r", f"Expected a request, got {kind!r}."
+    cwd, *argv = payload.decode().split("\0")
+    client = (
+        text_stream(FrameReader(conn), write=False),
+        text_stream(FrameWriter(conn, b"o"), write=True),
+        text_stream(FrameWriter(conn, b"e"), write=True),
+    )
+    streams = sys.stdin, sys.stdout, sys.stderr
+    served_from = os.getcwd()
+    sys.stdin, sys.stdout, sys.stderr = client
+    try:
+        os.chdir(cwd)
+        cli.main(argv, prog_name="tasker")
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        import traceback
+
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = streams
+        os.chdir(served_from)
+    for stream in client[1:]:
+        stream.flush()
+    send_frame(conn, b"x", str(code).encode())
+
+
+def serve(path=None):
+    """Serve commands on a Unix socket until interrupted.
+
+    The store and the command tree are loaded once, up front, and the store's
+    cache stays warm between commands. Commands run one at a time.
+
+    Parameters
+    ----------
+    path : str, optional
+        Socket to listen on, by default `socket_path`.
+    """
+    import signal
+
+    from tasker.__main__ import cli
+    from tasker.task import get_data
+
+    path = path or socket_path()
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with probe:
+        if probe.connect_ex(path) == 0:
+            raise RuntimeError(f"A tasker daemon is already serving on {path}.")
+    if os.path.exists(path):
+        # left behind by a daemon that was killed
+        os.unlink(path)
+
+    commands = cli()
+    # load the store into the cache
+    _ = get_data().df
+    # leave through the finally block, so the socket is removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(path)
+        os.chmod(path, 0o600)
+        server.listen()
+        print(f"Serving tasker on {path}", flush=True)
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    handle(conn, commands)
+                except OSError as e:
+                    # the client went away, keep serving the others
+                    print(f"Lost client: {e}", file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+# %%
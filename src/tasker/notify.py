@@ -0,0 +1,246 @@
+# %%
+"""Notifications for expiring timers, sent without blocking the timers.
+
+A `Dispatcher` hands each notification to a worker thread through a bounded
+queue, so a timer expiring in the countdown event loop only enqueues it and
+never waits for a notifier process. When the queue is full the notification is
+dropped rather than blocking. The worker passes every notification to each of
+its sinks in turn:
+
+- `Bell`, the terminal bell.
+- `Command`, a command line built from a template and `CmdOptions`, such as
+  ``notify-send``, ``paplay`` or macOS ``say``.
+- `FileSink`, a line appended to a file or written to a FIFO, to watch
+  notifications from another program or a test.
+
+``TASKER_NOTIFY`` picks the sinks of `get_dispatcher`, see `sinks`.
+"""
+
+import atexit
+import os
+import queue
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+from functools import cache
+from pathlib import Path
+
+from loguru import logger
+
+from tasker.utils.cmd_options import CmdOptions
+
+# played by paplay when no sound is given
+FREEDESKTOP_SOUND = "/usr/share/sounds/freedesktop/stereo/complete.oga"
+
+
+class Bell:
+    """Ring the terminal bell."""
+
+    def __init__(self, stream=None) -> None:
+        self.stream = stream
+
+    def __repr__(self):
+        return "Bell()"
+
+    def send(self, title, message):
+        # stderr, so the bell is not mixed into the countdown frames
+        stream = self.stream or sys.stderr
+        stream.write("\a")
+        stream.flush()
+
+
+class Command:
+    """Run a command for each notification.
+
+    Parameters
+    ----------
+    program : str
+        The program to run.
+    *args : str
+        Its arguments, after the options, formatted with ``{title}`` and
+        ``{message}``.
+    options : CmdOptions, optional
+        ``--key=value`` options passed before the arguments.
+    timeout : float
+        Seconds to wait for the command before killing it.
+
+    Examples
+    --------
+    >>> Command("say", "{message}", options=CmdOptions(voice="Daniel")).argv("", "Hours up!")
+    ['say', '--voice=Daniel', 'Hours up!']
+    """
+
+    def __init__(self, program, *args, options=None, timeout=10.0) -> None:
+        self.program = program
+        self.args = args
+        self.options = options if options is not None else CmdOptions()
+        self.timeout = timeout
+
+    def __repr__(self):
+        return f"Command({shlex.join([self.program, *self.options, *self.args])!r})"
+
+    @classmethod
+    def from_template(cls, template, **kwargs):
+        """A command from a shell-like template, e.g. ``"notify-send {title} {message}"``."""
+        return cls(*shlex.split(template), **kwargs)
+
+    def argv(self, title, message):
+        args = (arg.format(title=title, message=message) for arg in self.args)
+        return [self.program, *self.options, *args]
+
+    def send(self, title, message):
+        subprocess.run(
+            self.argv(title, message),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=self.timeout,
+            check=True,
+        )
+
+
+class FileSink:
+    """Append each notification to a file, or write it to a FIFO, as one line.
+
+    A FIFO is opened without blocking, so the notification fails rather than
+    waits when nothing is reading it.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+
+    def __repr__(self):
+        return f"FileSink({str(self.path)!r})"
+
+    def send(self, title, message):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_NONBLOCK, 0o644)
+        try:
+            os.write(fd, f"{title}\t{message}\n".encode())
+        finally:
+            os.close(fd)
+
+
+def available_sinks():
+    """The bell and the desktop notifiers installed on this machine."""
+    found = [Bell()]
+    if shutil.which("notify-send"):
+        found.append(Command("notify-send", "{title}", "{message}"))
+    if shutil.which("paplay") and os.path.exists(FREEDESKTOP_SOUND):
+        found.append(Command("paplay", FREEDESKTOP_SOUND))
+    if shutil.which("say"):
+        # Alex, Daniel, Fiona, Fred, Samantha or Victoria
+        found.append(Command("say", "{message}", options=CmdOptions(voice="Daniel")))
+    return found
+
+
+def sinks(spec="auto"):
+    """The sinks described by `spec`, a comma separated list of:
+
+    - ``auto``: the bell and the notifiers found, see `available_sinks`.
+    - ``bell``: the terminal bell.
+    - ``file:PATH``: lines appended to a file or FIFO.
+    - ``command:TEMPLATE``: a command line with ``{title}`` and ``{message}``,
+      which takes the rest of the spec, commas included.
+    - ``none``: no notifications.
+    """
+    found, items = [], spec.split(",")
+    for i, item in enumerate(items):
+        name, _, arg = item.strip().partition(":")
+        match name:
+            case "auto":
+                found += available_sinks()
+            case "bell":
+                found.append(Bell())
+            case "file":
+                found.append(FileSink(arg))
+            case "command":
+                found.append(Command.from_template(",".join([arg, *items[i + 1 :]])))
+                break
+            case "none" | "":
+                pass
+            case _:
+                raise ValueError(f"Unknown notification sink {name!r}.")
+    return found
+
+
+class Dispatcher:
+    """Send notifications to sinks from a worker thread, behind a bounded queue.
+
+    The worker starts with the first notification. At exit, the notifications
+    still queued are sent, waiting at most `timeout` seconds.
+
+    Parameters
+    ----------
+    sinks : list
+        Objects with a ``send(title, message)`` method, called in order.
+    maxsize : int
+        Notifications waiting to be sent before new ones are dropped.
+    timeout : float
+        Seconds `close` waits for the queued notifications.
+    """
+
+    def __init__(self, sinks, maxsize=8, timeout=5.0) -> None:
+        self.sinks = list(sinks)
+        self.queue = queue.Queue(maxsize)
+        self.timeout = timeout
+        self.dropped = 0
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Dispatcher({self.sinks})"
+
+    def notify(self, title, message):
+        """Queue a notification without waiting, False when the queue is full and it is dropped."""
+        if not self.sinks:
+            return True
+        self._start()
+        try:
+            self.queue.put_nowait((title, message))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _start(self):
+        with self._lock:
+            if self._worker is None:
+                atexit.register(self.close)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="tasker-notify", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while (item := self.queue.get()) is not None:
+            for sink in self.sinks:
+                try:
+                    sink.send(*item)
+                except Exception as e:
+                    logger.warning(f"Notification by {sink!r} failed: {e}")
+            self.queue.task_done()
+        self.queue.task_done()
+
+    def join(self):
+        """Wait until every queued notification has been sent."""
+        self.queue.join()
+
+    def close(self):
+        """Send the queued notifications and stop the worker."""
+        if self._worker is None or not self._worker.is_alive():
+            return
+        try:
+            self.queue.put(None, timeout=self.timeout)
+        except queue.Full:
+            return
+        self._worker.join(self.timeout)
+
+
+@cache
+def get_dispatcher():
+    """The dispatcher of the sinks in ``TASKER_NOTIFY``, ``auto`` by default."""
+    return Dispatcher(sinks(os.environ.get("TASKER_NOTIFY", "auto")))
+
+
+# %%
@@ -0,0 +1,270 @@
+# %%
+"""Full-text search over task names, with an inverted index kept beside the store.
+
+Task names are split into lowercase words. The index holds the sorted vocabulary
+of words and, for each word, the ids of the tasks using it, as two Arrow IPC files
+memory-mapped on read. A query word matches a task word exactly, as a prefix or
+as a substring, which is found by scanning the vocabulary rather than the tasks.
+Tasks matching every query word are ranked by how well they match, then newest
+first.
+
+Commits are not merged into the files. Each one is appended to a delta log, one
+JSON line with the names it changed, and the log is replayed on top of the files
+by every search until it grows long enough for the index to be rebuilt. Every
+line records the version of the store after its commit, so an index that missed
+a change, such as a store replaced with `Data.write`, is found stale and rebuilt.
+"""
+
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+from uuid import uuid4
+
+import polars as pl
+from polars import col, lit
+
+from tasker.storage import atomic_write
+
+WORD = r"\w+"
+# score of a query word matching a word of a task
+EXACT, PREFIX, SUBSTRING = 3, 2, 1
+
+
+def words(text):
+    """The distinct lowercase words of `text`, in order."""
+    return list(dict.fromkeys(re.findall(WORD, text.lower())))
+
+
+def postings(tasks):
+    """Each distinct word of each task, as ``word`` and ``id`` columns sorted by both.
+
+    Parameters
+    ----------
+    tasks : pl.DataFrame or pl.LazyFrame
+        Tasks with ``id`` and ``task`` columns.
+    """
+    return (
+        tasks.lazy()
+        .select("id", col("task").str.to_lowercase().str.extract_all(WORD).alias("word"))
+        .explode("word")
+        .drop_nulls()
+        .unique()
+        .sort("word", "id")
+        .select("word", "id")
+        .collect()
+    )
+
+
+def score(term):
+    """Score of the ``word`` column matching `term`, for words containing it."""
+    word = col("word")
+    return (
+        pl.when(word == term)
+        .then(lit(EXACT, pl.Int8))
+        .when(word.str.starts_with(term))
+        .then(lit(PREFIX, pl.Int8))
+        .otherwise(lit(SUBSTRING, pl.Int8))
+        .alias("score")
+    )
+
+
+class SearchIndex:
+    """Inverted index over the task names of a store, in a ``<name>.search`` directory.
+
+    `build` indexes the whole store, `record` logs each commit and `search` answers
+    queries. The files of a build are named after its id, given by ``meta.json``,
+    which is replaced last, so a build never changes files a reader has open.
+    Writers must hold the store lock, readers its shared lock.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the store.
+    """
+
+    # commits replayed by each search before the index is rebuilt
+    max_delta = 1000
+
+    def __init__(self, fp) -> None:
+        fp = Path(fp)
+        self.dir = fp.with_name(fp.name + ".search")
+        self.meta_path = self.dir / "meta.json"
+        # the loaded build, (build, vocabulary, ids)
+        self._files = None
+        # the replayed delta log, (build, size, version, commits, {id: task or None})
+        self._delta = None
+
+    def _paths(self, build):
+        return (
+            self.dir / f"vocab-{build}.arrow",
+            self.dir / f"ids-{build}.arrow",
+            self.dir / f"delta-{build}.jsonl",
+        )
+
+    def _meta(self):
+        try:
+            return json.loads(self.meta_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def build(self, tasks, version):
+        """Index `tasks`, a frame with ``id`` and ``task`` columns, as of store `version`."""
+        rows = postings(tasks)
+        vocab = rows.group_by("word", maintain_order=True).agg(pl.len().cast(pl.Int64))
+        vocab = vocab.select("word", (col("len").cum_sum() - col("len")).alias("start"), "len")
+        build = uuid4().hex
+        vocab_path, ids_path, _ = self._paths(build)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        vocab.write_ipc(vocab_path)
+        rows.select("id").write_ipc(ids_path)
+        old = self._meta()
+        meta = json.dumps({"build": build, "version": repr(version)})
+        atomic_write(self.meta_path, lambda tmp: Path(tmp).write_text(meta))
+        if old is not None and old["build"] != build:
+            for path in self._paths(old["build"]):
+                path.unlink(missing_ok=True)
+
+    def _replay(self, meta):
+        """The delta log of the build in `meta`, re-read when it has grown."""
+        delta_path = self._paths(meta["build"])[2]
+        try:
+            size = delta_path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if self._delta is None or self._delta[:2] != (meta["build"], size):
+            version, commits, tasks = meta["version"], 0, {}
+            if size:
+                with open(delta_path, "rb") as f:
+                    data = f.read(size)
+                # a line still being written is left for the next read
+                for line in data[: data.rfind(b"\n") + 1].splitlines():
+                    entry = json.loads(line)
+                    version, commits = entry["version"], commits + 1
+                    tasks.update(entry["tasks"])
+            self._delta = meta["build"], size, version, commits, tasks
+        return self._delta
+
+    def version(self):
+        """Version of the store the index is up to date with, None without an index."""
+        meta = self._meta()
+        return None if meta is None else self._replay(meta)[2]
+
+    def stale(self, version):
+        """Whether the index has to be rebuilt before searching the store at `version`."""
+        meta = self._meta()
+        if meta is None:
+            return True
+        _, _, indexed, commits, _ = self._replay(meta)
+        return indexed != repr(version) or commits >= self.max_delta
+
+    def record(self, previous, version, removed=None, added=None):
+        """Log a commit taking the store from version `previous` to `version`.
+
+        `removed` and `added` are the rows the commit touched, before and after it,
+        with ``id`` and ``task`` columns. Nothing is logged unless the index is up
+        to date with `previous`, it is then rebuilt by the next search.
+        """
+        if self.version() != repr(previous):
+            return
+        before = {} if removed is None else dict(removed.select("id", "task").iter_rows())
+        after = {} if added is None else dict(added.select("id", "task").iter_rows())
+        changed = [[id, task] for id, task in after.items() if before.get(id) != task]
+        changed += [[id, None] for id in before.keys() - after.keys()]
+        line = json.dumps({"version": repr(version), "tasks": changed}) + "\n"
+        fd = os.open(self._paths(self._meta()["build"])[2], os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+    def search(self, query, limit=20):
+        """Ids of the tasks matching every word of `query`, best match first.
+
+        Tasks score 3 for each query word equal to one of their words, 2 for a
+        prefix of one and 1 for a substring, and ties go to the newest task.
+
+        Parameters
+        ----------
+        query : str
+            Words to look for, case insensitive.
+        limit : int, optional
+            Return at most this many ids, all of them when None.
+
+        Returns
+        -------
+        list of int
+            Empty when there is no index, see `stale`.
+        """
+        terms, meta = words(query), self._meta()
+        if not terms or meta is None:
+            return []
+        if self._files is None or self._files[0] != meta["build"]:
+            vocab_path, ids_path, _ = self._paths(meta["build"])
+            vocab = pl.read_ipc(vocab_path, memory_map=True)
+            self._files = meta["build"], vocab, pl.read_ipc(ids_path, memory_map=True)["id"]
+        _, vocab, ids = self._files
+        changes = self._replay(meta)[4]
+        changed = pl.Series("id", list(changes), dtype=pl.Int64)
+        live = [(id, task) for id, task in changes.items() if task is not None]
+        delta = postings(
+            pl.DataFrame(live, schema={"id": pl.Int64, "task": pl.String}, orient="row")
+        )
+
+        # the best score of each task for each term, indexed by id
+        size = max(ids.max() or 0, changed.max() or 0) + 1
+        scores = {}
+        for i, term in enumerate(terms):
+            contains = col("word").str.contains(term, literal=True)
+            best = pl.zeros(size, pl.Int8, eager=True)
+            # written in increasing score, so each task is left with its best match
+            best.scatter(
+                *self._gather(vocab.filter(contains).select("start", "len", score(term)), ids)
+            )
+            # names changed since the build replace their indexed words
+            best.scatter(changed, 0)
+            new = delta.filter(contains).select("id", score(term)).sort("score")
+            best.scatter(new["id"], new["score"])
+            scores[f"term_{i}"] = best
+
+        matches = (
+            pl.DataFrame(scores)
+            .with_row_index("id")
+            .filter(pl.all_horizontal(pl.exclude("id") > 0))
+            .select(
+                col("id").cast(pl.Int64),
+                pl.sum_horizontal(pl.exclude("id").cast(pl.Int32)).alias("score"),
+            )
+        )
+        if limit is not None:
+            matches = matches.top_k(limit, by=["score", "id"])
+        return matches.sort("score", "id", descending=True)["id"].to_list()
+
+    @staticmethod
+    def _gather(hits, ids):
+        """Ids and scores of the tasks using the words in `hits`, in increasing score.
+
+        `hits` are vocabulary rows with a ``score``, each word's ids are the slice
+        of `ids` given by its ``start`` and ``len``.
+        """
+        hits = hits.sort("score")
+        if 0 < len(hits) <= 1000:
+            # a few words, often each used by many tasks
+            rows = hits.rows()
+            return (
+                pl.concat([ids.slice(start, n) for start, n, _ in rows]),
+                pl.concat([pl.repeat(s, n, dtype=pl.Int8, eager=True) for _, n, s in rows]),
+            )
+        positions = hits.select(
+            pl.int_ranges("start", col("start") + col("len")).alias("i"), "score"
+        ).explode("i")
+        return ids.gather(positions["i"]), positions["score"]
+
+    def remove(self):
+        """Delete the index."""
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self._files = self._delta = None
+
+
+# %%
@@ -0,0 +1,75 @@
+# %%
+"""Time-tracking reports over the task store.
+
+Tasks are bucketed by the period they were created in with ``dt.truncate`` and a
+plain ``group_by``, which gives the same buckets as ``group_by_dynamic`` with a
+period equal to `every` but, unlike it, runs on the streaming engine. Only the
+aggregated periods, one row each, are then sorted and given rolling windows.
+"""
+
+import polars as pl
+from polars import col
+
+# bucket size and default rolling window of each report period
+PERIODS = {"day": ("1d", "7d"), "week": ("1w", "4w"), "month": ("1mo", "3mo")}
+
+
+def report(lf, every="1d", window="7d"):
+    """Tasks created and completed and time worked per period.
+
+    Parameters
+    ----------
+    lf : pl.LazyFrame
+        Tasks with ``created``, ``completed`` and ``worked`` columns, such as
+        `Data.scan`.
+    every : str
+        Period of each row, a polars duration string such as "1d", "1w" or "1mo".
+    window : str
+        Length of the rolling window, also a polars duration string.
+
+    Returns
+    -------
+    pl.DataFrame
+        One row per period with tasks, sorted by ``period``:
+
+        - created, completed: tasks created in the period and how many of them are done.
+        - rate: the fraction of them that are done.
+        - worked: time worked on them.
+        - open: tasks created up to the end of the period and not yet done.
+        - worked_{window}, rate_{window}: time worked and the fraction done over the
+          rolling window ending with the period.
+    """
+    periods = (
+        lf.select(
+            col("created").dt.truncate(every).cast(pl.Date).alias("period"),
+            col("completed"),
+            col("worked"),
+        )
+        .group_by("period")
+        .agg(
+            pl.len().alias("created"),
+            col("completed").sum().cast(pl.UInt32),
+            col("worked").sum(),
+        )
+        .collect(streaming=True)
+        .drop_nulls("period")
+        .sort("period")
+    )
+
+    def rolling(name):
+        # summed as integers, rolling sums are not defined on durations
+        return col(name).cast(pl.Int64).rolling_sum_by("period", window_size=window)
+
+    return periods.select(
+        "period",
+        "created",
+        "completed",
+        (col("completed") / col("created")).round(3).alias("rate"),
+        "worked",
+        (col("created") - col("completed")).cum_sum().alias("open"),
+        rolling("worked").cast(pl.Duration("us")).alias(f"worked_{window}"),
+        (rolling("completed") / rolling("created")).round(3).alias(f"rate_{window}"),
+    )
+
+
+# %%
@@ -0,0 +1,1129 @@
+# %%
+import fcntl
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from uuid import uuid4
+
+import polars as pl
+from polars import col, lit
+
+
+def atomic_write(path, write):
+    """Write a file by writing a temporary file beside it and renaming it into place.
+
+    Readers see either the old or the new file, never a partially written one.
+
+    Parameters
+    ----------
+    path : str or Path
+        Destination of the file.
+    write : callable
+        Called with the temporary path, should write the file contents to it.
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def atomic_write_parquet(df, path, **kwargs):
+    atomic_write(path, lambda tmp: df.write_parquet(tmp, **kwargs))
+
+
+def atomic_write_pickle(obj, path):
+    atomic_write(path, lambda tmp: Path(tmp).write_bytes(pickle.dumps(obj)))
+
+
+class ParquetFile:
+    """Base layout keeping the whole store in a single parquet file.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the parquet file.
+    """
+
+    partitioned = False
+    format = "parquet"
+
+    def __init__(self, fp) -> None:
+        self.fp = Path(fp)
+
+    def key(self):
+        """Identify the current version of the file by its mtime, size and inode."""
+        try:
+            st = self.fp.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def scan(self, since=None):
+        """Lazily scan the file, None if it does not exist yet."""
+        if not self.fp.exists():
+            return None
+        return pl.scan_parquet(self.fp)
+
+    def partitions(self, df):
+        return None
+
+    def write(self, df, partitions=None, **kwargs):
+        atomic_write_parquet(df, self.fp, **kwargs)
+
+    def extend(self, lf, partitions=None, **kwargs):
+        """Append the rows of `lf`, streaming the old and new rows into a new file."""
+        old = self.scan()
+        lf = lf if old is None else pl.concat([old, lf])
+        atomic_write(self.fp, lambda tmp: self._sink(lf, tmp, **kwargs))
+
+    @staticmethod
+    def _sink(lf, path, **kwargs):
+        lf.sink_parquet(path, **kwargs)
+
+
+class IpcFile(ParquetFile):
+    """Base layout keeping the whole store in a single uncompressed Arrow IPC file.
+
+    The file is memory-mapped when read, so loading it does not decode or copy the
+    columns, and concurrent processes share its pages in the OS page cache. Writes
+    replace the file atomically, so a map held by a reader stays valid.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the IPC file.
+    """
+
+    format = "ipc"
+
+    def scan(self, since=None):
+        """Lazily scan the memory-mapped file, None if it does not exist yet."""
+        if not self.fp.exists():
+            return None
+        return pl.scan_ipc(self.fp, memory_map=True)
+
+    def write(self, df, partitions=None, **kwargs):
+        # compressed buffers would have to be decompressed, so could not be mapped
+        atomic_write(self.fp, lambda tmp: df.write_ipc(tmp, compression="uncompressed"))
+
+    @staticmethod
+    def _sink(lf, path, **kwargs):
+        lf.sink_ipc(path, compression=None)
+
+
+class PartitionedParquet:
+    """Base layout keeping the store as a hive-partitioned dataset.
+
+    Rows live in ``<fp>/year=YYYY/month=M/data.parquet`` by the month they were
+    created in (``year=0/month=0`` when that is unknown), so a write only
+    rewrites the partitions it touches and date-bounded scans skip the others.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the dataset directory.
+    """
+
+    partitioned = True
+    format = "parquet"
+
+    def __init__(self, fp) -> None:
+        self.fp = Path(fp)
+
+    @staticmethod
+    def partition_exprs():
+        created = col("created")
+        return [
+            created.dt.year().fill_null(0).cast(pl.Int64).alias("year"),
+            created.dt.month().fill_null(0).cast(pl.Int64).alias("month"),
+        ]
+
+    def files(self):
+        return sorted(self.fp.glob("year=*/month=*/*.parquet"))
+
+    def key(self):
+        """Identify the current version of the dataset by the stats of its files."""
+        if not self.fp.is_dir():
+            return None
+        key = []
+        for path in self.files():
+            st = path.stat()
+            key.append((str(path.relative_to(self.fp)), st.st_mtime_ns, st.st_size, st.st_ino))
+        return tuple(key)
+
+    def scan(self, since=None):
+        """Lazily scan the dataset, only reading partitions from `since` onwards."""
+        if not self.files():
+            return None
+        lf = pl.scan_parquet(self.fp / "**/*.parquet", hive_partitioning=True)
+        if since is not None:
+            year, month = since.year, since.month
+            # keep the partition of tasks with no created time, they may match
+            lf = lf.filter(
+                (col("year") > year)
+                | ((col("year") == year) & (col("month") >= month))
+                | (col("year") == 0)
+            )
+        return lf.drop("year", "month")
+
+    def partitions(self, df):
+        """The (year, month) partitions holding the rows of `df`."""
+        return set(df.select(self.partition_exprs()).unique().rows())
+
+    def write(self, df, partitions=None, **kwargs):
+        """Write the rows of `df` to the given partitions, by default all of them.
+
+        Partitions left without rows are removed.
+        """
+        df = df.with_columns(self.partition_exprs())
+        if partitions is None:
+            existing = {
+                (int(p.parent.parent.name[5:]), int(p.parent.name[6:])) for p in self.files()
+            }
+            partitions = existing | self.partitions(df)
+        for year, month in sorted(partitions):
+            path = self.fp / f"year={year}" / f"month={month}" / "data.parquet"
+            part = df.filter((col("year") == year) & (col("month") == month))
+            if len(part) > 0:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                atomic_write_parquet(part.drop("year", "month"), path, **kwargs)
+            elif path.exists():
+                path.unlink()
+                for directory in (path.parent, path.parent.parent):
+                    if not any(directory.iterdir()):
+                        directory.rmdir()
+
+    def extend(self, lf, partitions, **kwargs):
+        """Append the rows of `lf`, which fall in the given partitions.
+
+        Each partition is streamed into a new file, its old rows then the new ones.
+        """
+        lf = lf.with_columns(self.partition_exprs())
+        for year, month in sorted(partitions):
+            path = self.fp / f"year={year}" / f"month={month}" / "data.parquet"
+            new = lf.filter((col("year") == year) & (col("month") == month)).drop("year", "month")
+            part = pl.concat([pl.scan_parquet(path), new]) if path.exists() else new
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(path, lambda tmp, part=part: part.sink_parquet(tmp, **kwargs))
+
+
+def migrate_to_partitions(fp):
+    """Split a single-file store into a partitioned dataset at the same path.
+
+    The file is moved aside while the dataset is written, so an interrupted
+    migration is picked up again on the next call.
+    """
+    fp = Path(fp)
+    moved = fp.with_name(fp.name + ".migrating")
+    if fp.is_file():
+        os.replace(fp, moved)
+    if moved.exists():
+        if fp.exists():
+            # the leftovers of an interrupted migration
+            shutil.rmtree(fp)
+        PartitionedParquet(fp).write(pl.read_parquet(moved))
+        moved.unlink()
+
+
+class FileLock:
+    """Advisory `flock` lock on a file, shared between processes.
+
+    The lock is reentrant within an instance, nested holds only lock the file once.
+
+    Parameters
+    ----------
+    path : str or Path
+        Path of the lock file, created if missing.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self._fd = None
+        self._depth = 0
+        self._held = []
+
+    @contextmanager
+    def hold(self, shared=False):
+        if self._depth == 0:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+                self._fd = None
+
+    def __enter__(self):
+        self._held.append(self.hold())
+        return self._held[-1].__enter__()
+
+    def __exit__(self, *exc):
+        return self._held.pop().__exit__(*exc)
+
+
+def apply_ops(df, ops, next_id=None, provisional=False):
+    """Apply a list of mutations to a dataframe.
+
+    Each op is a tuple of the operation name followed by its arguments:
+
+    - ``("append", row)`` adds `row` (a dict without an id) under the next free id.
+    - ``("set", id, column, value)`` sets one value.
+    - ``("add", id, column, value)`` adds to one value, treating nulls as zero.
+    - ``("delete", id)`` removes a row.
+
+    A negative id refers to a row appended earlier in the same list, -1 for the
+    first append, -2 for the second and so on.
+
+    Parameters
+    ----------
+    df : pl.DataFrame
+        The current state of the store.
+    ops : list of tuple
+        The mutations to apply, in order.
+    next_id : int, optional
+        The id given to the first append, defaults to one past the largest id.
+    provisional : bool
+        Keep the negative ids for appended rows instead of allocating new ones,
+        used to preview staged changes.
+
+    Returns
+    -------
+    df : pl.DataFrame
+        The updated dataframe.
+    results : list
+        The new id for each append, None for the other ops.
+    touched : set of int
+        Ids of every row that was added, changed or deleted.
+    next_id : int
+        The id for the next append.
+    """
+    if next_id is None:
+        next_id = (df["id"].max() + 1) if len(df) else 0
+    results, touched, appended = [], set(), []
+    for op in ops:
+        result = None
+        if op[0] != "append" and op[1] < 0:
+            op = (op[0], appended[-op[1] - 1], *op[2:])
+        match op:
+            case ("append", row):
+                if provisional:
+                    result = -len(appended) - 1
+                else:
+                    result, next_id = next_id, next_id + 1
+                appended.append(result)
+                df = pl.concat([df, pl.DataFrame([{"id": result, **row}], schema=df.schema)])
+                touched.add(result)
+            case ("set" | "add" as kind, id, column, value):
+                new = _new_value(kind, column, value, df.schema[column])
+                df = df.with_columns(
+                    pl.when(col("id") == id).then(new).otherwise(col(column)).alias(column)
+                )
+                touched.add(id)
+            case ("delete", id):
+                df = df.filter(col("id") != id)
+                touched.add(id)
+            case _:
+                raise ValueError(f"Unknown operation {op!r}.")
+        results.append(result)
+    return df, results, touched, next_id
+
+
+def _new_value(kind, column, value, dtype):
+    """Expression for `column` after a set or add of `value`."""
+    new = lit(value).cast(dtype)
+    if kind == "add":
+        new = col(column).fill_null(lit(0).cast(dtype)) + new
+    return new
+
+
+# python types a column of each polars type holds, values of them need no cast to check
+NATIVE_TYPES = {
+    pl.String: str,
+    pl.Boolean: bool,
+    pl.Int64: int,
+    pl.Datetime: datetime,
+    pl.Duration: timedelta,
+}
+
+
+def _check_value(kind, column, value, dtype):
+    """Raise the error a set or add of `value` to `column` would fail with, if any."""
+    native = NATIVE_TYPES.get(dtype.base_type())
+    if value is None or (type(value) is native and (kind == "set" or native in (int, timedelta))):
+        return
+    frame = pl.DataFrame({column: [None]}, schema={column: dtype})
+    frame.select(_new_value(kind, column, value, dtype))
+
+
+def check_ops(ops, schema):
+    """Check a batch of ops against the schema of the store, see `apply_ops`.
+
+    Raises ValueError for an unknown op or column, a value that cannot be
+    stored in its column, or a negative id not given to an earlier append.
+    """
+    appends = 0
+    for op in ops:
+        match op:
+            case ("append", dict() as row):
+                if unknown := set(row) - set(schema) | ({"id"} & set(row)):
+                    raise ValueError(f"Unknown columns {sorted(unknown)} in {op!r}.")
+                appends += 1
+                continue
+            case ("set" | "add" as kind, int() as id, str() as column, value):
+                if column not in schema or column == "id":
+                    raise ValueError(f"Unknown column {column!r} in {op!r}.")
+                try:
+                    _check_value(kind, column, value, schema[column])
+                except (pl.exceptions.PolarsError, TypeError) as e:
+                    raise ValueError(f"Cannot {kind} {value!r} to {column}: {e}") from e
+            case ("delete", int() as id):
+                pass
+            case _:
+                raise ValueError(f"Unknown operation {op!r}.")
+        if id < -appends:
+            raise ValueError(f"No append in the batch for the id {id} of {op!r}.")
+
+
+class Transaction:
+    """Mutations staged in memory to be committed together in one write.
+
+    Appends are given provisional negative ids (-1 for the first, -2 for the
+    second and so on) that later ops in the transaction can refer to. Once the
+    transaction is committed, `ids` maps them to the allocated ids.
+    """
+
+    def __init__(self) -> None:
+        self.ops = []
+        self.ids = {}
+
+    def stage(self, ops):
+        """Stage ops, returning the provisional result of each."""
+        results, appends = [], sum(op[0] == "append" for op in self.ops)
+        for op in ops:
+            self.ops.append(op)
+            if op[0] == "append":
+                appends += 1
+            results.append(-appends if op[0] == "append" else None)
+        return results
+
+    def resolve(self, results):
+        """Map the provisional ids to the ids allocated by the commit."""
+        allocated = [r for op, r in zip(self.ops, results) if op[0] == "append"]
+        self.ids = {-k: id for k, id in enumerate(allocated, start=1)}
+
+
+class IdIndex:
+    """Persistent map from ids to row positions in the base parquet file.
+
+    The index file is a flat array of int64 row positions indexed by id (-1 for
+    ids not in the file) behind a header holding the stat key of the base file it
+    describes, so a lookup is a single seek and read. The next id to allocate is
+    kept in a separate sequence file, which segment writes also advance.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the base parquet file.
+    """
+
+    HEADER = struct.Struct("<qqq")
+    ENTRY = struct.Struct("<q")
+
+    def __init__(self, fp) -> None:
+        fp = Path(fp)
+        self.path = fp.with_name(fp.name + ".idx")
+        self.seq_path = fp.with_name(fp.name + ".seq")
+
+    def build(self, ids, key):
+        """Rebuild the index for a base file holding `ids` in row order.
+
+        Parameters
+        ----------
+        ids : pl.Series
+            The id column of the base file.
+        key : tuple of int
+            Stat key (mtime, size, inode) of the base file.
+        """
+        size = ids.max() + 1 if len(ids) else 0
+        positions = pl.Series("position", [], pl.Int64).extend_constant(-1, size)
+        positions = positions.scatter(ids, pl.int_range(len(ids), eager=True))
+        data = self.HEADER.pack(*key) + array("q", positions.to_list()).tobytes()
+        atomic_write(self.path, lambda tmp: Path(tmp).write_bytes(data))
+
+    def position(self, id, key):
+        """Row of `id` in the base file, -1 if it is not there.
+
+        Returns None when the index is missing or was built for another version
+        of the base file.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                if self.HEADER.unpack(f.read(self.HEADER.size)) != tuple(key):
+                    return None
+                if id < 0:
+                    return -1
+                f.seek(self.HEADER.size + id * self.ENTRY.size)
+                entry = f.read(self.ENTRY.size)
+        except (FileNotFoundError, struct.error):
+            return None
+        return self.ENTRY.unpack(entry)[0] if len(entry) == self.ENTRY.size else -1
+
+    def next_id(self):
+        try:
+            return int(self.seq_path.read_text())
+        except FileNotFoundError:
+            return 0
+
+    def advance(self, next_id):
+        atomic_write(self.seq_path, lambda tmp: Path(tmp).write_text(str(next_id)))
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+        self.seq_path.unlink(missing_ok=True)
+
+
+class CommitQueue:
+    """Group commit of mutations queued by several processes.
+
+    Each writer drops its ops into a ``<name>.queue`` directory and then waits for
+    the store lock. Whoever gets the lock first applies every queued batch in a
+    single write and leaves the results for the other writers, so a burst of
+    writers costs one rewrite instead of one each.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the store the queue belongs to.
+    lock : FileLock
+        Lock guarding the store.
+    schema : dict, optional
+        Schema the queued ops are checked against.
+    version : callable, optional
+        Returns the current version of the store. The batches being applied are
+        journaled with it, so a commit interrupted by a crash is never applied
+        twice: if the store changed since, they are taken as committed.
+    """
+
+    def __init__(self, fp, lock, schema=None, version=None) -> None:
+        self.dir = Path(fp).with_suffix(".queue")
+        self.journal = self.dir / "commit.journal"
+        self.lock = lock
+        self.schema = schema
+        self.version = version
+
+    def enqueue(self, ops):
+        """Check a batch of ops against the schema and queue it, returning its name."""
+        if self.schema is not None:
+            check_ops(ops, self.schema)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        name = f"{time.time_ns():020d}-{os.getpid()}-{uuid4().hex[:8]}"
+        atomic_write_pickle(ops, self.dir / f"{name}.ops")
+        return name
+
+    def wait(self, name, apply):
+        """Wait until the named batch is committed and return its results.
+
+        A batch that failed raises its exception, in whichever process it was
+        applied, without failing the batches committed with it.
+
+        Parameters
+        ----------
+        name : str
+            Name returned by `enqueue`.
+        apply : callable
+            Called with a list of batches while the lock is held, should commit
+            them in one write and return the results of each batch, or the
+            exception of each batch that could not be applied.
+        """
+        intent = self.dir / f"{name}.ops"
+        try:
+            with self.lock:
+                if intent.exists():
+                    results = self._apply(intent, apply)
+                else:
+                    # another writer committed this batch
+                    results = self._take(intent.with_suffix(".done"))
+        except BaseException:
+            # never left behind for the next writer to apply again
+            intent.unlink(missing_ok=True)
+            raise
+        if isinstance(results, BaseException):
+            raise results
+        return results
+
+    def _apply(self, intent, apply):
+        """Apply every queued batch, leaving the results of the others in their done files."""
+        self._recover()
+        if not intent.exists():
+            # committed by the writer that crashed
+            return self._take(intent.with_suffix(".done"))
+        pending, batches = [], []
+        for path in sorted(self.dir.glob("*.ops")):
+            try:
+                batches.append(pickle.loads(path.read_bytes()))
+            except FileNotFoundError:
+                # its writer gave up waiting
+                continue
+            pending.append(path)
+        version = self.version() if self.version is not None else None
+        atomic_write_pickle(([p.name for p in pending], version), self.journal)
+        try:
+            all_results = apply(batches)
+        except Exception as e:
+            # the write itself failed, so none of the batches was committed
+            all_results = [e] * len(batches)
+        own = None
+        for path, results in zip(pending, all_results):
+            if path == intent:
+                own = results
+            elif path.exists():
+                atomic_write_pickle(_picklable(results), path.with_suffix(".done"))
+        self._finish(pending)
+        return own
+
+    def _recover(self):
+        """Settle the batches of a commit interrupted by a crash."""
+        if not self.journal.exists():
+            return
+        names, version = pickle.loads(self.journal.read_bytes())
+        pending = [self.dir / name for name in names]
+        if self.version is None or self.version() == version:
+            # the store is unchanged, so they are applied again with the others
+            self.journal.unlink()
+            return
+        error = RuntimeError("batch committed by a writer that crashed, its results are lost")
+        for path in pending:
+            if path.exists():
+                atomic_write_pickle(error, path.with_suffix(".done"))
+        self._finish(pending)
+
+    def _finish(self, pending):
+        for path in pending:
+            path.unlink(missing_ok=True)
+        self.journal.unlink()
+
+    @staticmethod
+    def _take(done):
+        results = pickle.loads(done.read_bytes())
+        done.unlink()
+        return results
+
+    def submit(self, ops, apply):
+        return self.wait(self.enqueue(ops), apply)
+
+    def remove(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def _picklable(results):
+    """The results of a batch, with an exception that cannot be pickled replaced."""
+    if isinstance(results, BaseException):
+        try:
+            pickle.dumps(results)
+        except Exception:
+            return RuntimeError(f"{type(results).__name__}: {results}")
+    return results
+
+
+class SegmentLog:
+    """Append-only delta and tombstone segments stored next to a base parquet file.
+
+    Every mutation is written as a small numbered parquet file in a
+    ``<name>.segments`` directory beside the base file. Delta segments hold full
+    rows, tombstone segments hold only the ids of deleted rows. Reads replay the
+    segments over the base file in order, and `compact` folds them back in.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the base parquet file.
+    max_segments : int
+        Number of segments after which compaction is due.
+    max_bytes : int
+        Total size of the segments after which compaction is due.
+    """
+
+    def __init__(self, fp, max_segments=32, max_bytes=4 * 1024**2) -> None:
+        self.fp = Path(fp)
+        self.dir = self.fp.with_suffix(".segments")
+        self.max_segments = max_segments
+        self.max_bytes = max_bytes
+        self._ids, self._ids_state = set(), ()
+
+    def paths(self):
+        if not self.dir.exists():
+            return []
+        return sorted(self.dir.glob("*.parquet"))
+
+    def state(self):
+        """Names and sizes of the segments, used to detect changes to the log."""
+        return tuple((p.name, p.stat().st_size) for p in self.paths())
+
+    def ids(self):
+        """Ids of every row changed or deleted by the segments."""
+        state = self.state()
+        if self._ids_state != state:
+            ids = [pl.read_parquet(self.dir / name, columns=["id"])["id"] for name, _ in state]
+            self._ids, self._ids_state = set(pl.concat(ids)) if ids else set(), state
+        return self._ids
+
+    def _next_path(self):
+        paths = self.paths()
+        seq = int(paths[-1].stem) + 1 if paths else 0
+        self.dir.mkdir(exist_ok=True)
+        return self.dir / f"{seq:08d}.parquet"
+
+    def write(self, upserts=None, deleted=()):
+        """Write one segment holding the given upserted rows and deleted ids."""
+        parts = []
+        if upserts is not None and len(upserts) > 0:
+            parts.append(upserts.with_columns(_deleted=lit(False)))
+        deleted = list(deleted)
+        if deleted:
+            parts.append(
+                pl.DataFrame({"id": deleted}, schema={"id": pl.Int64}).with_columns(
+                    _deleted=lit(True)
+                )
+            )
+        if not parts:
+            return None
+        path = self._next_path()
+        atomic_write_parquet(pl.concat(parts, how="diagonal"), path)
+        return path
+
+    def merge(self, base):
+        """Lazily replay the segments over the `base` LazyFrame, the last write to an id wins.
+
+        Filters on ``id`` applied to the result are pushed down into every file.
+        """
+        paths = self.paths()
+        if not paths:
+            return base
+        schema = base.collect_schema()
+        frames = [base.with_columns(_deleted=lit(False))]
+        frames += [pl.scan_parquet(p) for p in paths]
+        return (
+            pl.concat(frames, how="diagonal_relaxed")
+            .unique("id", keep="last", maintain_order=True)
+            .filter(~col("_deleted"))
+            .select(schema.names())
+            .cast(schema)
+        )
+
+    def stream(self, base):
+        """Replay the segments like `merge`, in a plan the streaming engine can sink.
+
+        Base rows changed by a segment are filtered out by id and the live
+        segment rows, which are few, are read eagerly and appended after them.
+        Rows are therefore not in store order.
+        """
+        if not self.paths():
+            return base
+        schema = base.collect_schema()
+        changed = self.merge(pl.LazyFrame(schema=schema)).collect()
+        return pl.concat([base.filter(~col("id").is_in(list(self.ids()))), changed.lazy()])
+
+    def needs_compaction(self):
+        state = self.state()
+        return len(state) >= self.max_segments or sum(s for _, s in state) >= self.max_bytes
+
+    def clear(self):
+        for p in self.paths():
+            p.unlink()
+        if self.dir.exists():
+            self.dir.rmdir()
+
+
+class SessionLog:
+    """Append-only log of work sessions kept beside the store, whatever its format.
+
+    Each session is one line of integer microseconds, ``task_id,start,end,planned``,
+    appended with a single ``O_APPEND`` write, so logging a session never rewrites
+    the store or waits for its lock. The time worked on each task is the sum of
+    its sessions, computed with a vectorized group by and kept up to date by only
+    parsing the lines appended since it was last read.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the store, the log is ``<stem>.sessions`` beside it.
+    """
+
+    schema = {
+        "task_id": pl.Int64,
+        "start": pl.Datetime("us"),
+        "end": pl.Datetime("us"),
+        "planned": pl.Duration("us"),
+    }
+    worked_schema = {"task_id": pl.Int64, "worked": pl.Duration("us")}
+    by_day_schema = {"day": pl.Date, "worked": pl.Duration("us")}
+    EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, fp) -> None:
+        self.path = Path(fp).with_suffix(".sessions")
+        self._worked = pl.DataFrame(schema=self.worked_schema)
+        self._by_day = pl.DataFrame(schema=self.by_day_schema)
+        # inode and length of the part of the log summed into the totals
+        self._ino, self._offset = None, 0
+
+    def append(self, task_id, start, end, planned=timedelta(0)):
+        """Log a session on `task_id` from `start` to `end` (datetimes)."""
+        us = timedelta(microseconds=1)
+        start, end = (start - self.EPOCH) // us, (end - self.EPOCH) // us
+        self._write(f"{task_id},{start},{end},{planned // us}\n")
+
+    def extend(self, sessions):
+        """Log a frame of sessions in `schema` with a single write."""
+        if len(sessions):
+            raw = sessions.select(col(c).cast(pl.Int64) for c in self.schema)
+            self._write(raw.write_csv(include_header=False))
+
+    def _write(self, lines):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, lines.encode())
+        finally:
+            os.close(fd)
+
+    def _parse(self, data):
+        # times are stored as integers
+        raw = dict.fromkeys(self.schema, pl.Int64)
+        return pl.read_csv(data, has_header=False, schema=raw).cast(self.schema)
+
+    def scan(self):
+        """Lazily scan every session."""
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            return pl.LazyFrame(schema=self.schema)
+        raw = dict.fromkeys(self.schema, pl.Int64)
+        return pl.scan_csv(self.path, has_header=False, schema=raw).cast(self.schema)
+
+    def read(self):
+        return self.scan().collect()
+
+    def state(self):
+        """Identify the part of the log read so far, changed by reads that find new sessions."""
+        self._refresh()
+        return self._ino, self._offset
+
+    def worked(self):
+        """Total time worked per task, as ``task_id`` and ``worked`` columns."""
+        self._refresh()
+        return self._worked
+
+    def worked_by_day(self):
+        """Total time worked per day sessions started on, as ``day`` and ``worked`` columns."""
+        self._refresh()
+        return self._by_day
+
+    def _refresh(self):
+        """Add the sessions appended since the last read to the totals."""
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            st = None
+        if st is None or st.st_ino != self._ino or st.st_size < self._offset:
+            # a new or replaced log is read from the start
+            self._worked = pl.DataFrame(schema=self.worked_schema)
+            self._by_day = pl.DataFrame(schema=self.by_day_schema)
+            self._ino, self._offset = (st.st_ino if st else None), 0
+        if st is None or st.st_size == self._offset:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+        # a line still being written is left for the next read
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return
+        sessions = self._parse(data[:end]).with_columns(
+            (col("end") - col("start")).alias("worked"), col("start").dt.date().alias("day")
+        )
+
+        def add(totals, key):
+            new = sessions.group_by(key).agg(col("worked").sum())
+            return pl.concat([totals, new]).group_by(key).agg(col("worked").sum())
+
+        self._worked = add(self._worked, "task_id")
+        self._by_day = add(self._by_day, "day")
+        self._offset += end
+
+
+def pid_alive(pid):
+    """Whether a process with id `pid` is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # running as another user
+        return True
+    return True
+
+
+class HeartbeatJournal:
+    """Heartbeats of the work sessions being timed, kept beside the store.
+
+    While a timer runs it appends a fixed-size record every `interval` seconds
+    with the time counted so far, and a final record once its session is logged
+    to the `SessionLog`. When the process dies before that, because it was killed
+    or its terminal closed, `reconcile` logs the session from its latest record,
+    so at most `interval` seconds of work are lost.
+
+    Records are `RECORD` structs appended with single ``O_APPEND`` writes, a torn
+    write by a crash is only ever a partial last record, which is ignored.
+
+    Parameters
+    ----------
+    fp : str or Path
+        Path of the store, the journal is ``<stem>.heartbeats`` beside it.
+    interval : float
+        Seconds between heartbeats.
+    """
+
+    # session, task id, pid, wall clock time and time counted (microseconds),
+    # planned duration (microseconds) and whether the session has been logged
+    RECORD = struct.Struct("<QqqqqqB")
+    schema = {
+        "session": pl.UInt64,
+        "task_id": pl.Int64,
+        "pid": pl.Int64,
+        "time": pl.Int64,
+        "elapsed": pl.Int64,
+        "planned": pl.Int64,
+        "done": pl.Boolean,
+    }
+
+    def __init__(self, fp, interval=30.0) -> None:
+        self.path = Path(fp).with_suffix(".heartbeats")
+        self.lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        self.interval = interval
+
+    def beat(self, session, task_id, time, elapsed, planned, done=False):
+        """Append a record of `session`, `elapsed` time counted by wall clock `time`."""
+        us = timedelta(microseconds=1)
+        record = self.RECORD.pack(
+            session,
+            task_id,
+            os.getpid(),
+            (time - SessionLog.EPOCH) // us,
+            elapsed // us,
+            planned // us,
+            done,
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, record)
+        finally:
+            os.close(fd)
+
+    def watch(self, timer, task_id):
+        """Beat every `interval` seconds while `timer` runs, returning its session id.
+
+        The session is not finished by the timer expiring, but by `finish` once it
+        is logged.
+        """
+        session = uuid4().int >> 64
+        planned = timedelta(seconds=timer.duration)
+        last = -self.interval
+
+        def on_tick(timer, remaining):
+            nonlocal last
+            if timer.elapsed - last >= self.interval:
+                last = timer.elapsed
+                self.beat(session, task_id, datetime.now(), timedelta(seconds=last), planned)
+
+        timer.on_tick(on_tick)
+        return session
+
+    def finish(self, session, task_id, start, end, planned, sessions):
+        """Log the session from `start` to `end` to `sessions` and mark it done.
+
+        Its final times are journalled first, so `reconcile` logs it exactly once
+        whenever the process dies.
+        """
+        with self.lock:
+            self.beat(session, task_id, end, end - start, planned)
+            sessions.append(task_id, start, end, planned)
+            self.beat(session, task_id, end, end - start, planned, done=True)
+
+    def read(self):
+        """Every complete record, in the order they were written."""
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            data = b""
+        data = data[: len(data) - len(data) % self.RECORD.size]
+        return pl.DataFrame(list(self.RECORD.iter_unpack(data)), schema=self.schema, orient="row")
+
+    def reconcile(self, sessions):
+        """Log the sessions of processes that died while timing them, in one write.
+
+        Sessions already in `sessions` are not logged again, and the journal is
+        cut down to the latest record of each session still running.
+
+        Returns
+        -------
+        pl.DataFrame
+            The recovered sessions, in the `SessionLog` schema.
+        """
+        if not self.path.exists():
+            return pl.DataFrame(schema=SessionLog.schema)
+        with self.lock:
+            latest = self.read().group_by("session", maintain_order=True).last()
+            running = latest.filter(~col("done"))
+            alive = pl.Series([pid_alive(pid) for pid in running["pid"]], dtype=pl.Boolean)
+            interrupted = (
+                running.filter(~alive)
+                .select(
+                    "task_id",
+                    (col("time") - col("elapsed")).alias("start"),
+                    col("time").alias("end"),
+                    "planned",
+                )
+                .cast(SessionLog.schema)
+                # logged before the process died
+                .join(sessions.read(), on=list(SessionLog.schema), how="anti")
+            )
+            sessions.extend(interrupted)
+            keep = running.filter(alive)
+            if not len(keep):
+                self.path.unlink()
+            elif len(keep) < len(latest):
+                records = b"".join(self.RECORD.pack(*row) for row in keep.iter_rows())
+                atomic_write(self.path, lambda tmp: Path(tmp).write_bytes(records))
+            return interrupted
+
+
+class Rollup:
+    """Aggregates of the stored tasks, updated from the rows each commit changes.
+
+    Holds the number of tasks by ``completed``, the number of tasks created and
+    the ``worked`` stored on them per day they were created, and the latest
+    ``created``. Reading them is O(1), and a commit only aggregates the rows it
+    removed and added rather than the whole store.
+
+    Parameters
+    ----------
+    key : hashable, optional
+        Version of the store the aggregates describe, see `ParquetBackend.rollup`.
+    """
+
+    # changes of at most this many rows are aggregated in python, polars has a fixed
+    # cost per query that dominates on a handful of rows
+    SMALL = 64
+    EPOCH = datetime(1970, 1, 1).date()
+
+    def __init__(self, key=None) -> None:
+        self.key = key
+        self.counts = {False: 0, True: 0}
+        # days since the epoch -> (tasks created, microseconds worked), plain ints pickle fast
+        self.days = {}
+        self.latest_created = None
+
+    @classmethod
+    def build(cls, df, key=None):
+        """Aggregate every task in `df`."""
+        rollup = cls(key)
+        rollup.apply(added=df)
+        return rollup
+
+    @property
+    def tasks(self):
+        return sum(self.counts.values())
+
+    def copy(self, key=None):
+        rollup = Rollup(key)
+        rollup.counts, rollup.days = dict(self.counts), dict(self.days)
+        rollup.latest_created = self.latest_created
+        return rollup
+
+    def apply(self, removed=None, added=None):
+        """Take the `removed` rows out of the aggregates and put the `added` rows in.
+
+        A changed row is removed as it was before the change and added as it is
+        after it. When the latest task is removed `latest_created` becomes None,
+        and has to be found in the store again.
+        """
+        for rows, sign in ((removed, -1), (added, 1)):
+            if rows is None or rows.is_empty():
+                continue
+            counts, per_day = self._totals(rows)
+            for completed, n in counts:
+                self.counts[bool(completed)] += sign * n
+            for day, n, worked in per_day:
+                created, total = self.days.get(day, (0, 0))
+                if created + sign * n:
+                    self.days[day] = created + sign * n, total + sign * worked
+                else:
+                    self.days.pop(day, None)
+        removed_latest = None if removed is None else removed["created"].max()
+        added_latest = None if added is None else added["created"].max()
+        if removed_latest is not None and self.latest_created is not None:
+            if removed_latest >= self.latest_created:
+                # the latest task changed, nothing left can be later than its new version
+                keep = added_latest is not None and added_latest >= removed_latest
+                self.latest_created = added_latest if keep else None
+                return
+        if added_latest is not None:
+            if self.latest_created is not None:
+                self.latest_created = max(self.latest_created, added_latest)
+            elif self.tasks == len(added):
+                # the store held nothing else
+                self.latest_created = added_latest
+
+    @staticmethod
+    def _totals(rows):
+        """Tasks by ``completed``, and tasks and microseconds worked by day created."""
+        if len(rows) <= Rollup.SMALL:
+            counts, per_day = {}, {}
+            for completed, created, worked in rows.select(
+                "completed", "created", "worked"
+            ).iter_rows():
+                counts[completed] = counts.get(completed, 0) + 1
+                day = None if created is None else (created.date() - Rollup.EPOCH).days
+                n, total = per_day.get(day, (0, 0))
+                per_day[day] = n + 1, total + (worked or timedelta(0)) // timedelta(microseconds=1)
+            return counts.items(), [(day, *totals) for day, totals in per_day.items()]
+        counts = rows.group_by("completed").len().iter_rows()
+        per_day = rows.group_by(col("created").dt.date().cast(pl.Int32)).agg(
+            pl.len(), col("worked").sum().dt.total_microseconds().fill_null(0)
+        )
+        return counts, per_day.iter_rows()
+
+    def by_day(self):
+        """The tasks created and the time worked on them per day, as a frame."""
+        schema = {"day": pl.Int32, "created": pl.Int64, "worked": pl.Int64}
+        rows = [(day, *totals) for day, totals in self.days.items()]
+        return (
+            pl.DataFrame(rows, schema=schema, orient="row")
+            .with_columns(col("day").cast(pl.Date), col("worked").cast(pl.Duration("us")))
+            .sort("day")
+        )
+
+    @property
+    def stale_latest(self):
+        """Whether `latest_created` has to be looked up in the store."""
+        return self.latest_created is None and self.tasks > 0
+
+
+# %%
@@ -1,18 +1,21 @@
 # %%
-import re
-import subprocess
+import os
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from functools import cache
 from pathlib import Path
 
-import click
 import polars as pl
 from loguru import logger
 from polars import col, lit
 
+from tasker.backends import open_backend
+from tasker.bulk import normalize, read_chunks, sink
 from tasker.countdown import countdown
-from tasker.utils.cli_class import MetaCLI, add_params
-from tasker.utils.cmd_options import CmdOptions
+from tasker.stats import PERIODS, report
+from tasker.storage import HeartbeatJournal, SessionLog, Transaction, apply_ops
 from tasker.utils.helpers import parse_timedelta_string, timedelta_to_string
+from tasker.utils.profiling import span, timed
 
 # %%
 
@@ -25,16 +28,38 @@ df_schema = {
 }
 
 
-def pl_print(df, string=False, drop=("id")):
+# number of rows shown by pl_print, the first and last half of the frame
+TBL_ROWS = 20
+
+
+@timed("pl_print")
+def pl_print(df, string=False, drop=("id"), tbl_rows=TBL_ROWS):
     if drop is not None:
         df = df.drop(drop)
-    df = df.with_columns(
-        col("created").dt.strftime("%Y-%m-%d %H:%M:%S"),
-        col("worked").map_elements(timedelta_to_string, return_dtype=pl.String),
-    )
+    # times such as created and durations such as worked, in the tasks or a report
+    formats = [
+        col(c).dt.strftime("%Y-%m-%d %H:%M:%S")
+        if dtype == pl.Datetime
+        else timedelta_to_string(col(c)).alias(c)
+        for c, dtype in df.schema.items()
+        if dtype in (pl.Datetime, pl.Duration)
+    ]
+    if len(df) > tbl_rows:
+        # only the rows that are shown need formatting, polars shows the odd one at the head
+        head, tail = (tbl_rows + 1) // 2, tbl_rows // 2
+        hidden = [lit(None, pl.String).alias(expr.meta.output_name()) for expr in formats]
+        df = pl.concat(
+            [
+                df.head(head).with_columns(formats),
+                df.slice(head, len(df) - head - tail).with_columns(hidden),
+                df.tail(tail).with_columns(formats),
+            ]
+        )
+    else:
+        df = df.with_columns(formats)
     with pl.Config(
         # tbl_hide_column_data_types=True,
-        tbl_rows=20,
+        tbl_rows=tbl_rows,
         tbl_hide_dataframe_shape=True,
     ):
         if string:
@@ -42,6 +67,7 @@ def pl_print(df, string=False, drop=("id")):
         print(df)
 
 
+@timed("update_csv_parquet")
 def update_csv_parquet(csv_fp):
     csv_fp = Path(csv_fp)
     # NOTE: temporary for update
@@ -64,7 +90,7 @@ def update_csv_parquet(csv_fp):
         logger.info("deleting csv file")
         csv_fp.unlink()
         return pq_fp
-    elif pq_fp.exists():
+    elif any(pq_fp.with_suffix(suffix).exists() for suffix in (".parquet", ".arrow", ".sqlite")):
         return pq_fp
     else:
         logger.warning(f"no csv or parquet exists, \n{csv_fp=}\n{pq_fp}")
@@ -73,33 +99,215 @@ def update_csv_parquet(csv_fp):
 
 class Data:
     csv_fp = Path(__file__).parent / "data/tasks.csv"
-    DF_FP = update_csv_parquet(csv_fp)
 
-    def __init__(self, fp=None) -> None:
-        if fp is None:
-            self.fp = self.DF_FP
-        else:
-            self.fp = update_csv_parquet(fp)
+    @staticmethod
+    @cache
+    def default_fp():
+        """Path of the default store, migrated from csv the first time it is needed.
+
+        Set ``TASKER_STORE`` to the path of a store to use it instead of the one
+        kept in the package.
+        """
+        csv_fp = Path(os.environ.get("TASKER_STORE", Data.csv_fp)).with_suffix(".csv")
+        return update_csv_parquet(csv_fp)
+
+    def __init__(self, fp=None, segments=None, partitioned=None, format=None) -> None:
+        """Open a task store.
+
+        Parameters
+        ----------
+        fp : str or Path, optional
+            Path of the store, by default `default_fp`.
+        segments, partitioned : bool, optional
+            Options of the parquet and ipc formats, by default the layout found
+            on disk, see `ParquetBackend`.
+        format : str, optional
+            "parquet", "ipc" or "sqlite", by default the format found on disk.
+        """
+        fp = self.default_fp() if fp is None else update_csv_parquet(fp)
+        self._options = dict(segments=segments, partitioned=partitioned)
+        self.backend = open_backend(fp, df_schema, format, **self._options)
+        # work sessions, kept apart from the tasks so logging one is a single append
+        self.sessions = SessionLog(fp)
+        # heartbeats of the sessions being timed, to recover them after a crash
+        self.heartbeats = HeartbeatJournal(fp)
+        self._worked_cache = None
+        # mutations staged by an open `transaction`
+        self._staged = None
 
     @property
-    def df(self):
-        try:
-            df = pl.read_parquet(self.fp)
-        except FileNotFoundError:
-            df = pl.DataFrame(schema=df_schema)
+    def fp(self):
+        return self.backend.fp
+
+    def invalidate(self):
+        """Drop the cached dataframe so the next access re-reads the store."""
+        self.backend.invalidate()
+
+    def _with_sessions(self, frame):
+        """Add the time worked in logged sessions to the stored ``worked`` of each task.
+
+        The stored value holds work recorded before the session log, or imported.
+        """
+        worked = self.sessions.worked()
+        if not len(worked):
+            return frame
+        if isinstance(frame, pl.LazyFrame):
+            worked = worked.lazy()
+        session = col("_session_worked")
+        return (
+            frame.join(
+                worked.rename({"task_id": "id", "worked": "_session_worked"}), on="id", how="left"
+            )
+            .with_columns(
+                pl.when(session.is_null())
+                .then(col("worked"))
+                .otherwise(col("worked").fill_null(timedelta(0)) + session)
+                .alias("worked")
+            )
+            .drop("_session_worked")
+        )
 
-        # NOTE: temporary for update
-        if "worked" not in df.columns:
-            df = df.with_columns(worked=lit(None).cast(pl.Duration))
+    def _read(self):
+        """The committed tasks with their logged work, cached until either changes."""
+        df, state = self.backend.read(), self.sessions.state()
+        cached = self._worked_cache
+        # the backend returns the same frame while it is unchanged
+        if cached is None or cached[0] is not df or cached[1] != state:
+            self._worked_cache = cached = df, state, self._with_sessions(df)
+        return cached[2]
 
-        df = df.sort("created", descending=True)
-        # df = df.with_row_index("id")
-        assert df["id"].is_unique().all(), "Index column is not unique."
+    @property
+    def df(self):
+        df = self._read()
+        if self._staged is not None and self._staged.ops:
+            # preview the staged changes
+            df = apply_ops(df, self._staged.ops, provisional=True)[0]
+            df = df.sort("created", descending=True)
+        return df
+
+    def scan(self, since=None, completed=None):
+        """Lazy query over the store, see `StorageBackend.scan`.
+
+        Filters and column selections on the returned frame are pushed down into
+        the backend where it can, for parquet into the reader so row groups that
+        cannot match are skipped.
+
+        Parameters
+        ----------
+        since : datetime, optional
+            Only scan tasks created at or after this time. In a partitioned store
+            older partitions are not read at all.
+        completed : bool, optional
+            Only scan completed or only open tasks.
+        """
+        if self._staged is None:
+            return self._with_sessions(self.backend.scan(since, completed))
+        lf = self.df.lazy()
+        if since is not None:
+            lf = lf.filter(col("created") >= since)
+        if completed is not None:
+            lf = lf.filter(col("completed") == completed)
+        return lf
+
+    def recent(self, duration):
+        """Tasks created within `duration` (e.g. "30d") of now, newest first."""
+        since = datetime.now() - parse_timedelta_string(duration)
+        with self.backend.lock.hold(shared=True):
+            df = self.scan(since=since).collect()
+        return df.sort("created", descending=True)
+
+    def _query(self, predicate=None, *columns, **filters):
+        """Collect the rows matching `predicate` and the `scan` filters.
+
+        Only the given columns are read.
+        """
+        with self.backend.lock.hold(shared=True):
+            lf = self.scan(**filters)
+            if predicate is not None:
+                lf = lf.filter(predicate)
+            if columns:
+                lf = lf.select(columns)
+            with span("query"):
+                return lf.collect()
+
+    def _lookup(self, id, *columns):
+        """Collect the row with the given id, only reading the given columns."""
+        if self._staged is not None:
+            return self._query(col("id") == id, *columns)
+        df = self.backend.lookup(id, *columns)
+        if "worked" in df.columns and len(df):
+            worked = self.sessions.worked().filter(col("task_id") == id)["worked"]
+            if len(worked):
+                df = df.with_columns(col("worked").fill_null(timedelta(0)) + worked[0])
         return df
 
     def write(self, df: pl.DataFrame):
-        assert df.schema == df_schema, f"Schema mismatch: \nOld: {df_schema}\nNew: {df.schema}"
-        df.sort("id").write_parquet(self.fp)
+        """Replace the whole store with `df`."""
+        with span("write"):
+            self.backend.write(df)
+
+    def _submit(self, ops):
+        """Commit a batch of mutations, returning the result of each op.
+
+        The backend commits the batch under the store lock, see `apply_ops` for
+        the ops. Inside a `transaction` the ops are only staged.
+        """
+        if self._staged is not None:
+            return self._staged.stage(ops)
+        with span("commit"):
+            return self.backend.submit(ops)
+
+    @contextmanager
+    def transaction(self):
+        """Stage every mutation made in the block and commit them in one write.
+
+        Reads inside the block see the staged changes. Tasks appended inside the
+        block get provisional negative ids, which are mapped to the allocated ids
+        in the yielded `Transaction`'s ``ids`` once it is committed. Nothing is
+        written if the block raises, and nested transactions join the outer one.
+        """
+        if self._staged is not None:
+            yield self._staged
+            return
+        self._staged = txn = Transaction()
+        try:
+            yield txn
+        finally:
+            self._staged = None
+        if txn.ops:
+            txn.resolve(self._submit(txn.ops))
+
+    batch = transaction
+
+    def compact(self):
+        """Fold any delta segments back into the store, see `StorageBackend.compact`."""
+        self.backend.compact()
+
+    def convert(self, format, partitioned=False):
+        """Move the store to another format, "parquet", "ipc" or "sqlite".
+
+        Any delta segments are folded in, ids allocated so far are not reused, and
+        the old files are removed once the new store is in place. With
+        `partitioned` a parquet store becomes a dataset partitioned by month, a
+        partitioned store only becomes a single file in another format.
+        """
+        assert format == "parquet" or not partitioned, "A partitioned store is always parquet."
+        old = self.backend
+        if format != old.format:
+            options = dict(self._options, partitioned=False)
+            new = open_backend(old.fp, df_schema, format, **options)
+            if new.lock.path == old.lock.path:
+                # parquet and ipc share the lock file, a second lock on it would block
+                new.lock = new.queue.lock = old.lock
+            with old.lock, new.lock:
+                new.write(old.read(), max_id=old.max_id())
+                # parquet and ipc also share the id sequence, queue and rollup
+                old.remove(sidecars=new.lock.path != old.lock.path)
+            self.backend = old = new
+        if partitioned and not old.base.partitioned:
+            # the single file is migrated in place
+            options = dict(self._options, partitioned=True)
+            self.backend = open_backend(old.fp, df_schema, format, **options)
 
     def append(self, task=None):
         if task is None:
@@ -107,102 +315,295 @@ class Data:
         if len(task) == 0:
             raise ValueError("Task cannot be empty.")
 
-        df = self.df
-        print(df.shape)
-
-        # catch error if no tasks
-        if (max_id := df["id"].max()) is None:
-            max_id = -1
-        new_id = max_id + 1
+        # the id is allocated when the append is committed
+        new_row = dict(task=task, completed=False, created=datetime.now(), worked=timedelta(0))
+        (new_id,) = self._submit([("append", new_row)])
+        return new_id
 
-        new_row = pl.DataFrame(
-            [[new_id], [task], [False], [datetime.now()], [timedelta(seconds=0)]],
-            schema=df_schema,
+    def import_tasks(self, source, chunk_size=100_000, progress=None):
+        """Stream tasks from a csv, ndjson or parquet file into the store.
+
+        The file is read `chunk_size` rows at a time, so it never has to fit in
+        memory. The tasks get a contiguous block of new ids and are committed
+        together once the whole file is read, nothing is stored if it fails part
+        way, see `StorageBackend.extend`.
+
+        Parameters
+        ----------
+        source : str or Path
+            The file to import, see `read_chunks` for the formats.
+        chunk_size : int
+            Number of rows read at a time.
+        progress : callable, optional
+            Called with the number of tasks read so far after every chunk.
+
+        Returns
+        -------
+        range
+            The ids given to the imported tasks.
+        """
+        # the backend gives the ids
+        chunks = (normalize(chunk, 0, df_schema) for chunk in read_chunks(source, chunk_size))
+        return self.backend.extend(chunks, progress)
+
+    def export(self, dest, format=None, columns=None, completed=None, since=None, until=None):
+        """Stream the store to a csv, ndjson, Arrow IPC or parquet file.
+
+        The filters and the column selection are pushed down into the scan and
+        the result is written by the streaming engine, so the store is never
+        loaded into memory as a whole.
+
+        Parameters
+        ----------
+        dest : str, Path or binary file object
+            Where to write, see `sink`.
+        format : str, optional
+            Output format, taken from the suffix of `dest` when not given.
+        columns : list of str, optional
+            Columns to export, all by default.
+        completed : bool, optional
+            Only export completed or only open tasks.
+        since, until : datetime, optional
+            Only export tasks created in ``[since, until)``.
+        """
+        with self.backend.lock.hold(shared=True), self.backend.stream(since) as lf:
+            lf = self._with_sessions(lf)
+            if completed is not None:
+                lf = lf.filter(col("completed") == completed)
+            if since is not None:
+                lf = lf.filter(col("created") >= since)
+            if until is not None:
+                lf = lf.filter(col("created") < until)
+            if columns:
+                lf = lf.select(columns)
+            sink(lf, dest, format)
+
+    def summary(self):
+        """Aggregates of the committed store, read from its `Rollup` without a scan.
+
+        Returns
+        -------
+        dict
+            - open, completed: the number of open and completed tasks.
+            - latest_created: when the newest task was created, None when empty.
+            - worked_by_day: a frame of ``day``, ``created`` and ``worked``. Work
+              stored on a task counts on the day it was created, logged sessions
+              on the day they started.
+            - worked_by_task: time logged in sessions per task, see `SessionLog`.
+        """
+        rollup = self.backend.rollup()
+        stored = rollup.by_day()
+        logged = self.sessions.worked_by_day().with_columns(created=lit(0, pl.Int64))
+        by_day = (
+            pl.concat([stored, logged.select(stored.columns)])
+            .group_by("day")
+            .agg(col("created").sum(), col("worked").sum())
+            .sort("day")
         )
-        df = pl.concat([df, new_row], how="diagonal")
-        self.write(df)
-        return new_id
+        return {
+            "open": rollup.counts[False],
+            "completed": rollup.counts[True],
+            "latest_created": rollup.latest_created,
+            "worked_by_day": by_day,
+            "worked_by_task": self.sessions.worked(),
+        }
+
+    def stats(self, period="day", window=None, since=None):
+        """Tasks created and completed and time worked per day, week or month.
+
+        Parameters
+        ----------
+        period : str
+            "day", "week" or "month".
+        window : str, optional
+            Rolling window as a polars duration string, e.g. "14d". By default a
+            week of days, four weeks or three months.
+        since : datetime, optional
+            Only count tasks created at or after this time.
+
+        Returns
+        -------
+        pl.DataFrame
+            One row per period, see `tasker.stats.report`.
+        """
+        assert period in PERIODS, f"Unknown period {period}, expected one of {', '.join(PERIODS)}."
+        every, default_window = PERIODS[period]
+        with self.backend.lock.hold(shared=True):
+            return report(self.scan(since=since), every, window or default_window)
+
+    def search(self, query, limit=20):
+        """Tasks whose names contain the words of `query`, best match first.
+
+        Whole words rank above word prefixes and those above matches inside a
+        word, then newer tasks above older ones, see `tasker.search`. Changes
+        staged in a transaction are not searched.
+
+        Parameters
+        ----------
+        query : str
+            Words to look for, case insensitive.
+        limit : int, optional
+            Return at most this many tasks, all of the matches when None.
+        """
+        ids = self.backend.search(query, limit)
+        rank = pl.DataFrame({"id": ids}, schema={"id": pl.Int64}).with_row_index("rank")
+        df = self._query(col("id").is_in(ids))
+        return rank.join(df, on="id").sort("rank").drop("rank")
 
     @staticmethod
-    def formatted(df):
+    def formatted(df, offset=0):
         return (
             df.with_columns(done=pl.when("completed").then(lit("✅")).otherwise(lit("❌")))
-            .with_row_index("index")
+            .with_row_index("index", offset=offset)
             .drop("completed")
         )
 
+    def window(
+        self, sort="created", descending=True, limit=None, offset=0, since=None, completed=None
+    ):
+        """The formatted task list from row `offset`, at most `limit` rows long.
+
+        The sort and slice are pushed down together, so only the rows in the
+        window are fully sorted (a top-k) and formatted. The ``index`` column
+        numbers the rows of the whole list. `since` and `completed` filter the
+        list as in `scan`.
+        """
+        with self.backend.lock.hold(shared=True):
+            lf = self.scan(since=since, completed=completed)
+            lf = lf.sort(sort, descending=descending, nulls_last=True)
+            with span("query"):
+                df = lf.slice(offset, limit).collect()
+        return self.formatted(df, offset)
+
+    def pages(self, size=20, limit=None, offset=0, **order):
+        """Render the window of the task list as tables of `size` rows, one at a time.
+
+        Takes the same arguments as `window`, rows are only formatted and
+        rendered as each page is consumed.
+        """
+        df = self.window(limit=limit, offset=offset, **order)
+        for start in range(0, len(df), size):
+            yield pl_print(df.slice(start, size), string=True, drop=None, tbl_rows=size) + "\n"
+
     @property
     def todo(self):
-        return self.df.filter(~col("completed"))
+        return self._query(completed=False).sort("created", descending=True)
 
     @property
     def done(self):
-        return self.df.filter(col("completed"))
+        return self._query(completed=True).sort("created", descending=True)
 
-    def delete(self, id=None):
-        df = self.df
-        id = id if id is not None else self.choice(df, "Input task number to delete: ")
+    def delete(self, id=None, limit=None, offset=0):
+        if id is None:
+            window = self.window(limit=limit, offset=offset)
+            id = self.choice(window, "Input task number to delete: ", limit)
         assert isinstance(id, int), f"Invalid task id, need int, got {type(id)}."
         match id:
             case int():
-                assert id in df["id"], f"Task {id=} does not exist."
-                deleted = df.filter(col("id") == id).row(0, named=True)
-                df = df.filter(col("id") != id)
-                self.write(df)
+                rows = self._lookup(id, "task")
+                assert len(rows) > 0, f"Task {id=} does not exist."
+                deleted = rows.row(0, named=True)
+                self._submit([("delete", id)])
                 print(f"""Deleted task {id=}: "{deleted['task']}".""")
             case _:
                 print("No task deleted.")
 
-    def choice(self, df, prompt):
-        if len(df) == 0:
+    def choice(self, window, prompt, limit=None):
+        """Ask for a task by its index in `window`, a frame from `window`.
+
+        `limit` is the limit the window was taken with, only to size the table.
+        """
+        if len(window) == 0:
             raise ValueError("No tasks found.")
-        assert "id" in df.columns, "Index column not found."
-        df = self.formatted(df)
-        pl_print(df)
+        assert "id" in window.columns, "Index column not found."
+        pl_print(window, tbl_rows=TBL_ROWS if limit is None else max(limit, 1))
         choice = input(prompt)
         match choice:
             case str() if choice.isdigit():
-                choice = int(choice)
-                # print("Integer choice")
-                assert choice in df["index"], f"Task {choice} does not exist."
-                return df.row(choice, named=True)["id"]
+                chosen = window.filter(col("index") == int(choice))
+                assert len(chosen) > 0, f"Task {choice} does not exist."
+                return chosen["id"].item()
             case _:
-                # print("Not integer choice")
                 return None
 
     def _set(self, id, column, value):
-        df = self.df
-        df = df.with_columns(
-            pl.when(col("id") == id).then(lit(value)).otherwise(col(column)).alias(column)
-        )
-        self.write(df)
+        self._submit([("set", id, column, value)])
+
+    def _add(self, id, column, value):
+        """Add to a value, relative to what is stored when the change is committed."""
+        self._submit([("add", id, column, value)])
 
     def get_row(self, id: int) -> dict:
-        return self.df.filter(col("id") == id).row(0, named=True)
+        return self._lookup(id).row(0, named=True)
 
     def get(self, id, column):
-        return self.df.filter(col("id") == id)[column].item()
+        return self._lookup(id, column)[column].item()
 
-    def complete(self, id=None, completed=True):
+    def complete(self, id=None, completed=True, limit=None, offset=0):
         if id is None:
-            id = self.choice(self.todo, "Input task number to complete: ")
+            window = self.window(limit=limit, offset=offset, completed=False)
+            id = self.choice(window, "Input task number to complete: ", limit)
         self._set(id, "completed", completed)
 
-    def start_work(self, id: int, duration: str = "60m"):
-        expected_work = parse_timedelta_string(duration)
-        # handle missing values, set time worked to 0
-        if (current_val := self.get(id, "worked")) is None:
-            current_val = timedelta(0)
-        worked = current_val + expected_work
-        self._set(id, "worked", worked)
+    def _check_committed(self, id):
+        """Sessions are logged straight away, so only on tasks already committed."""
+        assert id >= 0, (
+            f"Task {id} is only staged in a transaction, commit it before logging work on it."
+        )
+
+    def log_session(self, id, start, end, planned=timedelta(0)):
+        """Record work on task `id` from `start` to `end`, see `SessionLog`."""
+        self._check_committed(id)
+        self.sessions.append(id, start, end, planned)
 
+    def recover_sessions(self):
+        """Log the sessions interrupted by a crash, see `HeartbeatJournal.reconcile`."""
+        recovered = self.heartbeats.reconcile(self.sessions)
+        if len(recovered):
+            print(f"Recovered {len(recovered)} interrupted work session(s).")
+        return recovered
+
+    def start_work(self, id: int, duration: str = "60m"):
+        self._check_committed(id)
+        self.recover_sessions()
         task = self.get(id, "task")
-        start_time = datetime.now()
-        countdown(duration, title=task)
+        countdown(
+            duration,
+            title=task,
+            task_id=id,
+            on_start=lambda timer: self._watch_timer(id, timer),
+            notify=True,
+        )
 
-        # subtract the time not worked from the recorded time worked
-        not_worked = expected_work - (datetime.now() - start_time)
-        self._set(id, "worked", worked - not_worked)
+    def _watch_timer(self, id, timer):
+        """Journal heartbeats of `timer` and log its session once it ends."""
+        session = self.heartbeats.watch(timer, id)
+        timer.on_expire(lambda timer: self._log_timer(id, timer, session))
+
+    def _log_timer(self, id, timer, session):
+        """Log the time counted down by `timer` as a session, ending now."""
+        end = datetime.now()
+        worked = timedelta(seconds=timer.elapsed)
+        planned = timedelta(seconds=timer.duration)
+        self.heartbeats.finish(session, id, end - worked, end, planned, self.sessions)
+
+    def time_work(self, engine, id: int, duration: str = "60m"):
+        """Time work on task `id` on a `tasker.timers.TimerEngine`, without blocking.
+
+        A session is logged when the timer expires or is cancelled, and its
+        heartbeats journalled meanwhile, as in `start_work`, so many tasks can be
+        timed at once in one event loop.
+
+        Returns
+        -------
+        Timer
+            The timer, to subscribe to its ticks or cancel it.
+        """
+        self._check_committed(id)
+        self.recover_sessions()
+        timer = engine.add(id, parse_timedelta_string(duration).total_seconds())
+        self._watch_timer(id, timer)
+        return timer
 
     def finish_work(self, id):
         complete = input("Task complete? (y/n): ")
@@ -219,88 +620,17 @@ class Data:
         return pl_print(self.formatted(self.df), string=True, drop=None)
 
 
-def sound_alert():
-    say_options = CmdOptions(
-        # Alex, Daniel, Fiona, Fred, Samantha or Victoria
-        voice="Daniel",
-    )
-
-    subprocess.run(["say"] + say_options + ["Hours up!"])
-
-
-data = Data()
-
-
-def clean_name(name):
-    return re.sub("_task[s]?", "", name)
-
-
-class TaskCLI(metaclass=MetaCLI):
-    debug = True
-
-    def __init__(self) -> None:
-        # Create the Click group
-        self.cli = click.Group()
-
-        # Register commands
-        for command in self.commands:
-            self.cli.add_command(getattr(self, command), name=self.clean_name(command))
-
-    @staticmethod
-    def clean_name(name):
-        return re.sub("_task[s]?", "", name)
-
-    def run(self):
-        # Run the cli
-        self.cli()
-
-    def todo():
-        todo = data.todo
-        if len(todo) > 0:
-            print("There are tasks outstanding.")
-            id = data.choice(
-                data.todo,
-                "Input a number to continue the task, or press enter to make new task: ",
-            )
-            if id:
-                task = data.get(id, "task")
-            else:
-                id = data.append()
-
-            print("Task:", task)
-        else:
-            choice = input("No outstanding tasks found. Would you like to make a new task? (y/n): ")
-            match choice:
-                case "y":
-                    id = data.append()
-                case "n":
-                    print("Exiting.")
-                case _:
-                    print("Invalid input.")
-
-        data.start_work(id)
-        data.finish_work(id)
-
-    def delete():
-        data.delete()
-
-    def new_tasks():
-        data.append()
-
-    @add_params(
-        click.option("--sort", default="created", help="Sort by column."),
-        click.option("--reverse", default=True, help="Reverse sort order."),
-    )
-    def list_tasks(sort, reverse):
-        pl_print(data.formatted(data.df).sort(sort, descending=reverse), drop=None)
-
-    def complete():
-        data.complete()
+@cache
+def get_data():
+    """The default task store, opened on first use rather than at import."""
+    return Data(segments=True)
 
 
 if __name__ == "__main__":
     import sys
 
+    from tasker.commands.task_cli import TaskCLI
+
     if not hasattr(sys, "ps1"):
         cli = TaskCLI()
         cli.run()
@@ -0,0 +1,272 @@
+# %%
+import pickle
+from datetime import datetime, timedelta
+
+import pytest
+
+from tasker import backends, storage, task
+
+
+@pytest.fixture
+def store(tmp_path, fname="tasks_backend.csv"):
+    return tmp_path / fname
+
+
+def test_sqlite_backend(store):
+    data = task.Data(fp=store, format="sqlite")
+    assert data.fp.suffix == ".sqlite"
+    assert data.append("task 0") == 0
+    assert data.append("task 1") == 1
+    data._set(0, "completed", True)
+    data._add(1, "worked", timedelta(minutes=5))
+    data._add(1, "worked", timedelta(minutes=10))
+    assert data.df.schema == task.df_schema
+    assert data.get(1, "worked") == timedelta(minutes=15)
+    assert data.todo["id"].to_list() == [1]
+    assert data.done["id"].to_list() == [0]
+
+    data.delete(1)
+    # ids are not reused
+    assert data.append("task 2") == 2
+    # reopening detects the format and sees the changes of other connections
+    fresh = task.Data(fp=store)
+    assert isinstance(fresh.backend, backends.SqliteBackend)
+    assert sorted(fresh.df["task"]) == ["task 0", "task 2"]
+    data._set(2, "task", "renamed")
+    assert fresh.get(2, "task") == "renamed"
+
+
+@pytest.mark.parametrize("format", ["parquet", "sqlite"])
+def test_write_max_id(store, format):
+    data = task.Data(fp=store, format=format)
+    data.append("task 0")
+    # max_id is the second argument of every backend
+    data.backend.write(data.backend.read(), 9)
+    assert data.append("task 1") == 10
+    # nor are the ids written, once the task with the largest is deleted
+    data.write(data.df.with_columns(id=task.pl.Series([12, 11])))
+    data.delete(12)
+    assert data.append("task 2") == 13
+
+
+def test_sqlite_scan_cached(store, monkeypatch):
+    data = task.Data(fp=store, format="sqlite")
+    data.append("task 0")
+    assert data.backend.scan().collect().equals(data.backend.read())
+    # served from the cache of read, not the database
+    monkeypatch.setattr(data.backend, "_select", None)
+    assert len(data.backend.scan().collect()) == 1
+
+
+def test_sqlite_transaction(store):
+    data = task.Data(fp=store, format="sqlite")
+    data.append("existing")
+    with data.transaction() as txn:
+        data.append("new task")
+        data._set(-1, "completed", True)
+    assert data.get(txn.ids[-1], "completed") is True
+
+    with pytest.raises(ValueError):
+        with data.transaction():
+            data._set(0, "task", "changed")
+            data.append("")
+    assert data.get(0, "task") == "existing"
+
+
+def test_sqlite_indexes(store):
+    backend = task.Data(fp=store, format="sqlite").backend
+    for column, value in (("completed", 0), ("created", 0)):
+        plan = backend.conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT * FROM tasks WHERE {column} >= ?", (value,)
+        ).fetchall()
+        assert f"tasks_{column}" in str(plan)
+
+
+def test_sqlite_scan_filters(store):
+    data = task.Data(fp=store, format="sqlite")
+    data.append("old")
+    data._set(0, "created", datetime(2024, 1, 1))
+    data.append("new")
+    assert data.scan(since=datetime(2025, 1, 1)).collect()["task"].to_list() == ["new"]
+    assert data.recent("36500d").height == 2
+
+
+def test_convert_sqlite(store):
+    data = task.Data(fp=store, segments=True)
+    for i in range(3):
+        data.append(f"task {i}")
+    data.delete(2)
+    expected = data.df
+
+    data.convert("sqlite")
+    assert not store.with_suffix(".parquet").exists()
+    fresh = task.Data(fp=store)
+    assert fresh.backend.format == "sqlite"
+    assert fresh.df.equals(expected)
+    # the deleted id stays allocated
+    assert fresh.append("task 3") == 3
+
+    fresh.convert("ipc")
+    assert not store.with_suffix(".sqlite").exists()
+    assert task.Data(fp=store).backend.format == "ipc"
+    assert task.Data(fp=store).append("task 4") == 4
+
+
+def test_detect_format(store):
+    assert backends.detect_format(store) == "parquet"
+    task.Data(fp=store, format="sqlite").append("task")
+    assert backends.detect_format(store) == "sqlite"
+
+
+def assert_rollup_matches(data):
+    """The incrementally kept rollup equals one built from scratch."""
+    rollup, expected = data.backend.rollup(), storage.Rollup.build(data.backend.read())
+    assert (rollup.counts, rollup.days, rollup.latest_created) == (
+        expected.counts,
+        expected.days,
+        expected.latest_created,
+    )
+
+
+@pytest.mark.parametrize("layout", ["plain", "segments", "partitioned", "sqlite"])
+def test_rollup_incremental(store, layout, tmp_path):
+    data = task.Data(
+        fp=store,
+        segments=layout == "segments",
+        partitioned=layout == "partitioned",
+        format="sqlite" if layout == "sqlite" else None,
+    )
+    first = data.append("task 0")
+    second = data.append("task 1")
+    data._set(first, "created", datetime(2024, 5, 1, 9))
+    data._add(first, "worked", timedelta(minutes=30))
+    data.complete(first)
+    assert_rollup_matches(data)
+    assert data.backend.rollup().counts == {False: 1, True: 1}
+
+    # removing and changing the newest task
+    data.delete(second)
+    assert_rollup_matches(data)
+    assert data.backend.rollup().latest_created == datetime(2024, 5, 1, 9)
+    third = data.append("task 2")
+    data._set(third, "created", datetime(2024, 6, 1))
+    assert_rollup_matches(data)
+
+    with data.transaction():
+        data.append("task 3")
+        data._set(-1, "completed", True)
+        data.delete(first)
+    assert_rollup_matches(data)
+
+    source = tmp_path / "import.csv"
+    source.write_text("task,completed\nimported,true\nimported 2,false\n")
+    data.import_tasks(source)
+    data.compact()
+    assert_rollup_matches(data)
+    assert data.backend.rollup().counts == {False: 2, True: 2}
+
+
+@pytest.mark.parametrize("layout", ["plain", "segments", "partitioned", "sqlite"])
+def test_search_in_sync(store, layout):
+    data = task.Data(
+        fp=store,
+        segments=layout == "segments",
+        partitioned=layout == "partitioned",
+        format="sqlite" if layout == "sqlite" else None,
+    )
+    first, second = data.append("Write the report"), data.append("Review the reports")
+    assert data.search("report")["id"].to_list() == [first, second]
+    index = data.backend.search_index
+    build = index._meta()["build"]
+
+    # commits are logged and searched without rebuilding the index
+    third = data.append("Report to the team")
+    data._set(first, "task", "Write the summary")
+    data.complete(second)
+    data.delete(third)
+    assert data.search("report")["task"].to_list() == ["Review the reports"]
+    assert data.search("summ")["id"].to_list() == [first]
+    data.compact()
+    assert data.search("review")["completed"].to_list() == [True]
+    assert index._meta()["build"] == build
+
+    # a change the index did not record makes it stale
+    data.write(data.df.filter(task.col("id") != first))
+    assert data.search("summary").is_empty()
+    assert index._meta()["build"] != build
+    assert task.Data(fp=store).search("the")["id"].to_list() == [second]
+
+
+def test_rollup_rebuilt(store):
+    data = task.Data(fp=store)
+    data.append("task 0")
+    # left behind by a writer that did not update it, or missing
+    data.backend.rollup_path.write_bytes(b"")
+    other = task.Data(fp=store)
+    assert other.backend.rollup().counts == {False: 1, True: 0}
+    data.backend._rollup = None
+    data.backend.rollup_path.unlink()
+    assert data.backend.rollup().tasks == 1
+    assert data.backend.rollup_path.exists()
+    # pickled by a version whose classes are gone
+    data.backend._rollup = None
+    pickled = pickle.dumps(storage.Rollup())
+    data.backend.rollup_path.write_bytes(pickled.replace(b"Rollup", b"Rollop"))
+    assert data.backend.rollup().tasks == 1
+
+
+def test_sqlite_rollup_tables(store):
+    data = task.Data(fp=store, format="sqlite")
+    first, second = data.append("task 0"), data.append("task 1")
+    # days before the epoch, and tasks without a creation time
+    data._set(first, "created", datetime(1969, 12, 31, 23))
+    data._set(second, "created", None)
+    assert_rollup_matches(data)
+    assert set(data.backend.rollup().days) == {-1, None}
+
+    # a database written when the rollup was a pickle in the meta table
+    conn = data.backend.conn
+    with conn:
+        conn.execute("DROP TABLE rollup_days")
+        conn.execute("INSERT INTO meta (name, value) VALUES ('rollup', x'00')")
+    data.backend.close()
+    data = task.Data(fp=store, format="sqlite")
+    data.append("task 2")
+    assert_rollup_matches(data)
+    assert data.backend.rollup().tasks == 3
+    query = "SELECT COUNT(*) FROM meta WHERE name = 'rollup'"
+    assert data.backend.conn.execute(query).fetchone() == (0,)
+
+
+def test_summary(store):
+    data = task.Data(fp=store, segments=True)
+    first, second = data.append("task 0"), data.append("task 1")
+    data._set(first, "created", datetime(2024, 5, 1, 9))
+    data._add(first, "worked", timedelta(minutes=30))
+    data.complete(second)
+    data.log_session(first, datetime(2024, 5, 2, 9), datetime(2024, 5, 2, 10))
+
+    summary = data.summary()
+    assert (summary["open"], summary["completed"]) == (1, 1)
+    assert summary["latest_created"] == data.get(second, "created")
+    by_day = summary["worked_by_day"].filter(task.col("day") < datetime(2024, 6, 1).date())
+    assert by_day.rows() == [
+        (datetime(2024, 5, 1).date(), 1, timedelta(minutes=30)),
+        (datetime(2024, 5, 2).date(), 0, timedelta(hours=1)),
+    ]
+    assert summary["worked_by_task"].rows() == [(first, timedelta(hours=1))]
+
+
+def test_rollup_small_changes(monkeypatch):
+    # a handful of rows are aggregated in python, the same as by polars
+    from tasker.benchmarks import generate_tasks
+
+    df = generate_tasks(50).vstack(generate_tasks(1).with_columns(created=None, worked=None))
+    small = storage.Rollup.build(df)
+    monkeypatch.setattr(storage.Rollup, "SMALL", 0)
+    large = storage.Rollup.build(df)
+    assert (small.counts, small.days, small.latest_created) == (
+        large.counts,
+        large.days,
+        large.latest_created,
+    )
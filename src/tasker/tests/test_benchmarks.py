@@ -0,0 +1,23 @@
+# %%
+import json
+from datetime import datetime
+
+from tasker import benchmarks, task
+
+
+def test_generate_tasks():
+    end = datetime(2024, 1, 1)
+    df = benchmarks.generate_tasks(1000, seed=1, end=end)
+    assert df.schema == task.df_schema
+    assert df["id"].to_list() == list(range(1000))
+    assert df["created"].is_sorted()
+    assert df["created"].max() <= end
+    assert df.equals(benchmarks.generate_tasks(1000, seed=1, end=end))
+    assert not df.equals(benchmarks.generate_tasks(1000, seed=2, end=end))
+
+
+def test_bench_data(tmp_path):
+    results = benchmarks.bench_data(100, tmp_path, repeat=1)
+    assert {r["name"] for r in results} >= {"df_cold", "append", "cli_list"}
+    assert all(r["size"] == 100 and r["min"] >= 0 for r in results)
+    json.dumps(results)
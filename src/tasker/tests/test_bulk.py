@@ -0,0 +1,146 @@
+# %%
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from tasker import bulk, task
+
+
+@pytest.fixture
+def tasks_df():
+    return pl.DataFrame(
+        {
+            "task": [f"imported {i}" for i in range(25)],
+            "completed": [i % 2 == 0 for i in range(25)],
+            "created": [datetime(2024, 1 + i % 12, 1) for i in range(25)],
+        }
+    )
+
+
+@pytest.fixture(params=["plain", "segments", "partitioned", "sqlite"])
+def data(request, tmp_path):
+    data = task.Data(
+        fp=tmp_path / f"tasks_import_{request.param}.csv",
+        segments=request.param == "segments",
+        partitioned=request.param == "partitioned",
+        format="sqlite" if request.param == "sqlite" else None,
+    )
+    data.append("existing")
+    return data
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".jsonl", ".parquet"])
+def test_import_tasks(data, tasks_df, tmp_path, suffix):
+    source = tmp_path / f"dump{suffix}"
+    match suffix:
+        case ".csv":
+            tasks_df.write_csv(source)
+        case ".jsonl":
+            tasks_df.write_ndjson(source)
+        case ".parquet":
+            tasks_df.write_parquet(source)
+    progress = []
+    ids = data.import_tasks(source, chunk_size=10, progress=progress.append)
+    assert ids == range(1, 26)
+    assert progress == [10, 20, 25]
+    if getattr(data.backend, "segmented", False):
+        # the imported rows are streamed into the base file, the segment of "existing" stays
+        assert len(data.backend.segments.paths()) == 1
+
+    data.invalidate()
+    df = data.df.sort("id")
+    assert df["id"].to_list() == list(range(26))
+    assert df["task"][1:].to_list() == tasks_df["task"].to_list()
+    assert df["completed"][1:].to_list() == tasks_df["completed"].to_list()
+    assert df["created"][1:].to_list() == tasks_df["created"].to_list()
+    # the next append continues after the imported block
+    assert data.append("after") == 26
+
+
+def test_normalize_defaults():
+    now = datetime(2024, 5, 1)
+    chunk = pl.DataFrame({"task": ["a", "b"], "worked": [90, None]})
+    df = bulk.normalize(chunk, 7, task.df_schema, now=now)
+    assert df.schema == task.df_schema
+    assert df["id"].to_list() == [7, 8]
+    assert df["completed"].to_list() == [False, False]
+    assert df["created"].to_list() == [now, now]
+    assert df["worked"].to_list() == [timedelta(seconds=90), timedelta(0)]
+
+
+def test_normalize_errors():
+    with pytest.raises(ValueError, match="'task' column"):
+        bulk.normalize(pl.DataFrame({"name": ["a"]}), 0, task.df_schema)
+    with pytest.raises(ValueError, match="empty"):
+        bulk.normalize(pl.DataFrame({"task": ["a", ""]}), 0, task.df_schema)
+
+
+def test_import_failure_stores_nothing(data, tmp_path):
+    source = tmp_path / "dump.csv"
+    pl.DataFrame({"task": ["ok"] * 5 + [None]}).write_csv(source)
+    with pytest.raises(ValueError):
+        data.import_tasks(source, chunk_size=2)
+    data.invalidate()
+    assert data.df["task"].to_list() == ["existing"]
+    assert data.append("next") == 1
+
+
+def test_read_chunks_unknown_format(tmp_path):
+    source = tmp_path / "dump.xlsx"
+    source.touch()
+    with pytest.raises(ValueError, match="Cannot import"):
+        list(bulk.read_chunks(source))
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".jsonl", ".arrow", ".parquet"])
+def test_export_round_trip(data, tasks_df, tmp_path, suffix):
+    source = tmp_path / "dump.parquet"
+    tasks_df.write_parquet(source)
+    data.import_tasks(source)
+    # leave a change and a deletion in the segments, if any
+    data._set(3, "completed", True)
+    data._add(3, "worked", timedelta(minutes=5, milliseconds=500))
+    data.delete(4)
+    # a SQLite store is read a few rows at a time
+    data.backend.batch_size = 7
+
+    dest = tmp_path / f"export{suffix}"
+    data.export(dest)
+    if suffix == ".arrow":
+        exported = pl.read_ipc(dest)
+    else:
+        # read back the way `tasker import` would, keeping the exported ids
+        chunk = pl.concat(bulk.read_chunks(dest))
+        exported = bulk.normalize(chunk, 0, task.df_schema).with_columns(id=chunk["id"])
+    assert exported.sort("id").equals(data.df.sort("id"))
+
+
+def test_export_filters(data, tasks_df, tmp_path):
+    source = tmp_path / "dump.parquet"
+    tasks_df.write_parquet(source)
+    data.import_tasks(source)
+    dest = tmp_path / "export.csv"
+    data.export(
+        dest,
+        columns=["id", "task"],
+        completed=True,
+        since=datetime(2024, 3, 1),
+        until=datetime(2024, 6, 1),
+    )
+    exported = pl.read_csv(dest)
+    expected = data.df.filter(
+        pl.col("completed"),
+        pl.col("created") >= datetime(2024, 3, 1),
+        pl.col("created") < datetime(2024, 6, 1),
+    )
+    assert exported.columns == ["id", "task"]
+    assert sorted(exported["id"]) == sorted(expected["id"])
+    assert len(exported) > 0
+
+
+def test_export_format_errors(tmp_path):
+    assert bulk.export_format(tmp_path / "x.feather") == "ipc"
+    assert bulk.export_format(tmp_path / "x.txt", "ndjson") == "ndjson"
+    with pytest.raises(ValueError, match="Cannot export"):
+        bulk.export_format(tmp_path / "x.txt")
@@ -0,0 +1,87 @@
+# %%
+import io
+import os
+import signal
+import time
+
+import pytest
+
+from tasker import countdown
+
+
+def test_time_string():
+    assert countdown.time_string(61) == "01:01"
+    assert countdown.time_string(59.6) == "01:00"
+    assert countdown.time_string(59.94, tenths=True) == "00:59.9"
+    assert countdown.time_string(0, tenths=True) == "00:00.0"
+
+
+def test_get_number_lines():
+    lines = countdown.get_number_lines(0)
+    assert len(lines) == 5
+    # four digits and the colon, each followed by a space
+    assert len(lines[0]) == 4 * 7 + 3
+    assert len(countdown.get_number_lines(0, tenths=True)[0]) == len(lines[0]) + 3 + 7
+
+
+def test_renderer_diff():
+    stream = io.StringIO()
+    renderer = countdown.Renderer("a task", stream=stream)
+    renderer.size = os.terminal_size((80, 24))
+    renderer.draw(60)
+    full = stream.getvalue()
+    assert full.startswith(countdown.CLEAR) and "a task" in full
+
+    stream.seek(0), stream.truncate()
+    renderer.draw(59)
+    diff = stream.getvalue()
+    # three of the digits change, the first one and the colon do not
+    assert countdown.CLEAR not in diff
+    assert diff.count("\033[") == 3 * 5
+
+    stream.seek(0), stream.truncate()
+    renderer.draw(59.2)
+    assert stream.getvalue() == ""
+
+
+def test_renderer_diff_matches_full_frame():
+    # drawing a frame as a diff puts the glyphs where a full redraw would
+    renderer = countdown.Renderer(stream=io.StringIO())
+    renderer.size = os.terminal_size((60, 20))
+    renderer.draw(0)
+    row, column = renderer.origin
+    diff = renderer.frame("00:19")
+    full = countdown.Renderer(stream=io.StringIO())
+    full.size = renderer.size
+    lines = full.frame("00:19").removeprefix(countdown.CLEAR).split("\n")
+    glyph = countdown.GLYPHS["1"]
+    # after two digits and the colon
+    offset = 7 * 2 + 3
+    assert [line[column - 1 + offset :][:6] for line in lines[row - 1 : row + 4]] == glyph
+    assert f"\033[{row};{column + offset}H{glyph[0]}" in diff
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGWINCH"), reason="no SIGWINCH")
+def test_renderer_resize():
+    renderer = countdown.Renderer(stream=io.StringIO())
+    renderer.draw(5)
+    assert renderer.shown is not None
+    with renderer.watch_resize():
+        os.kill(os.getpid(), signal.SIGWINCH)
+        time.sleep(0.01)
+    assert renderer.shown is None
+    assert signal.getsignal(signal.SIGWINCH) != renderer.resize
+
+
+def test_countdown_tenths_cpu(monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setattr(countdown.sys, "stdout", stream)
+    start, cpu = time.monotonic(), time.process_time()
+    timer = countdown.countdown(1, tenths=True)
+    wall, cpu = time.monotonic() - start, time.process_time() - cpu
+    assert timer.expired and wall == pytest.approx(1, abs=0.05)
+    # mostly asleep between the ticks
+    assert cpu < 0.1 * wall
+
+
+# %%
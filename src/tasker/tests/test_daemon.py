@@ -0,0 +1,79 @@
+# %%
+import io
+import os
+from pathlib import Path
+
+import pytest
+
+from tasker import daemon
+from tasker.benchmarks import serving
+from tasker.task import Data
+
+
+@pytest.fixture
+def socket(tmp_path, monkeypatch):
+    socket = tmp_path / "tasker.sock"
+    monkeypatch.setenv("TASKER_SOCKET", str(socket))
+    monkeypatch.setenv("TASKER_STORE", str(tmp_path / "tasks.csv"))
+    return socket
+
+
+def stdin(text):
+    """A file descriptor reading `text`, like a piped stdin."""
+    read, write = os.pipe()
+    os.write(write, text.encode())
+    os.close(write)
+    return read
+
+
+def run(*argv, input=""):
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+    code = daemon.forward(list(argv), stdin(input), stdout, stderr)
+    return code, stdout.getvalue().decode(), stderr.getvalue().decode()
+
+
+def test_forward_without_daemon(socket):
+    assert not socket.exists()
+    assert daemon.forward(["list"]) is None
+
+
+def test_command_name():
+    assert daemon.command_name(["--profile", "list", "--limit", "3"]) == "list"
+    assert daemon.command_name(["--profile-output", "x.prof", "todo"]) == "todo"
+    assert daemon.command_name(["--profile-output=x.prof", "countdown", "1s"]) == "countdown"
+    assert daemon.command_name(["--help"]) is None
+
+
+def test_runs_locally():
+    assert not daemon.runs_locally(["list", "--limit", "3"])
+    assert daemon.runs_locally(["list", "--pager"])
+    assert daemon.runs_locally(["--profile", "new"])
+    assert not daemon.runs_locally(["search", "--", "--pager"])
+
+
+def test_serve(socket, tmp_path):
+    Data(fp=tmp_path / "tasks.csv").append("served task")
+    with serving(tmp_path / "tasks.csv", socket):
+        code, out, _ = run("list")
+        assert code == 0
+        assert "served task" in out
+
+        # relative paths are resolved in the client's working directory
+        cwd = os.getcwd()
+        os.chdir(tmp_path)
+        try:
+            assert run("export", "tasks.jsonl")[0] == 0
+        finally:
+            os.chdir(cwd)
+        assert "served task" in (tmp_path / "tasks.jsonl").read_text()
+
+        code, _, err = run("bogus")
+        assert code == 2
+        assert "No such command 'bogus'" in err
+
+        # commands that drive the terminal or prompt run in the client
+        assert daemon.forward(["new"]) is None
+        assert daemon.forward(["list", "--pager"]) is None
+        assert daemon.forward(["countdown", "1s"]) is None
+        assert daemon.forward(["--profile-output", "x.prof", "countdown", "1s"]) is None
+    assert not Path(socket).exists()
@@ -0,0 +1,41 @@
+# %%
+from datetime import timedelta
+
+import polars as pl
+import pytest
+
+from tasker.utils.helpers import parse_timedelta_string, timedelta_to_string
+
+
+@pytest.mark.parametrize(
+    "td, expected",
+    [
+        (None, None),
+        (timedelta(0), "0:00:00"),
+        (timedelta(seconds=59.9), "0:00:59"),
+        (timedelta(hours=5, minutes=30, seconds=15), "5:30:15"),
+        (timedelta(days=1, hours=2, minutes=3, seconds=4), "1d 26:03:04"),
+        (timedelta(seconds=-1), "-1d -1:59:59"),
+    ],
+)
+def test_timedelta_to_string(td, expected):
+    assert timedelta_to_string(td) == expected
+    # the polars expression formats the same way
+    series = pl.Series("worked", [td], pl.Duration("us"))
+    assert pl.select(timedelta_to_string(pl.lit(series))).item() == expected
+
+
+def test_timedelta_to_string_lazy():
+    lf = pl.LazyFrame({"worked": [timedelta(minutes=90), None]})
+    result = lf.select(timedelta_to_string(pl.col("worked"))).collect()
+    assert result["worked"].to_list() == ["1:30:00", None]
+
+
+def test_parse_timedelta_string():
+    assert parse_timedelta_string("60m") == timedelta(minutes=60)
+    assert parse_timedelta_string("2d5h10m") == timedelta(days=2, hours=5, minutes=10)
+    with pytest.raises(ValueError):
+        parse_timedelta_string("5m2h")
+    for invalid in ("", "yesterday", "5x", "1h 30m"):
+        with pytest.raises(ValueError):
+            parse_timedelta_string(invalid)
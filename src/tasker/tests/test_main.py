@@ -0,0 +1,48 @@
+# %%
+import os
+import subprocess
+import sys
+
+import pytest
+
+# run the cli in a fresh interpreter and report which heavy modules it imported
+SCRIPT = """
+import sys
+from tasker.__main__ import main
+try:
+    main({argv!r})
+except SystemExit:
+    pass
+print("imported:" + ",".join(m for m in ("polars", "loguru", "tasker.task") if m in sys.modules))
+"""
+
+
+@pytest.mark.parametrize("argv", [["--help"], ["countdown", "--help"], ["list", "--help"]])
+def test_startup_imports(argv):
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(argv=argv)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert "Usage:" in result.stdout
+    assert result.stdout.splitlines()[-1] == "imported:"
+
+
+def test_profile(tmp_path):
+    store = tmp_path / "tasks.csv"
+    store.write_text("task,completed,created,worked\n")
+    env = {**os.environ, "TASKER_STORE": str(store), "TASKER_SOCKET": str(tmp_path / "none")}
+    result = subprocess.run(
+        [sys.executable, "-m", "tasker", "--profile-output", tmp_path / "out.prof", "list"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    )
+    # the report follows any log lines
+    phases = [line.split()[0] for line in result.stderr.splitlines() if line.strip()]
+    phases = phases[phases.index("phase") :]
+    assert phases[:4] == ["phase", "startup", "list", "imports"]
+    assert "query" in phases and "total" in phases
+    assert (tmp_path / "out.prof").stat().st_size > 0
@@ -0,0 +1,90 @@
+# %%
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from tasker import countdown, notify
+from tasker.utils.cmd_options import CmdOptions
+
+
+class Blocked:
+    """Sink that waits until released."""
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.sent = []
+
+    def send(self, title, message):
+        self.release.wait(5)
+        self.sent.append((title, message))
+
+
+def test_sinks(tmp_path):
+    bell, file, command = notify.sinks(f"bell, file:{tmp_path}/log,command:echo {{title}}, a")
+    assert isinstance(bell, notify.Bell) and file.path == tmp_path / "log"
+    assert command.argv("Task", "Time's up!") == ["echo", "Task,", "a"]
+    assert notify.sinks("none") == []
+    with pytest.raises(ValueError):
+        notify.sinks("pager")
+
+    say = notify.Command("say", "{message}", options=CmdOptions(voice="Daniel"))
+    assert say.argv("Task", "Hours up!") == ["say", "--voice=Daniel", "Hours up!"]
+
+
+def test_dispatcher(tmp_path):
+    stream = io.StringIO()
+    dispatcher = notify.Dispatcher([notify.Bell(stream), notify.FileSink(tmp_path / "log")])
+    assert dispatcher.notify("Task", "Time's up!")
+    dispatcher.join()
+    assert stream.getvalue() == "\a"
+    assert (tmp_path / "log").read_text() == "Task\tTime's up!\n"
+    dispatcher.close()
+
+
+def test_dispatcher_never_blocks():
+    sink = Blocked()
+    dispatcher = notify.Dispatcher([sink], maxsize=1)
+    start = time.monotonic()
+    # the first is being sent, the second waits in the queue, the third is dropped
+    results = [dispatcher.notify("Task", str(i)) for i in range(3)]
+    assert time.monotonic() - start < 0.1
+    assert results[-1] is False and dispatcher.dropped >= 1
+    sink.release.set()
+    dispatcher.join()
+    assert sink.sent[0] == ("Task", "0")
+    dispatcher.close()
+
+
+def test_dispatcher_failing_sink(tmp_path):
+    fifo = tmp_path / "fifo"
+    os.mkfifo(fifo)
+    sink = Blocked()
+    sink.release.set()
+    # nothing reads the FIFO, so it fails without blocking the next sinks
+    dispatcher = notify.Dispatcher([notify.FileSink(fifo), notify.Command("false"), sink])
+    dispatcher.notify("Task", "Time's up!")
+    dispatcher.join()
+    assert sink.sent == [("Task", "Time's up!")]
+
+    reader = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+    dispatcher.notify("Task", "again")
+    dispatcher.join()
+    assert os.read(reader, 100) == b"Task\tagain\n"
+    os.close(reader)
+    dispatcher.close()
+
+
+def test_countdown_notify(monkeypatch, tmp_path):
+    dispatcher = notify.Dispatcher([notify.FileSink(tmp_path / "log")])
+    monkeypatch.setattr(notify, "get_dispatcher", lambda: dispatcher)
+    monkeypatch.setattr(countdown.Renderer, "draw", lambda self, remaining: None)
+    countdown.countdown(0.02, title="a task", interval=0.01, notify=True)
+    dispatcher.join()
+    assert (tmp_path / "log").read_text() == "a task\tTime's up!\n"
+    dispatcher.close()
+
+
+# %%
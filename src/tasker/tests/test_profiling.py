@@ -0,0 +1,41 @@
+# %%
+import io
+import pstats
+import time
+
+from tasker.utils import profiling
+
+
+@profiling.timed("outer")
+def outer():
+    with profiling.span("inner"):
+        time.sleep(0.01)
+    with profiling.span("inner"):
+        pass
+
+
+def test_spans_off():
+    outer()
+    assert not profiling.enabled()
+
+
+def test_profiler(tmp_path):
+    stream = io.StringIO()
+    with profiling.Profiler(tmp_path / "out.prof", since=time.perf_counter(), stream=stream) as p:
+        assert profiling.enabled()
+        outer()
+        outer()
+    assert not profiling.enabled()
+    assert list(p.spans) == [("startup",), ("outer",), ("outer", "inner")]
+    assert p.spans[("outer", "inner")][0] == 4
+    assert p.spans[("outer",)][1] >= p.spans[("outer", "inner")][1] >= 0.02
+
+    lines = stream.getvalue().splitlines()
+    assert lines[0].split() == ["phase", "calls", "ms", "%"]
+    assert lines[3].startswith("  inner") and lines[3].split()[1] == "4"
+    assert lines[4].startswith("total")
+    stats = pstats.Stats(str(tmp_path / "out.prof"))
+    assert any(func[2] == "outer" for func in stats.stats)
+
+
+# %%
@@ -0,0 +1,70 @@
+# %%
+import polars as pl
+
+from tasker import search
+
+
+def tasks(*names, start=0):
+    return pl.DataFrame({"id": range(start, start + len(names)), "task": list(names)})
+
+
+def test_words():
+    assert search.words("Fix the parser, fix it!") == ["fix", "the", "parser", "it"]
+    assert search.words(" -- ") == []
+
+
+def test_search_ranking(tmp_path):
+    index = search.SearchIndex(tmp_path / "tasks.parquet")
+    assert index.stale(1) and index.search("report") == []
+    index.build(
+        tasks(
+            "Write the report",
+            "Reports for Q3",
+            "Misreported hours",
+            "report review",
+            "Read the news",
+        ),
+        1,
+    )
+    assert not index.stale(1) and index.stale(2)
+    # exact words, then prefixes, then substrings, newest first
+    assert index.search("report") == [3, 0, 1, 2]
+    assert index.search("REPORT", limit=2) == [3, 0]
+    # every word has to match
+    assert index.search("the rep") == [0]
+    assert index.search("re the") == [4, 0]
+    assert index.search("zebra") == []
+    assert index.search("") == []
+
+
+def test_search_delta(tmp_path):
+    index = search.SearchIndex(tmp_path / "tasks.parquet")
+    index.build(tasks("Plan the sprint", "Review notes"), "v1")
+    # a rename, a completion that leaves the name alone, a delete and an append
+    removed = tasks("Plan the sprint", "Review notes")
+    added = tasks("Plan the release").vstack(tasks("Sprint review", start=2))
+    index.record("v1", "v2", removed, added)
+    assert index.version() == repr("v2")
+    assert index.search("sprint") == [2]
+    assert index.search("plan") == [0]
+    assert index.search("review") == [2]
+    # a commit from another version is not logged, the index is then stale
+    index.record("v1", "v3", None, tasks("lost"))
+    assert index.version() == repr("v2") and index.stale("v3")
+
+    # a fresh reader replays the log
+    other = search.SearchIndex(tmp_path / "tasks.parquet")
+    assert other.search("sprint") == [2]
+    index.max_delta = 1
+    assert index.stale("v2")
+
+    index.build(tasks("Plan the release", start=0).vstack(tasks("Sprint review", start=2)), "v4")
+    assert index.version() == repr("v4")
+    # the files of the old build and its log are gone
+    assert len(list(index.dir.iterdir())) == 3
+    assert other.search("review") == [2]
+    index.remove()
+    assert not index.dir.exists()
+
+
+# %%
@@ -0,0 +1,62 @@
+# %%
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from tasker import stats
+from tasker.task import df_schema
+
+
+def tasks(*rows):
+    """Tasks from (created, completed, worked minutes) tuples."""
+    rows = [
+        (i, f"task {i}", done, created, worked) for i, (created, done, worked) in enumerate(rows)
+    ]
+    df = pl.DataFrame(rows, schema=list(df_schema), orient="row")
+    return df.with_columns(pl.duration(minutes="worked").alias("worked")).cast(df_schema)
+
+
+def test_report_daily():
+    df = tasks(
+        (datetime(2024, 5, 1, 9), True, 30),
+        (datetime(2024, 5, 1, 17), False, 10),
+        (datetime(2024, 5, 3, 12), True, 60),
+    )
+    report = stats.report(df.lazy(), "1d", "2d")
+    assert report["period"].to_list() == [datetime(2024, 5, d).date() for d in (1, 3)]
+    assert report["created"].to_list() == [2, 1]
+    assert report["completed"].to_list() == [1, 1]
+    assert report["rate"].to_list() == [0.5, 1.0]
+    assert report["worked"].to_list() == [timedelta(minutes=40), timedelta(minutes=60)]
+    assert report["open"].to_list() == [1, 1]
+    # the window of the 3rd reaches back to, but not including, the 1st
+    assert report["worked_2d"].to_list() == [timedelta(minutes=40), timedelta(minutes=60)]
+    assert report["rate_2d"].to_list() == [0.5, 1.0]
+
+
+@pytest.mark.parametrize(
+    "every, window, periods, worked",
+    [
+        ("1w", "2w", [datetime(2024, 4, 29).date(), datetime(2024, 5, 6).date()], [40, 100]),
+        ("1mo", "3mo", [datetime(2024, 5, 1).date()], [100]),
+    ],
+)
+def test_report_periods(every, window, periods, worked):
+    df = tasks(
+        (datetime(2024, 5, 1, 9), True, 30),
+        (datetime(2024, 5, 2, 9), False, 10),
+        (datetime(2024, 5, 8, 12), True, 60),
+    )
+    report = stats.report(df.lazy(), every, window)
+    assert report["period"].to_list() == periods
+    assert report[f"worked_{window}"].to_list() == [timedelta(minutes=m) for m in worked]
+
+
+def test_report_empty():
+    report = stats.report(pl.LazyFrame(schema=df_schema))
+    assert report.is_empty()
+    assert report.columns[-2:] == ["worked_7d", "rate_7d"]
+
+
+# %%
@@ -1,21 +1,50 @@
 # %%
+import asyncio
+import multiprocessing
+import re
+import shutil
+from datetime import datetime, timedelta
 from pathlib import Path
 
 import pytest
 
-from tasker import task
+from tasker import task, timers
 
 cwd = Path(__file__).resolve().parent
 
 
 @pytest.fixture
-def data(fname="tasks.csv"):
-    return task.Data(fp=cwd / f"data/{fname}")
+def store(tmp_path):
+    return tmp_path / "tasks_write.csv"
 
 
 @pytest.fixture
-def data_write(fname="tasks_write.csv"):
-    return task.Data(fp=cwd / f"data/{fname}")
+def data(tmp_path, fname="tasks"):
+    # a copy, so reading it leaves no lock file beside the fixture
+    shutil.copy(cwd / f"data/{fname}.parquet", tmp_path)
+    return task.Data(fp=tmp_path / f"{fname}.csv")
+
+
+@pytest.fixture
+def data_write(store):
+    return task.Data(fp=store)
+
+
+@pytest.fixture
+def data_segments(store):
+    return task.Data(fp=store, segments=True)
+
+
+def created_df(*months):
+    """A store with one task created on the first of each (year, month)."""
+    return task.pl.DataFrame(
+        [
+            (i, f"task {i}", False, datetime(year, month, 1), timedelta(0))
+            for i, (year, month) in enumerate(months)
+        ],
+        schema=task.df_schema,
+        orient="row",
+    )
 
 
 # write tests for the Data class
@@ -29,18 +58,15 @@ def test_data_write(data_write):
     df = data_write.df
     data_write.write(df)
     assert (data_write.fp).exists()
-    Path(data_write.fp).unlink()  # cleanup
 
 
 def test_data_append(data_write):
-    Path(data_write.fp).unlink(missing_ok=True)
     _ = data_write.df  # initialise dataframe
     _ = data_write.append("test task")
     assert data_write.df.shape == (1, 5)
     assert data_write.df["task"][0] == "test task"
     assert data_write.df["completed"][0] == False  # noqa: E712
     assert data_write.df["created"][0] == data_write.df["created"].max()
-    Path(data_write.fp).unlink()  # cleanup
 
 
 def test_data_formatted(data):
@@ -57,8 +83,15 @@ def test_data_formatted(data):
     assert "completed" not in formatted.columns
 
 
+def test_pl_print_rows():
+    df = task.Data.formatted(created_df(*[(2024, month) for month in range(1, 13)]))
+    for tbl_rows in (4, 5):
+        shown = task.pl_print(df, string=True, tbl_rows=tbl_rows)
+        assert "null" not in shown
+        assert len(re.findall(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d", shown)) == tbl_rows
+
+
 def test_data_append_empty(data_write):
-    Path(data_write.fp).unlink(missing_ok=True)
     with pytest.raises(ValueError):
         _ = data_write.append("")
     assert data_write.df.shape == (0, 5)
@@ -66,43 +99,411 @@ def test_data_append_empty(data_write):
 
 
 def test_data_delete(data_write):
-    Path(data_write.fp).unlink(missing_ok=True)
     _ = data_write.append("test task")
     _ = data_write.append("test task 2")
     assert data_write.df.shape == (2, 5)
     _ = data_write.delete(0)
     assert data_write.df.shape == (1, 5)
     assert data_write.df["task"][0] == "test task 2"
-    Path(data_write.fp).unlink(missing_ok=False)  # cleanup
 
 
 def test_data_complete(data_write):
-    Path(data_write.fp).unlink(missing_ok=True)
     _ = data_write.append("test task")
     _ = data_write.append("test task 2")
     assert data_write.df.shape[0] == 2
     _ = data_write.complete(0)
     assert data_write.df.shape[0] == 2
     assert data_write.get(0, "completed") == True  # noqa: E712
-    Path(data_write.fp).unlink(missing_ok=False)  # cleanup
+
+
+def test_data_time_work(data_write):
+    first, second = data_write.append("test task"), data_write.append("test task 2")
+
+    async def main():
+        engine = timers.TimerEngine()
+        timer = data_write.time_work(engine, first, "1s")
+        data_write.time_work(engine, second, "1s")
+        asyncio.get_running_loop().call_later(0.2, timer.cancel)
+        await engine.run()
+
+    asyncio.run(main())
+    worked = data_write.get(first, "worked")
+    assert timedelta(seconds=0.15) < worked < timedelta(seconds=0.5)
+    assert data_write.get(second, "worked") == timedelta(seconds=1)
+    sessions = data_write.sessions.read()
+    assert sessions["planned"].to_list() == [timedelta(seconds=1)] * 2
+
+
+def test_data_sessions(data_write):
+    first, second = data_write.append("test task"), data_write.append("test task 2")
+    data_write._add(first, "worked", timedelta(minutes=5))
+    start = datetime(2024, 5, 1, 9)
+    data_write.log_session(first, start, start + timedelta(minutes=20))
+    data_write.log_session(first, start, start + timedelta(minutes=10))
+    # the store itself is not rewritten
+    assert data_write.backend.read()["worked"].sum() == timedelta(minutes=5)
+
+    df = data_write.df
+    assert df.filter(task.col("id") == first)["worked"].item() == timedelta(minutes=35)
+    assert df.filter(task.col("id") == second)["worked"].item() == timedelta(0)
+    assert data_write.df is df
+    assert data_write.todo.filter(task.col("id") == first)["worked"].item() == timedelta(minutes=35)
+
+    # only the new session is read
+    offset = data_write.sessions.state()[1]
+    data_write.log_session(second, start, start + timedelta(hours=1))
+    assert data_write.get(second, "worked") == timedelta(hours=1)
+    assert data_write.sessions.state()[1] > offset
+    assert data_write.df is not df
+
+    # work on a task staged in a transaction would be logged under its provisional id
+    with data_write.transaction():
+        staged = data_write.append("test task 3")
+        with pytest.raises(AssertionError):
+            data_write.log_session(staged, start, start + timedelta(hours=1))
+        with pytest.raises(AssertionError):
+            data_write.start_work(staged)
+    assert data_write.sessions.read()["task_id"].min() >= 0
+
+
+def _crash_during_work(fp, id, start):
+    """Time three sessions on task `id` and exit as if killed during the last two."""
+    data = task.Data(fp=fp)
+    journal, planned = data.heartbeats, timedelta(hours=1)
+    done, logged, running = 1, 2, 3
+    journal.finish(done, id, start, start + timedelta(minutes=5), planned, data.sessions)
+    # killed between logging the session and marking it done
+    end = start + timedelta(minutes=7)
+    journal.beat(logged, id, end, timedelta(minutes=7), planned)
+    data.sessions.append(id, start, end, planned)
+    # killed while the countdown ran
+    for minutes in (0, 10, 20):
+        journal.beat(
+            running, id, start + timedelta(minutes=minutes), timedelta(minutes=minutes), planned
+        )
+
+
+def test_data_recover_sessions(data_write, store):
+    id, start = data_write.append("test task"), datetime(2024, 5, 1, 9)
+    process = multiprocessing.Process(target=_crash_during_work, args=(store, id, start))
+    process.start()
+    process.join()
+    # a session of this process, still running, and a torn write
+    data_write.heartbeats.beat(4, id, start, timedelta(minutes=1), timedelta(hours=1))
+    with open(data_write.heartbeats.path, "ab") as f:
+        f.write(b"\0" * 5)
+
+    recovered = data_write.recover_sessions()
+    assert recovered.rows() == [(id, start, start + timedelta(minutes=20), timedelta(hours=1))]
+    assert data_write.get(id, "worked") == timedelta(minutes=32)
+    # only the running session is left in the journal
+    assert data_write.heartbeats.read()["session"].to_list() == [4]
+    assert data_write.recover_sessions().is_empty()
+    assert data_write.get(id, "worked") == timedelta(minutes=32)
 
 
 def test_data_get(data_write):
-    Path(data_write.fp).unlink(missing_ok=True)
     data_write.append("test task")
     data_write.append("test task 2")
     assert data_write.get(0, "task") == "test task"
     assert data_write.get(1, "task") == "test task 2"
-    Path(data_write.fp).unlink(missing_ok=False)  # cleanup
 
 
 def test_data_set(data_write):
-    Path(data_write.fp).unlink(missing_ok=True)
     data_write.append("test task")
     data_write.append("test task 2")
     data_write._set(0, "task", "new task")
     assert data_write.get(0, "task") == "new task"
-    Path(data_write.fp).unlink(missing_ok=False)  # cleanup
 
 
 # %%
+
+
+def test_data_df_cache(data_write, store):
+    data_write.append("test task")
+    misses = data_write.backend.cache_misses
+    hits = data_write.backend.cache_hits
+    _ = data_write.df
+    _ = data_write.df
+    assert data_write.backend.cache_misses == misses
+    assert data_write.backend.cache_hits == hits + 2
+    # a write from another Data instance changes the file and invalidates the cache
+    task.Data(fp=store).append("test task 2")
+    assert data_write.df.shape == (2, 5)
+    assert data_write.backend.cache_misses == misses + 1
+
+
+def test_data_segments(data_segments, store):
+    data_segments.append("test task")
+    data_segments.append("test task 2")
+    data_segments._set(0, "task", "new task")
+    data_segments.delete(1)
+    # mutations only write segments, the base file is untouched
+    assert not Path(data_segments.fp).exists()
+    assert len(data_segments.backend.segments.paths()) == 4
+    # a fresh reader merges the segments
+    fresh = task.Data(fp=store, segments=True)
+    assert fresh.df.shape == (1, 5)
+    assert fresh.get(0, "task") == "new task"
+    data_segments.compact()
+    assert Path(data_segments.fp).exists()
+    assert data_segments.backend.segments.paths() == []
+    assert fresh.df["task"].to_list() == ["new task"]
+
+
+def test_data_segments_compaction_threshold(data_segments):
+    data_segments.backend.segments.max_segments = 3
+    for i in range(3):
+        data_segments.append(f"test task {i}")
+    assert data_segments.backend.segments.paths() == []
+    assert data_segments.df.shape == (3, 5)
+
+
+def test_data_segments_detected(data_segments, store):
+    for i in range(3):
+        data_segments.append(f"test task {i}")
+    # the segment log on disk is read and written whatever the default says
+    plain = task.Data(fp=store)
+    assert plain.df.shape == (3, 5)
+    assert plain.append("test task 3") == 3
+    assert len(plain.backend.segments.paths()) == 4
+    # a writer without segments folds them into the base file
+    base = task.Data(fp=store, segments=False)
+    base.delete(0)
+    assert base.backend.segments.paths() == []
+    assert sorted(task.Data(fp=store).df["id"]) == [1, 2, 3]
+    assert base.append("test task 4") == 4
+
+
+def _append_tasks(fp, n):
+    data = task.Data(fp=fp)
+    return [data.append(f"task {i}") for i in range(n)]
+
+
+def test_data_concurrent_append(data_write, store):
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        ids = sum(pool.starmap(_append_tasks, [(store, 5)] * 4), [])
+    # no lost updates and no duplicated ids
+    assert sorted(ids) == list(range(20))
+    assert sorted(data_write.df["id"]) == list(range(20))
+
+
+def test_data_group_commit(data_write, store):
+    other = task.Data(fp=store)
+    # a batch queued by another writer is committed along with our own
+    name = other.backend.queue.enqueue([("append", dict(task="queued task", completed=False))])
+    new_id = data_write.append("test task")
+    assert data_write.df.shape == (2, 5)
+    assert new_id == 1
+    assert other.backend.queue.wait(name, other.backend.commit) == [0]
+    assert list(other.backend.queue.dir.glob(f"{name}.*")) == []
+
+
+def test_data_group_commit_failure(data_write, store):
+    data_write.append("test task")
+    # bad ops are refused before they reach the shared queue
+    for ops in ([("set", 0, "nope", 1)], [("set", 0, "created", "x")], [("delete", -1)]):
+        with pytest.raises(ValueError):
+            data_write._submit(ops)
+    # a batch that cannot be applied, queued unchecked, fails on its own
+    other = task.Data(fp=store)
+    other.backend.queue.schema = None
+    name = other.backend.queue.enqueue([("delete", 0), ("set", 0, "nope", 1)])
+    assert data_write.append("test task 2") == 1
+    with pytest.raises(KeyError):
+        other.backend.queue.wait(name, other.backend.commit)
+    assert list(other.backend.queue.dir.iterdir()) == []
+    assert data_write.append("test task 3") == 2
+    assert sorted(task.Data(fp=store).df["id"]) == [0, 1, 2]
+
+
+def test_data_group_commit_crash(data_write, store):
+    data_write.append("test task")
+    other = task.Data(fp=store)
+    name = other.backend.queue.enqueue([("append", dict(task="queued task", completed=False))])
+
+    def crash(batches):
+        data_write.backend.commit(batches)
+        raise SystemExit
+
+    # the writer dies after the store replace, before settling the queue
+    own = data_write.backend.queue.enqueue([("delete", 0)])
+    with pytest.raises(SystemExit):
+        data_write.backend.queue.wait(own, crash)
+    assert data_write.backend.queue.journal.exists()
+    # the next writer takes both batches as committed rather than applying them again
+    assert data_write.append("test task 2") == 2
+    assert task.Data(fp=store).df["task"].sort().to_list() == ["queued task", "test task 2"]
+    with pytest.raises(RuntimeError, match="results are lost"):
+        other.backend.queue.wait(name, other.backend.commit)
+    assert list(other.backend.queue.dir.iterdir()) == []
+
+
+def test_data_add(data_write, store):
+    data_write.append("test task")
+    stale = task.Data(fp=store)
+    _ = stale.df
+    data_write._add(0, "worked", timedelta(minutes=5))
+    stale._add(0, "worked", timedelta(minutes=10))
+    assert data_write.get(0, "worked") == timedelta(minutes=15)
+
+
+def test_data_scan_pushdown(data_write, store):
+    data_write.append("test task")
+    data_write.append("test task 2")
+    data_write.complete(1)
+    fresh = task.Data(fp=store)
+    plan = fresh.scan().filter(task.col("id") == 1).select("task").explain()
+    assert "SELECTION" in plan
+    assert fresh.get(1, "task") == "test task 2"
+    assert fresh.get_row(0)["task"] == "test task"
+    assert fresh.todo["id"].to_list() == [0]
+    assert fresh.done["id"].to_list() == [1]
+    # lookups never loaded the whole store
+    assert fresh.backend.cache_misses == 0
+
+
+def test_data_id_index(data_write, store):
+    for i in range(3):
+        data_write.append(f"test task {i}")
+    data_write.delete(1)
+    key = data_write.backend._base_key()
+    assert data_write.backend.index.position(0, key) == 0
+    assert data_write.backend.index.position(1, key) == -1
+    assert data_write.backend.index.position(2, key) == 1
+    assert data_write.backend.index.position(5, key) == -1
+    fresh = task.Data(fp=store)
+    assert fresh.get(2, "task") == "test task 2"
+    assert len(fresh._lookup(1)) == 0
+    # deleting the newest task does not free its id
+    data_write.delete(2)
+    assert data_write.append("test task 3") == 3
+
+
+def test_data_id_index_stale(data_write, store):
+    data_write.append("test task")
+    data_write.append("test task 2")
+    data_write.backend.index.path.unlink()
+    assert data_write.backend.index.position(1, data_write.backend._base_key()) is None
+    fresh = task.Data(fp=store)
+    assert fresh.get(1, "task") == "test task 2"
+    assert data_write.backend.index.position(1, data_write.backend._base_key()) == 1
+
+
+def test_data_write_unique(data_write):
+    data_write.append("test task")
+    with pytest.raises(AssertionError):
+        data_write.write(task.pl.concat([data_write.df] * 2))
+
+
+def test_data_transaction(data_write, store):
+    data_write.append("test task")
+    with data_write.transaction() as txn:
+        new_id = data_write.append("test task 2")
+        assert new_id == -1
+        # staged changes are visible inside the transaction
+        assert data_write.get(new_id, "task") == "test task 2"
+        data_write._add(new_id, "worked", timedelta(minutes=5))
+        data_write.complete(0)
+        data_write.delete(0)
+        # nothing is written until the transaction ends
+        assert task.Data(fp=store).df.shape == (1, 5)
+    assert txn.ids == {-1: 1}
+    df = task.Data(fp=store).df
+    assert df["id"].to_list() == [1]
+    assert df["worked"][0] == timedelta(minutes=5)
+
+
+def test_data_transaction_rollback(data_write):
+    data_write.append("test task")
+    with pytest.raises(ValueError):
+        with data_write.batch():
+            data_write._set(0, "task", "new task")
+            data_write.append("")
+    assert data_write.get(0, "task") == "test task"
+
+
+def test_data_partitioned_migration(store):
+    task.Data(fp=store).write(created_df((2023, 1), (2024, 5), (2024, 5)))
+    data = task.Data(fp=store, partitioned=True)
+    assert data.fp.is_dir()
+    assert [str(p.relative_to(data.fp)) for p in data.backend.base.files()] == [
+        "year=2023/month=1/data.parquet",
+        "year=2024/month=5/data.parquet",
+    ]
+    # reopening detects the layout
+    fresh = task.Data(fp=store)
+    assert fresh.backend.base.partitioned
+    assert fresh.df.shape == (3, 5)
+    assert fresh.get(2, "task") == "task 2"
+
+
+def test_data_partitioned_write(store):
+    data = task.Data(fp=store, partitioned=True)
+    data.write(created_df((2023, 1), (2024, 5)))
+    old = data.backend.base.files()[0]
+    mtime = old.stat().st_mtime_ns
+    data.append("new task")
+    data._set(1, "task", "renamed")
+    data.delete(1)
+    # only the partitions that changed were rewritten
+    assert old.stat().st_mtime_ns == mtime
+    assert len(data.backend.base.files()) == 2
+    assert sorted(task.Data(fp=store).df["task"]) == ["new task", "task 0"]
+
+
+def test_data_partitioned_since(store):
+    data = task.Data(fp=store, partitioned=True, segments=True)
+    data.write(created_df((2023, 1), (2024, 5), (2024, 6)))
+    data._set(0, "created", datetime(2024, 7, 1))
+    plan = task.Data(fp=store).scan(since=datetime(2024, 6, 1)).explain()
+    assert "year=2023" not in plan
+    fresh = task.Data(fp=store, segments=True)
+    assert fresh.scan(since=datetime(2024, 6, 1)).collect()["id"].sort().to_list() == [0, 2]
+    assert len(fresh.recent("36500d")) == 3
+
+
+def test_data_ipc(store):
+    data = task.Data(fp=store, format="ipc", segments=True)
+    data.write(created_df((2023, 1), (2024, 5)))
+    assert data.backend.base.fp.suffix == ".arrow"
+    assert not data.fp.exists()
+    new_id = data.append("new task")
+    data._set(0, "task", "renamed")
+    data.compact()
+    # reopening detects the format, reads are memory-mapped
+    fresh = task.Data(fp=store)
+    assert fresh.backend.format == "ipc"
+    assert "IPC SCAN" in fresh.scan().explain().upper()
+    assert fresh.get(0, "task") == "renamed"
+    assert fresh.get(new_id, "task") == "new task"
+
+
+def test_data_convert(store):
+    data = task.Data(fp=store, segments=True)
+    data.write(created_df((2023, 1), (2024, 5)))
+    data.delete(1)
+    expected = data.df
+    data.convert("ipc")
+    assert not data.fp.exists() and not data.backend.segments.paths()
+    assert task.Data(fp=store).df.equals(expected)
+    # the id sequence carries over
+    assert data.append("after") > 1
+
+    data.convert("parquet")
+    assert not data.fp.with_suffix(".arrow").exists()
+    fresh = task.Data(fp=store)
+    assert fresh.backend.format == "parquet"
+    assert fresh.df["task"].sort().to_list() == ["after", "task 0"]
+
+    # from ipc straight to a partitioned dataset and back to a single file
+    data.convert("ipc")
+    data.convert("parquet", partitioned=True)
+    assert data.fp.is_dir() and task.Data(fp=store).backend.base.partitioned
+    data.convert("sqlite")
+    assert not store.with_suffix(".parquet").exists()
+    assert task.Data(fp=store).df["task"].sort().to_list() == ["after", "task 0"]
+    # the sidecars of the parquet store went with it
+    assert all(p.name.startswith("tasks_write.sqlite") for p in store.parent.iterdir())
+    data.convert("parquet")
+    assert not any(p.name.startswith("tasks_write.sqlite") for p in store.parent.iterdir())
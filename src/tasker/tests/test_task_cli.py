@@ -0,0 +1,156 @@
+# %%
+
+import pytest
+from click.testing import CliRunner
+
+from tasker import task
+from tasker.commands import task_cli
+
+
+@pytest.fixture
+def data(monkeypatch, tmp_path):
+    data = task.Data(fp=tmp_path / "tasks_write.csv")
+    for i in range(30):
+        data.append(f"task {i}")
+    monkeypatch.setattr(task_cli, "get_data", lambda: data)
+    return data
+
+
+@pytest.fixture
+def cli_runner():
+    return CliRunner()
+
+
+def test_list_limit(cli_runner, data):
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["list", "--limit", "3", "--offset", "2"])
+    assert result.exit_code == 0, result.output
+    # newest first, so the window starts at task 27
+    assert [f"task {i} " in result.output for i in (27, 26, 25, 24)] == [True] * 3 + [False]
+
+
+def test_list_since(cli_runner, data):
+    for since in ("2020-01-01", "30d"):
+        result = cli_runner.invoke(task_cli.TaskCLI().cli, ["list", "--since", since])
+        assert result.exit_code == 0, result.output
+        assert "task 29 " in result.output
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["list", "--since", "2999-01-01"])
+    assert "task 29 " not in result.output
+
+
+def test_list_since_invalid(cli_runner, data):
+    for since in ("yesterday", "30x", ""):
+        result = cli_runner.invoke(task_cli.TaskCLI().cli, ["list", "--since", since])
+        assert result.exit_code == 2
+        assert "neither an ISO date nor a duration" in result.output
+
+
+def test_convert_partitioned(cli_runner, data):
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["convert", "ipc", "--partitioned"])
+    assert "A partitioned store is always parquet" in result.output
+    assert data.backend.format == "parquet"
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["convert", "parquet", "--partitioned"])
+    assert result.exit_code == 0, result.output
+    assert data.backend.base.partitioned
+    assert data.fp.is_dir()
+    assert len(data.df) == 30
+
+
+def test_list_page(cli_runner, data):
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["list", "--page", "2", "--limit", "5"])
+    assert result.exit_code == 0, result.output
+    assert "task 24 " in result.output
+    assert "task 20 " in result.output
+    assert "task 25 " not in result.output
+    assert "task 19 " not in result.output
+
+
+def test_list_window_bounds(cli_runner, data):
+    for args in (["--page", "0"], ["--limit", "-1"], ["--offset", "-5"]):
+        result = cli_runner.invoke(task_cli.TaskCLI().cli, ["list", *args])
+        assert result.exit_code == 2
+        assert "Invalid value" in result.output
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["list", "--limit", "0", "--page", "1"])
+    assert result.exit_code == 0, result.output
+    assert "task 29 " not in result.output
+
+
+def test_list_pager(cli_runner, data):
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["list", "--pager"])
+    assert result.exit_code == 0, result.output
+    # every task is shown, across two pages
+    assert all(f"task {i} " in result.output for i in range(30))
+    assert result.output.count("index") == 2
+
+
+def test_complete_window(cli_runner, data):
+    result = cli_runner.invoke(
+        task_cli.TaskCLI().cli, ["complete", "--limit", "2", "--offset", "10"], input="10\n"
+    )
+    assert result.exit_code == 0, result.output
+    assert "task 19 " in result.output
+    assert "task 29 " not in result.output
+    assert data.get(19, "completed")
+    # only the open tasks are listed, and only a task in the window can be picked
+    result = cli_runner.invoke(
+        task_cli.TaskCLI().cli, ["complete", "--limit", "2", "--offset", "10"], input="5\n"
+    )
+    assert "task 18 " in result.output and "task 19 " not in result.output
+    assert "Error: Task 5 does not exist." in result.output
+    assert not data.get(24, "completed")
+
+
+def test_window():
+    assert task_cli.window(None, 0, None) == (None, 0)
+    assert task_cli.window(None, 0, 3) == (task_cli.PAGE_SIZE, 2 * task_cli.PAGE_SIZE)
+    assert task_cli.window(5, 1, 2) == (5, 6)
+
+
+def test_export_stdout(cli_runner, data):
+    result = cli_runner.invoke(
+        task_cli.TaskCLI().cli, ["export", "--column", "id", "--column", "task", "--todo"]
+    )
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert lines[0] == "id,task"
+    assert sorted(lines[1:]) == sorted(f"{i},task {i}" for i in range(30))
+
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["export", "--format", "ndjson"])
+    assert result.exit_code == 0, result.output
+    assert '"worked":0.0' in result.output.splitlines()[0]
+
+
+def test_export_unknown_format(cli_runner, data, tmp_path):
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["export", str(tmp_path / "tasks.txt")])
+    assert "Error: Cannot export" in result.output
+
+
+def test_stats(cli_runner, data):
+    data.complete(3)
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["stats", "--period", "week"])
+    assert result.exit_code == 0, result.output
+    assert "worked_4w" in result.output
+    # the 30 tasks of today, one of them done
+    assert "┆ 30 " in result.output and "0.033" in result.output
+
+
+def test_search(cli_runner, data):
+    data._set(3, "task", "Write the quarterly report")
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["search", "quarter", "REP"])
+    assert result.exit_code == 0, result.output
+    assert "Write the quarterly report" in result.output and "task 4 " not in result.output
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["search", "task", "--limit", "2"])
+    assert "task 29 " in result.output and "task 28 " in result.output
+    assert "task 27 " not in result.output
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["search", "zebra"])
+    assert "No matching tasks." in result.output
+
+
+def test_todo_new_task_committed(cli_runner, data, monkeypatch):
+    def interrupted(id, duration="60m"):
+        raise RuntimeError("killed during the countdown")
+
+    monkeypatch.setattr(data, "start_work", interrupted)
+    result = cli_runner.invoke(task_cli.TaskCLI().cli, ["todo"], input="\nnew task\n")
+    assert "killed during the countdown" in result.output
+    # the new task was committed before the work started
+    assert data.df.filter(task.col("task") == "new task")["id"].to_list() == [30]
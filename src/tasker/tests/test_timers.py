@@ -0,0 +1,107 @@
+# %%
+import asyncio
+
+import pytest
+
+from tasker import countdown, timers
+
+
+def run(engine):
+    asyncio.run(engine.run())
+
+
+def test_timer_ticks():
+    engine = timers.TimerEngine(interval=0.01)
+    timer = engine.add(3, 0.05)
+    ticks, expired = [], []
+    timer.on_tick(lambda timer, remaining: ticks.append(round(remaining, 2)))
+    timer.on_expire(expired.append)
+    run(engine)
+    assert ticks[0] == 0.05 and ticks[-1] == 0
+    assert ticks == sorted(ticks, reverse=True)
+    assert expired == [timer] and timer.expired and not timer.cancelled
+    assert timer.elapsed == pytest.approx(0.05) and timer.remaining == pytest.approx(0)
+    # done timers leave the engine
+    assert len(engine) == 0
+
+
+def test_timer_no_drift():
+    # a slow tick callback does not push back the later ticks or the deadline
+    engine = timers.TimerEngine(interval=0.02)
+    timer = engine.add(None, 0.2)
+    timer.on_tick(lambda timer, remaining: timers.time.sleep(0.015))
+    run(engine)
+    assert timer.stopped - timer.started == pytest.approx(0.2, abs=0.015)
+
+
+def test_timer_skips_missed_ticks():
+    engine = timers.TimerEngine(interval=0.01)
+    timer = engine.add(None, 0.1)
+    ticks = []
+
+    @timer.on_tick
+    def block(timer, remaining):
+        ticks.append(remaining)
+        if len(ticks) == 1:
+            timers.time.sleep(0.055)
+
+    run(engine)
+    assert len(ticks) < 10 and ticks[-1] == 0
+
+
+def test_engine_concurrent():
+    async def main():
+        engine = timers.TimerEngine(interval=0.01)
+        for id, duration in enumerate([0.05, 0.03, 0.04]):
+            engine.add(id, duration)
+        order = []
+        for timer in engine.timers.values():
+            timer.on_expire(lambda timer: order.append(timer.task_id))
+        start = timers.time.monotonic()
+        await engine.run()
+        return order, timers.time.monotonic() - start
+
+    order, took = asyncio.run(main())
+    assert order == [1, 2, 0]
+    # concurrent, not one after the other
+    assert took < 0.1
+
+    engine = timers.TimerEngine()
+    engine.add(0, 1)
+    with pytest.raises(AssertionError, match="already being timed"):
+        engine.add(0, 1)
+
+
+def test_timer_async_iterator():
+    async def main():
+        engine = timers.TimerEngine(interval=0.01)
+        timer = engine.add(0, 0.03)
+        return [round(remaining, 2) async for remaining in timer.ticks()]
+
+    assert asyncio.run(main()) == [0.03, 0.02, 0.01, 0]
+
+
+def test_timer_cancel():
+    async def main():
+        engine = timers.TimerEngine(interval=0.01)
+        long, short = engine.add(0, 10), engine.add(1, 0.02)
+        short.on_expire(lambda timer: engine.cancel(0))
+        await engine.run()
+        return long, short
+
+    long, short = asyncio.run(main())
+    assert short.expired and long.cancelled and not long.expired
+    assert long.elapsed == pytest.approx(0.02, abs=0.01)
+
+
+def test_countdown(monkeypatch):
+    frames = []
+    monkeypatch.setattr(
+        countdown.Renderer, "draw", lambda self, remaining: frames.append(remaining)
+    )
+    timer = countdown.countdown(0.03, title="a task", task_id=5, interval=0.01)
+    assert timer.task_id == 5 and timer.expired
+    assert len(frames) == 4 and frames[-1] == 0
+
+
+# %%
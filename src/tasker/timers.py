@@ -0,0 +1,189 @@
+# %%
+"""Asyncio timers, many countdowns running concurrently in one event loop.
+
+A `Timer` counts down to a deadline on the monotonic clock and ticks every
+`interval` seconds. Ticks are scheduled against the start time rather than by
+sleeping a fixed interval, so they do not drift, and ticks missed while the loop
+was busy are skipped rather than bunched up. Consumers either register callbacks
+with `Timer.on_tick` and `Timer.on_expire` or iterate over `Timer.ticks`.
+
+`TimerEngine` keeps one timer per task id, see ``countdown.countdown`` for the
+full-screen display built on it.
+"""
+
+import asyncio
+import math
+import time
+
+
+class Timer:
+    """Countdown bound to a task, ticking every `interval` seconds until `duration`.
+
+    Parameters
+    ----------
+    task_id : int or None
+        The task being timed.
+    duration : float
+        Seconds until the timer expires.
+    interval : float
+        Seconds between ticks.
+    clock : callable
+        Monotonic clock returning seconds, replaced in tests.
+    """
+
+    def __init__(self, task_id, duration, interval=1.0, clock=time.monotonic) -> None:
+        assert duration >= 0, "Duration cannot be negative."
+        assert interval > 0, "Interval must be positive."
+        self.task_id = task_id
+        self.duration = duration
+        self.interval = interval
+        self.clock = clock
+        self.started = None
+        self.stopped = None
+        self.expired = False
+        self.cancelled = False
+        self._tick_callbacks = []
+        self._expire_callbacks = []
+        self._task = None
+
+    def __repr__(self):
+        state = "expired" if self.expired else "cancelled" if self.cancelled else "running"
+        return f"Timer(task_id={self.task_id}, duration={self.duration}, {state})"
+
+    @property
+    def deadline(self):
+        """Monotonic time the timer expires at, None before it starts."""
+        return None if self.started is None else self.started + self.duration
+
+    @property
+    def elapsed(self):
+        """Seconds the timer has been running, up to when it expired or was cancelled."""
+        if self.started is None:
+            return 0.0
+        return min((self.stopped or self.clock()) - self.started, self.duration)
+
+    @property
+    def remaining(self):
+        return self.duration - self.elapsed
+
+    @property
+    def done(self):
+        return self.expired or self.cancelled
+
+    def on_tick(self, callback):
+        """Call ``callback(timer, remaining)`` on every tick, including the last at 0."""
+        self._tick_callbacks.append(callback)
+        return callback
+
+    def on_expire(self, callback):
+        """Call ``callback(timer)`` once the timer expires or is cancelled."""
+        self._expire_callbacks.append(callback)
+        return callback
+
+    async def ticks(self):
+        """Iterate over the remaining seconds at each tick, until the timer is done."""
+        queue = asyncio.Queue()
+        self.on_tick(lambda timer, remaining: queue.put_nowait(remaining))
+        self.on_expire(lambda timer: queue.put_nowait(None))
+        while (remaining := await queue.get()) is not None:
+            yield remaining
+
+    def _emit(self, callbacks, *args):
+        for callback in callbacks:
+            callback(self, *args)
+
+    async def run(self):
+        """Tick until the deadline, then call the expiry callbacks."""
+        assert self.started is None, "Timer already started."
+        self.started = self.clock()
+        n_ticks = math.ceil(self.duration / self.interval)
+        try:
+            tick = 0
+            while tick < n_ticks:
+                self._emit(self._tick_callbacks, self.duration - tick * self.interval)
+                next_tick = self.started + (tick + 1) * self.interval
+                await asyncio.sleep(max(0.0, min(next_tick, self.deadline) - self.clock()))
+                # skip the ticks missed while the loop was blocked
+                tick = max(tick + 1, int((self.clock() - self.started) // self.interval))
+            self.expired = True
+            self.stopped = self.clock()
+            self._emit(self._tick_callbacks, 0)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            self.stopped = self.clock()
+            raise
+        finally:
+            self._emit(self._expire_callbacks)
+
+    def start(self):
+        """Schedule the timer on the running event loop, returning its asyncio task."""
+        self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    def cancel(self):
+        """Stop the timer early, the expiry callbacks still run with `cancelled` set."""
+        if self._task is not None:
+            self._task.cancel()
+        elif self.started is None:
+            self.cancelled = True
+            self._emit(self._expire_callbacks)
+
+
+class TimerEngine:
+    """Runs one `Timer` per task id concurrently on an asyncio event loop.
+
+    Timers added before the loop runs start with `run`, timers added from inside
+    the loop start straight away.
+
+    Examples
+    --------
+    >>> engine = TimerEngine()
+    >>> timer = engine.add(1, 0.2, interval=0.1)
+    >>> _ = timer.on_expire(lambda timer: print(f"task {timer.task_id} done"))
+    >>> asyncio.run(engine.run())
+    task 1 done
+    """
+
+    def __init__(self, interval=1.0, clock=time.monotonic) -> None:
+        self.interval = interval
+        self.clock = clock
+        self.timers = {}
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __getitem__(self, task_id):
+        return self.timers[task_id]
+
+    def add(self, task_id, duration, interval=None):
+        """Time the task `task_id` for `duration` seconds, returning its `Timer`."""
+        assert task_id not in self.timers, f"Task {task_id} is already being timed."
+        timer = Timer(task_id, duration, interval or self.interval, self.clock)
+        timer.on_expire(lambda timer: self.timers.pop(timer.task_id, None))
+        self.timers[task_id] = timer
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            timer.start()
+        return timer
+
+    def cancel(self, task_id):
+        self.timers[task_id].cancel()
+
+    async def run(self):
+        """Start the pending timers and wait until every timer is done.
+
+        Cancelling `run`, such as on Ctrl-C in `asyncio.run`, cancels the timers.
+        """
+        try:
+            while self.timers:
+                pending = [timer._task or timer.start() for timer in list(self.timers.values())]
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            for timer in list(self.timers.values()):
+                timer.cancel()
+
+
+# %%
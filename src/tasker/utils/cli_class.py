@@ -1,9 +1,14 @@
 # %%
+import logging
 from abc import abstractmethod
 from functools import wraps
 
 import click
-from loguru import logger
+
+from tasker.utils.profiling import timed
+
+# stdlib logging keeps loguru's import cost off the CLI start up
+logger = logging.getLogger(__name__)
 
 
 def error_catch(func):
@@ -76,6 +81,7 @@ class MetaCLI(type):
     def __new__(cls, name, bases, dct):
         # have to initialise it in __new__ to avoid sharing between instances of the class
         commands = []
+        clean_name = dct.get("clean_name")
 
         for key, value in dct.items():
             # Loop through the methods in the class and add them as commands
@@ -92,6 +98,10 @@ class MetaCLI(type):
                 if not dct.get("debug"):
                     value = error_catch(value)
 
+                # every command is a phase of tasker --profile
+                phase = clean_name(key) if isinstance(clean_name, staticmethod) else key
+                value = timed(phase)(value)
+
                 # check if the function has params to add
                 if params:
                     # Wrap the function with the parameter wrappers.
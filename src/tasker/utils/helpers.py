@@ -3,6 +3,7 @@ import re
 from datetime import timedelta
 
 import polars as pl
+from polars import lit
 
 
 def pl_print(df):
@@ -66,6 +67,9 @@ def parse_timedelta_string(time_str):
     units_order = ["d", "h", "m", "s"]
     last_seen_index = -1
 
+    if not re.fullmatch(f"({pattern})+", time_str):
+        raise ValueError(f"Invalid duration {time_str!r}, expected e.g. 2d5h10m.")
+
     # Find all matches in the input string
     matches = re.finditer(pattern, time_str)
 
@@ -93,26 +97,33 @@ def timedelta_to_string(td):
     """
     Convert a `timedelta` object to a string in H:M:S format.
 
+    Also accepts a polars duration expression, returning a native string
+    expression that formats the whole column in the same way, for use on
+    eager and lazy frames alike.
+
     Parameters
     ----------
-    td : timedelta
-        The `timedelta` object to be converted.
+    td : timedelta or pl.Expr
+        The `timedelta` object or duration expression to be converted.
 
     Returns
     -------
-    str
+    str or pl.Expr
         A string representing the duration in H:M:S format.
 
     Examples
     --------
     >>> td = timedelta(hours=5, minutes=30, seconds=15)
-    >>> timedelta_to_hms_string(td)
+    >>> timedelta_to_string(td)
     '5:30:15'
 
     >>> td = timedelta(days=1, hours=2, minutes=3, seconds=4)
-    >>> timedelta_to_hms_string(td)
-    '26:03:04'
+    >>> timedelta_to_string(td)
+    '1d 26:03:04'
     """
+    if isinstance(td, pl.Expr):
+        return _timedelta_to_string_expr(td)
+
     if td is None:
         return None
 
@@ -126,4 +137,31 @@ def timedelta_to_string(td):
     return f"{days_str}{hours}:{minutes:02}:{seconds:02}"
 
 
+def _timedelta_to_string_expr(td):
+    """Vectorised `timedelta_to_string` built from integer arithmetic on the column."""
+    # truncate towards zero like int(td.total_seconds())
+    total_seconds = td.dt.total_microseconds()
+    total_seconds = (
+        pl.when(total_seconds < 0)
+        .then(-(-total_seconds // 1_000_000))
+        .otherwise(total_seconds // 1_000_000)
+    )
+
+    days = total_seconds // 86400
+    hours = total_seconds // 3600
+    remainder = total_seconds % 3600
+    minutes = remainder // 60
+    seconds = remainder % 60
+
+    days_str = pl.when(days != 0).then(days.cast(pl.String) + lit("d ")).otherwise(lit(""))
+    return pl.concat_str(
+        days_str,
+        hours.cast(pl.String),
+        lit(":"),
+        minutes.cast(pl.String).str.zfill(2),
+        lit(":"),
+        seconds.cast(pl.String).str.zfill(2),
+    )
+
+
 # %%
@@ -0,0 +1,134 @@
+# %%
+"""Named timing spans around the phases of a tasker command.
+
+`span` times a block, and `timed` a function, under a name such as "read" or
+"pl_print". Spans nest, so the time of a phase is broken down by the phases
+inside it. They only record while a `Profiler` runs, ``tasker --profile``,
+otherwise a span costs one check of a global. Only the standard library is
+imported here, to keep it off the CLI start up.
+"""
+
+import cProfile
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# calls and seconds of each path of span names, while a profiler runs
+_spans = None
+_stack = []
+
+
+def enabled():
+    return _spans is not None
+
+
+def record(name, seconds):
+    """Add a phase timed elsewhere, as a span inside the current one."""
+    if _spans is not None:
+        calls = _spans.setdefault((*_stack, name), [0, 0.0])
+        calls[0] += 1
+        calls[1] += seconds
+
+
+@contextmanager
+def span(name):
+    """Time the block as the phase `name`, inside any span already open."""
+    if _spans is None:
+        yield
+        return
+    _stack.append(name)
+    # added on entry, so a phase is listed before the phases inside it
+    path = tuple(_stack)
+    _spans.setdefault(path, [0, 0.0])
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stack.pop()
+        calls = _spans[path]
+        calls[0] += 1
+        calls[1] += time.perf_counter() - start
+
+
+def timed(name=None):
+    """Decorate a function to time each call as a span, named after it by default."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__qualname__):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def report(spans, total=None):
+    """A table of the spans, indented by nesting, with their share of `total` seconds."""
+    width = max((2 * (len(path) - 1) + len(path[-1]) for path in spans), default=5)
+    lines = [f"{'phase':<{width}}  {'calls':>6}  {'ms':>10}  {'%':>6}"]
+    for path, (calls, seconds) in spans.items():
+        name = "  " * (len(path) - 1) + path[-1]
+        share = f"{100 * seconds / total:6.1f}" if total else ""
+        lines.append(f"{name:<{width}}  {calls:>6}  {1000 * seconds:>10.2f}  {share:>6}")
+    if total:
+        lines.append(f"{'total':<{width}}  {'':>6}  {1000 * total:>10.2f}")
+    return "\n".join(lines)
+
+
+class Profiler:
+    """Record spans, and a cProfile when `output` is given, from `start` to `stop`.
+
+    Parameters
+    ----------
+    output : str or Path, optional
+        Write the cProfile stats here, to read with `pstats` or snakeviz.
+    since : float, optional
+        `time.perf_counter` value the process started at, the time before
+        `start` is reported as "startup".
+    stream : file object, optional
+        Where `stop` prints the report, stderr by default.
+    """
+
+    def __init__(self, output=None, since=None, stream=None) -> None:
+        self.output = output
+        self.since = since
+        self.stream = stream
+        self.profile = None
+        self.spans = {}
+        self.started = None
+
+    def start(self):
+        global _spans
+        self.started = time.perf_counter()
+        _spans, _stack[:] = self.spans, []
+        if self.since is not None:
+            record("startup", self.started - self.since)
+        if self.output is not None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def stop(self):
+        """Stop recording, print the report and write the cProfile stats."""
+        global _spans
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.output)
+        _spans = None
+        end = time.perf_counter()
+        total = end - (self.since if self.since is not None else self.started)
+        print(report(self.spans, total), file=self.stream or sys.stderr)
+        if self.output is not None:
+            print(f"cProfile stats written to {self.output}", file=self.stream or sys.stderr)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# %%